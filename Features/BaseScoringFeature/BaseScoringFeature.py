@@ -8,6 +8,7 @@ import json
 import re
 import time
 from Utils.DataAccess import DataAccess
+from Utils.DueQueue import DueQueue
 import os
 import traceback
 
@@ -29,8 +30,15 @@ class BaseScoringFeature(Feature):
     # The duration, in seconds, for which to track each post
     TRACK_DURATION_SECONDS = 24 * 60 * 60 # 24 hours (in seconds)
 
-    # How often to check the Tracking database for expired submisisons
-    CHECK_EXPIRED_INTERVAL = 2 * 60 # Every 2 minutes 
+    # How often to check the expiry queue for expired submisisons
+    CHECK_EXPIRED_INTERVAL = 10 # Every 10 seconds
+
+    # How long to wait before checking an expired item again, if the Tracker hasn't made its final update yet
+    SETTLEMENT_RETRY_INTERVAL = 60
+
+    # How often to rebuild the expiry queue from a scan of the Tracking database. This picks up any
+    # items that were added to the database by something other than this feature.
+    RECONCILE_EXPIRY_INTERVAL = 60 * 60 # Every hour
 
     # The amount of the distributor's score that goes to the creator
     CREATOR_COMMISSION = 0.20
@@ -39,6 +47,11 @@ class BaseScoringFeature(Feature):
         super(BaseScoringFeature, self).__init__(bot) # Call super constructor
 
         self.last_expire_check = 0 # The last time that we checked for expired submissions
+        self.last_expiry_reconcile = 0 # The last time that the expiry queue was rebuilt from the database
+
+        # The submission IDs of the tracked items, ordered by the time that they're next due for settlement.
+        # Seeded from the Tracking database, and kept current as this feature adds new items.
+        self.expiry_queue = DueQueue()
 
     def process_submission(self, submission):
 
@@ -80,7 +93,8 @@ class BaseScoringFeature(Feature):
             'title' : submission.title
             }
         try:
-            self.bot.data_access.put_item(DataAccess.Tables.TRACKING, item)
+            if self.bot.data_access.put_item(DataAccess.Tables.TRACKING, item):
+                self.expiry_queue.schedule(item['submission_id'], item['expire_time'])
         except Exception as e:
             print("!!!! Could not add submission for tracking! " + str(submission.id))
             print(e)
@@ -88,20 +102,11 @@ class BaseScoringFeature(Feature):
         print("Processed new submission: " + str(submission.title))
                 
         
-    def process_comment(self, comment):        
-
-        # Ignore any comment that isn't a direct reply to the top-level InsiderMemeBot comment
-        # for a submission
-        if not self.is_direct_reply(comment):
-            return
-
-        # Determine if the comment is an action
-        if comment.body.strip() == "!new":
-            self.process_new(comment)
-        elif comment.body.strip() == "!score":
-            self.process_score(comment)
-        elif comment.body.strip().startswith("!example"):
-            self.process_example(comment)
+    def register_commands(self, router):
+        # The actions are only valid as direct replies to the top-level InsiderMemeBot comment for a submission
+        router.register(self, "!new", lambda comment, context: self.process_new(comment), exact=True, reply_to_bot=True)
+        router.register(self, "!score", lambda comment, context: self.process_score(comment), exact=True, reply_to_bot=True)
+        router.register(self, "!example", lambda comment, context: self.process_example(comment), reply_to_bot=True)
                 
     ############# Process actions #############
     
@@ -130,14 +135,12 @@ class BaseScoringFeature(Feature):
             ##############################################        
             ### Get the score stored in the User table ###
             ##############################################
-            key_condition_expr = Key('user_id').eq(author_id)
-            response = self.bot.data_access.query(DataAccess.Tables.USERS, key_condition_expr)
+            user = self.bot.data_access.get_user(author_id)
             # If there isn't a user, then reply as such and return.
-            if len(response['Items']) == 0:
+            if user is None:
                 self.bot.reply(comment, "You don't have an account yet!\n\n" + \
                     "Reply with '!new' to create one.")
                 return
-            user = response['Items'][0]
             submission_score_from_users = user['submission_score']
             distribution_score_from_users = user['distribution_score']
 
@@ -150,13 +153,12 @@ class BaseScoringFeature(Feature):
             # Global score multiplier
             score_multiplier = self.bot.data_access.get_variable("basescoring_multiplier")
 
-            response = self.bot.data_access.scan(DataAccess.Tables.TRACKING)
-            for item in response['Items']:
-                if item['author_id'] == author_id:
-                    if item['is_example']:
-                        distribution_score_from_tracking = distribution_score_from_tracking + int(item['score'] * score_multiplier)
-                    else:
-                        submission_score_from_tracking = submission_score_from_tracking + int(item['score'] * score_multiplier)
+            tracked_items = self.bot.data_access.get_tracked_items_by_author(author_id)
+            for item in tracked_items:
+                if item['is_example']:
+                    distribution_score_from_tracking = distribution_score_from_tracking + int(item['score'] * score_multiplier)
+                else:
+                    submission_score_from_tracking = submission_score_from_tracking + int(item['score'] * score_multiplier)
 
             ############################
             ###  Report Total scores ###
@@ -170,9 +172,17 @@ class BaseScoringFeature(Feature):
                      "&nbsp;" * 4 + "Your distribution score is **" + str(total_distribution_score) + "**  \n  " + \
                      "&nbsp;" * 4 + "**Total Score:      " + str(total_submission_score + total_distribution_score) + "**"
 
-            if 'ranking' in user:
-                # There is ranking data from the latest posted Scoreboard, so report that as well
+            # Get the ranking data from the latest posted Scoreboard. Users that were ranked before
+            # the Rankings table existed may still have their ranking stored in the Users table.
+            ranking_data = None
+            response = self.bot.data_access.get_item(DataAccess.Tables.RANKINGS, {'user_id' : author_id})
+            if response is not None and 'Item' in response:
+                ranking_data = response['Item']['ranking']
+            elif 'ranking' in user:
                 ranking_data = user['ranking']
+
+            if ranking_data is not None:
+                # There is ranking data from the latest posted Scoreboard, so report that as well
                 response = self.bot.data_access.describe_table(DataAccess.Tables.USERS)
                 num_users = int(response['Table']['ItemCount'])
                 ranking_str = "**Ranking**\n\n" + \
@@ -245,7 +255,9 @@ class BaseScoringFeature(Feature):
                'title' : example_submission.title
             }
             success = self.bot.data_access.put_item(DataAccess.Tables.TRACKING, item)
-            if not success:
+            if success:
+                self.expiry_queue.schedule(item['submission_id'], item['expire_time'])
+            else:
                 print("!!!!! Unable to add example to tracking database: " + example_submission.id)
 
             self.comment_on_example(template_submission, example_submission)
@@ -350,7 +362,8 @@ class BaseScoringFeature(Feature):
         """
         Returns true if this comment is a direct reply to InsiderMemeBot
         """
-        return comment.parent().author != None and comment.parent().author.id == self.bot.reddit.user.me().id
+        parent_author = comment.parent().author
+        return parent_author != None and parent_author.id == self.bot.my_id
 
     def comment_on_example(self, original, example):
         """
@@ -375,16 +388,76 @@ class BaseScoringFeature(Feature):
             # Not time to check yet, so just return
             return
 
-        # Check the database for expired posts
-        expired_items = []
-        tracked_items = self.bot.data_access.scan(DataAccess.Tables.TRACKING)['Items']
+        if cur_time - self.last_expiry_reconcile >= BaseScoringFeature.RECONCILE_EXPIRY_INTERVAL:
+            if self.reconcile_expiry_queue():
+                self.last_expiry_reconcile = cur_time
 
-        for item in tracked_items:
-            if item['expire_time'] <= item['last_update']:
-                self.untrack_item(item)
+        # Only the items that have expired are read from the database
+        for submission_id in self.expiry_queue.pop_due(cur_time):
+            try:
+                self.settle_item(submission_id, cur_time)
+            except Exception as e:
+                print("!!!!! Unable to settle item: " + str(submission_id))
+                print("Error: " + str(e))
+                traceback.print_exc()
+                self.expiry_queue.schedule(submission_id, cur_time + BaseScoringFeature.SETTLEMENT_RETRY_INTERVAL)
 
         self.last_expire_check = cur_time
 
+    def reconcile_expiry_queue(self):
+        """
+        Adds any items in the Tracking database that are missing from the expiry queue.
+        Returns whether the whole table was read. If not, the queue keeps the items it already had.
+        """
+        num_added = 0
+        try:
+            for item in self.bot.data_access.scan_items(DataAccess.Tables.TRACKING, attributes=['submission_id', 'expire_time']):
+                if 'expire_time' in item and not item['submission_id'] in self.expiry_queue:
+                    self.expiry_queue.schedule(item['submission_id'], item['expire_time'])
+                    num_added = num_added + 1
+        except Exception as e:
+            print("Expiry queue: Unable to reconcile with the Tracking table. Error: " + str(e))
+            return False
+
+        print("Expiry queue: Added " + str(num_added) + " items. (" + str(len(self.expiry_queue)) + " items tracked)")
+        return True
+
+    def settle_item(self, submission_id, cur_time):
+        """
+        Settles an item whose expire time has passed, if the Tracker has made its final update of the score.
+        Otherwise, the item is checked again later.
+        """
+        response = self.bot.data_access.get_item(DataAccess.Tables.TRACKING,
+            {'submission_id' : submission_id}, consistent_read=True)
+        if response is None:
+            # The read failed, so try again later
+            self.expiry_queue.schedule(submission_id, cur_time + BaseScoringFeature.SETTLEMENT_RETRY_INTERVAL)
+            return
+        if not 'Item' in response or not 'expire_time' in response['Item']:
+            return # The item is no longer being tracked
+
+        item = response['Item']
+        if item['expire_time'] <= item['last_update']:
+            self.untrack_item(item)
+        else:
+            # The Tracker hasn't updated the score since the item expired
+            self.expiry_queue.schedule(submission_id, cur_time + BaseScoringFeature.SETTLEMENT_RETRY_INTERVAL)
+
+    def credit_user(self, user_id, submission_delta=0, distribution_delta=0):
+        """
+        Adds the settled score of an item to a user. A user without an account, such as one that
+        has been deleted, isn't credited.
+        """
+        if self.bot.data_access.update_user_score(user_id, submission_delta, distribution_delta) is not None:
+            return
+
+        if self.bot.data_access.get_user(user_id) is None:
+            print("No account for user: " + str(user_id) + ". Score not credited: " + \
+                str(submission_delta + distribution_delta))
+        else:
+            print("!!!!! Unable to credit score to user: " + str(user_id) + ". Submission: " + \
+                str(submission_delta) + ", Distribution: " + str(distribution_delta))
+
     def untrack_item(self, item):
         """
         Untracks an expired submission or example.
@@ -399,7 +472,6 @@ class BaseScoringFeature(Feature):
         ### Update Users database with the score ###
         ############################################
 
-        user_key = item['author_id']
         score_multiplier = self.bot.data_access.get_variable("basescoring_multiplier")
         
         creator_commission = int(int(round(item['score'] * score_multiplier) * self.CREATOR_COMMISSION)) # The commision of the score that would go to the creator. Only used when item['is_example'] is True
@@ -407,30 +479,19 @@ class BaseScoringFeature(Feature):
         if item['is_example']:
             # For examples, the commission for the template creator needs to be deducted from the score
 
-            field_name = 'distribution_score'
             score = int(item['score'] * score_multiplier) - creator_commission
         else:
-            field_name = 'submission_score'
             score = int(item['score'] * score_multiplier)
 
-        # Update the score for the user who submitted the submission/example
-        user_key = {'user_id' : item['author_id']}
-        user_update_expr = "set {} = {} + :score".format(field_name, field_name)
-        user_expr_attrs = {":score" : decimal.Decimal(score)}
-        self.bot.data_access.update_item(
-            DataAccess.Tables.USERS, user_key, user_update_expr, user_expr_attrs)
-
-        self.update_total_score(item['author_id'])
-
+        # Update the score for the user who submitted the submission/example.
+        # The scores are added atomically, so settlement can't overwrite a concurrent change to the user.
         if item['is_example']:
-            # Update score for the template creator as well
-            creator_key = {'user_id' : item['template_author_id']}
-            creator_update_expr = "set submission_score = submission_score + :score"
-            creator_expr_attrs = {":score" : decimal.Decimal(creator_commission)}
-            self.bot.data_access.update_item(
-                DataAccess.Tables.USERS, creator_key, creator_update_expr, creator_expr_attrs)
+            self.credit_user(item['author_id'], distribution_delta=score)
 
-            self.update_total_score(item['template_author_id'])
+            # Update score for the template creator as well
+            self.credit_user(item['template_author_id'], submission_delta=creator_commission)
+        else:
+            self.credit_user(item['author_id'], submission_delta=score)
 
         ##########################
         ### Trigger Callback   ###
@@ -478,20 +539,3 @@ class BaseScoringFeature(Feature):
             print("!!!!Unable to edit bot comment!")
             print("    Comment ID: " + bot_comment.id)
             print("    Error: " + str(e))
-
-    def update_total_score(self, user_id):
-        """
-        Helper function for untrack_item. Updates the "total_score" column in the database for the given user
-        """
-
-        user_item = self.bot.data_access.query(DataAccess.Tables.USERS, 
-            key_condition_expr = Key('user_id').eq(user_id))['Items'][0]
-
-        total_score = int(user_item['distribution_score']) + int(user_item['submission_score'])
-
-
-        user_key = {'user_id' : user_id}
-        user_update_expr = "set total_score = :total"
-        user_expr_attrs = {":total" : decimal.Decimal(total_score)}
-        self.bot.data_access.update_item(
-            DataAccess.Tables.USERS, user_key, user_update_expr, user_expr_attrs)
\ No newline at end of file
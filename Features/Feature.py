@@ -19,9 +19,17 @@ class Feature:
         """
         pass
 
+    def register_commands(self, router):
+        """
+        Registers the commands that the feature handles with the bot's CommandRouter.
+        Comments are only routed to the feature if they match one of its commands.
+        """
+        pass
+
     def process_comment(self, comment):
         """
-        Processes a new comment
+        Processes a new comment. Only called for features that override it and haven't registered any commands,
+        in which case the feature is given every new comment.
         """
         pass
 
@@ -3,7 +3,6 @@ import decimal
 import praw
 import boto3
 from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key
 import time
 from Utils.DataAccess import DataAccess
 import math
@@ -21,61 +20,70 @@ class GiftFeature(Feature):
     # Constants
     GIFT_MAX = 100 # The maximum amount that can be sent in a gift
     GIFT_RESET_TIME = 24 * 60 * 60 # How long, in seconds, before a gift can be sent to a user again.
+    MAX_TRANSFER_ATTEMPTS = 2 # How many times to attempt a transfer, if the users change while it's being made
 
     def __init__(self, bot):
         super(GiftFeature, self).__init__(bot)
 
 
-    def process_comment(self, comment):
-        # Determine if the comment is the action
-        if comment.body.strip().startswith("!gift"):
-            gift_amount, validation_message = self.__validate_comment(comment)
+    def register_commands(self, router):
+        router.register(self, "!gift", self.process_gift_command)
 
-            if validation_message != "":
-                # Validation failed.
-                self.bot.reply(comment, validation_message)
-            else:
-                # Now that we've validated the comment and know the gift amount, we can continue with processing
-                self.__process_gift(comment, gift_amount)
+    def process_gift_command(self, comment, context):
+        """
+        Processes a !gift command
+        comment: The praw Comment with the command
+        context: The CommandContext of the comment
+        """
+        gift_amount, validation_message = self.__validate_comment(comment, context)
+
+        if validation_message != "":
+            # Validation failed.
+            self.bot.reply(comment, validation_message)
+        else:
+            # Now that we've validated the comment and know the gift amount, we can continue with processing
+            self.__process_gift(comment, context.parent_author.id, gift_amount)
 
 
-    def __validate_comment(self, comment):
+    def __validate_comment(self, comment, context):
         """
         Validates the !gift command. Returns the amount to gift, and the validation message, if any.
         Successful validation can be determined if the validation message is an empty string.
 
         comment: The praw Comment with the gift command to validate
+        context: The CommandContext of the comment
         """
+        recipient = context.parent_author
 
         # 1. Make sure the user has an account
-        if not self.bot.is_user(comment.author):
+        if not self.bot.data_access.is_user(comment.author):
             print("GiftFeature: No account for user: " + str(comment.author.name) + ". Comment ID: " + comment.id)
             return (0, "You can't give points because you don't have an account yet!\n\nReply with '!new' to create one.")
 
         # 2. Make sure that the command wasn't a reply to a deleted post or comment
-        if comment.parent().author == None:
+        if recipient == None:
             print("GiftFeature: Cannot gift points to deleted post. Comment ID: " + comment.id)
             return(0, "The author has deleted their post, so it cannot be gifted points.")
 
         # 3. Make sure that the gift recipient isn't the same user
-        if comment.parent().author.id == comment.author.id:
+        if recipient.id == comment.author.id:
             print("GiftFeature: Unable to gift points to same user. Comment ID: " + comment.id)
             return(0, "You can't send a gift to yourself!")
 
         # 4. Make sure that the recipient has an account
-        if not self.bot.is_user(comment.parent().author):
+        if not self.bot.data_access.is_user(recipient):
             print("GiftFeature: Unable to gift points to user without account. Comment ID: " + comment.id)
             return(0, "I couldn't send your gift, because the author doesn't have an account yet!")
 
         # 5. Make sure that the gift isn't to the bot. Gifting to bot is permitted in test mode
         if not self.bot.test_mode:
-            if comment.parent().author.id == self.bot.reddit.user.me().id:
+            if recipient.id == self.bot.my_id:
                 print("GiftFeature: Unable to gift points to bot account. Comment ID: " + comment.id)
                 return(0, "Thanks for the thought, but I'm a bot and can't accept gifts!")
 
         # 6. Make sure that the gift amount can be parsed from the command
         gift_regex = "!gift\s+(\d+)\s*"
-        match = re.match(gift_regex, comment.body)
+        match = re.match(gift_regex, context.body, re.IGNORECASE)
         if match == None:
             print("GiftFeature: Invalid command: " + comment.body + "   Comment ID: " + comment.id)
             return(0, "Unable to process your gift command! The correct syntax is '!gift <amount>'\n\n" + \
@@ -90,26 +98,61 @@ class GiftFeature(Feature):
 
         return(gift_amount, "")
 
-    def __process_gift(self, comment, gift_amount):
+    def __process_gift(self, comment, recipient_id, gift_amount):
         """
         Processes the gift. This should only be called with a comment that has already passed 
         __validate_comment().
 
         """
-        sender = self.bot.data_access.query(DataAccess.Tables.USERS, Key('user_id').eq(comment.author.id))['Items'][0]
-        recipient = self.bot.data_access.query(DataAccess.Tables.USERS, Key('user_id').eq(comment.parent().author.id))['Items'][0]
+        sender_id = comment.author.id
+
+        # Bring the gift amount down to the maximum if it's too high
+        amount_to_send = min(gift_amount, GiftFeature.GIFT_MAX)
+
+        new_balance = None
+        for attempt in range(0, GiftFeature.MAX_TRANSFER_ATTEMPTS):
+            # The users are usually still cached from validation. After a failed attempt, they've been
+            # removed from the cache, so they're read again from the database.
+            sender = self.bot.data_access.get_user(sender_id)
+            recipient = self.bot.data_access.get_user(recipient_id)
+
+            # If a user has never sent or received a gift, then new gift data will need to be created
+            if not 'gifts' in sender:
+                sender['gifts'] = self.__initialize_gift_data(sender['user_id'])
+            if not 'gifts' in recipient:
+                recipient['gifts'] = self.__initialize_gift_data(recipient['user_id'])
+
+            rejection_message = self.__check_gift_allowed(sender, recipient, amount_to_send)
+            if rejection_message != "":
+                self.bot.reply(comment, rejection_message)
+                return
+
+            # Transfer the points
+            new_balance = self.__transfer_points(sender, recipient, amount_to_send)
+            if new_balance is not None:
+                break
+            print("GiftFeature: Users changed during the transfer, retrying. Comment ID: " + comment.id)
+
+        if new_balance is None:
+            self.bot.reply(comment, "Something went wrong, please try again!")
+            return
 
-        # If a user has never sent or received a gift, then new gift data will need to be created
-        if not 'gifts' in sender:
-            self.__initialize_gift_data(sender['user_id'])
-            # Update with the fresh data
-            sender = self.bot.data_access.query(DataAccess.Tables.USERS, Key('user_id').eq(sender['user_id']))['Items'][0]
+        # Reply with a comment
+        if amount_to_send == gift_amount:
+            point_str = "point" if amount_to_send == 1 else "points"
+            self.bot.reply(comment, "Your gift of **" + str(amount_to_send) + "** " + point_str + " was sent to " + recipient['username'] + "!  \n  " + \
+                "Your giftable point balance is now **" + str(new_balance) + "** points.  \n  ")
+        else:
+            self.bot.reply(comment, "Your gift amount was too high, so I sent the maximum gift of **" + \
+                str(GiftFeature.GIFT_MAX) + "** points instead!\n\n" + \
+                "Your giftable point balance is now **" + str(new_balance) + "** points.")
 
-        if not 'gifts' in recipient:
-            self.__initialize_gift_data(recipient['user_id'])
-            # Update with the fresh data
-            recipient = self.bot.data_access.query(DataAccess.Tables.USERS, Key('user_id').eq(recipient['user_id']))['Items'][0]
+    def __check_gift_allowed(self, sender, recipient, amount):
+        """
+        Helper function for __process_gift. Checks that the sender can send the gift to the recipient.
 
+        Returns the message to reply with if the gift isn't allowed, or an empty string if it is.
+        """
         # If the sender has already given a gift to the recipient in the last 24 hours, then they can't send another
         sent_gift_dict = sender['gifts']['sent']
         if recipient['user_id'] in sent_gift_dict:
@@ -117,43 +160,30 @@ class GiftFeature(Feature):
             time_since_gift = int(time.time()) - last_gift_time
             if time_since_gift < GiftFeature.GIFT_RESET_TIME:
                 # Compute how much time the sender needs to wait until they can send another gift to the user
-                remaining_time = seconds = GiftFeature.GIFT_RESET_TIME - time_since_gift
+                remaining_time = GiftFeature.GIFT_RESET_TIME - time_since_gift
                 m, s = divmod(remaining_time, 60)
                 h, m = divmod(m, 60)
-                self.bot.reply(comment, "You have already sent a gift to " + recipient['username'] + " today!" + \
-                    " You may send another gift in **" + str(h) + "** hours and **" + str(m) + "** minutes.")
-                return
+                return "You have already sent a gift to " + recipient['username'] + " today!" + \
+                    " You may send another gift in **" + str(h) + "** hours and **" + str(m) + "** minutes."
 
-        # Bring the gift amount down to the maximum if it's too high
-        amount_to_send = min(gift_amount, GiftFeature.GIFT_MAX)
-        
         # Check to make sure the sender has enough points
-        if amount_to_send > sender['total_score']:
-            self.bot.reply(comment, "You don't have enough points to give that much!  \n  " + \
+        if amount > sender['total_score']:
+            return "You don't have enough points to give that much!  \n  " + \
                 "You have **" + str(sender['total_score']) + "** points that you can give.  \n  " + \
                 "*You can only give points from posts that have finished scoring, so this number may be " + \
-                "smaller than your reported score if you have recently submitted a template or example*")
-            return
+                "smaller than your reported score if you have recently submitted a template or example*"
 
-        # Transfer the points
-        self.__transfer_points(sender, recipient, amount_to_send)
-
-        # Update with the fresh data
-        sender = self.bot.data_access.query(DataAccess.Tables.USERS, Key('user_id').eq(comment.author.id))['Items'][0]
-
-        # Reply with a comment
-        if amount_to_send == gift_amount:
-            point_str = "point" if amount_to_send == 1 else "points"
-            self.bot.reply(comment, "Your gift of **" + str(amount_to_send) + "** " + point_str + " was sent to " + recipient['username'] + "!  \n  " + \
-                "Your giftable point balance is now **" + str(sender['total_score']) + "** points.  \n  ")
-        else:
-            self.bot.reply(comment, "Your gift amount was too high, so I sent the maximum gift of **" + \
-                str(GiftFeature.GIFT_MAX) + "** points instead!\n\n" + \
-                "Your giftable point balance is now **" + str(sender['total_score']) + "** points.")
+        return ""
 
     def __transfer_points(self, sender, recipient, amount):
         """
         Helper function for __process_gift. Makes the transfer of points from one user to another
+
+        The transfer is made in a single transaction. Its conditions make sure that the sender's scores haven't
+        changed since they were read, and that no other gift to the recipient was sent within the reset time,
+        so concurrent gifts can never overdraw the sender's balance.
+
+        Returns the sender's new total score, or None if the transaction didn't go through
         """
        
         ####################################################################
@@ -171,7 +201,7 @@ class GiftFeature(Feature):
         elif sender['distribution_score'] < split_amt:
             # If the distribution score is below the threshold, then use all of them
             distribution_amt = int(sender['distribution_score'])
-            submission_amt   = amount - dsitribution_amt
+            submission_amt   = amount - distribution_amt
         else:
             # Shouldn't get here, since we've already checked for a sufficient balance
             raise RuntimeError("Not enough points to send gift!")
@@ -179,60 +209,65 @@ class GiftFeature(Feature):
         #############################################
         ### Transfer the amounts to the recipient ###
         #############################################
-
-        ### Updated sender dictionary ###
-        updated_sender_dict = sender['gifts']
-        sent_item_dict = updated_sender_dict['sent']
-        sent_item_dict[recipient['user_id']] = {
-            "amount" : decimal.Decimal(amount),
-            "send_time" : decimal.Decimal(int(time.time()))
-        }
-        updated_sender_dict['sent'] = sent_item_dict
+        cur_time = int(time.time())
+        gift_time = decimal.Decimal(cur_time)
 
         ### Deduct from sender ###
-        sender_key = {'user_id' : sender['user_id']}
-        sender_update_expr = "set distribution_score = :dist, submission_score = :sub, total_score = :tot, gifts=:gift_dict"
-        sender_expr_attrs = {
-            ":dist" : decimal.Decimal(int(sender['distribution_score']) - distribution_amt),
-            ":sub"  : decimal.Decimal(int(sender['submission_score']) - submission_amt),
-            ":tot"  : decimal.Decimal(int(sender['total_score']) - amount),
-            ":gift_dict" : updated_sender_dict
+        sender_update = {
+            'table_id' : DataAccess.Tables.USERS,
+            'key' : {'user_id' : sender['user_id']},
+            'update_expr' : "ADD submission_score :sub, distribution_score :dist, total_score :tot " + \
+                "SET gifts.sent.#recipient = :gift",
+            'condition_expr' : "total_score = :expected_tot AND " + \
+                "(attribute_not_exists(gifts.sent.#recipient) OR gifts.sent.#recipient.send_time <= :reset_time)",
+            'expr_attr_names' : {"#recipient" : recipient['user_id']},
+            'expr_attr_vals' : {
+                ":sub" : decimal.Decimal(-submission_amt),
+                ":dist" : decimal.Decimal(-distribution_amt),
+                ":tot" : decimal.Decimal(-amount),
+                ":expected_tot" : sender['total_score'],
+                ":reset_time" : decimal.Decimal(cur_time - GiftFeature.GIFT_RESET_TIME),
+                ":gift" : {"amount" : decimal.Decimal(amount), "send_time" : gift_time}
+            }
         }
-        self.bot.data_access.update_item(DataAccess.Tables.USERS, sender_key, sender_update_expr, sender_expr_attrs)
-
-        ### Updated recipient dictionary ###
-        updated_receive_dict = recipient['gifts']
-        receive_item_dict = updated_receive_dict['received']
-        receive_item_dict[sender['user_id']] = {
-            "amount" : decimal.Decimal(amount),
-            "receive_time" : decimal.Decimal(int(time.time()))
-        }
-        updated_receive_dict['received'] = sent_item_dict
 
         ### Add to the recipient ###
-        recip_key = {'user_id' : recipient['user_id']}
-        recip_update_expr = "set distribution_score = :dist, submission_score = :sub, total_score = :tot, gifts = :gift_dict"
-        recip_expr_attrs = {
-            ":dist" : decimal.Decimal(int(recipient['distribution_score']) + distribution_amt),
-            ":sub"  : decimal.Decimal(int(recipient['submission_score']) + submission_amt),
-            ":tot"  : decimal.Decimal(int(recipient['total_score']) + amount),
-            ":gift_dict" : updated_receive_dict
+        recipient_update = {
+            'table_id' : DataAccess.Tables.USERS,
+            'key' : {'user_id' : recipient['user_id']},
+            'update_expr' : "ADD submission_score :sub, distribution_score :dist, total_score :tot " + \
+                "SET gifts.received.#sender = :gift",
+            'condition_expr' : "attribute_exists(user_id)",
+            'expr_attr_names' : {"#sender" : sender['user_id']},
+            'expr_attr_vals' : {
+                ":sub" : decimal.Decimal(submission_amt),
+                ":dist" : decimal.Decimal(distribution_amt),
+                ":tot" : decimal.Decimal(amount),
+                ":gift" : {"amount" : decimal.Decimal(amount), "receive_time" : gift_time}
+            }
         }
-        self.bot.data_access.update_item(DataAccess.Tables.USERS, recip_key, recip_update_expr, recip_expr_attrs)
+
+        if not self.bot.data_access.transact_update_items([sender_update, recipient_update]):
+            return None
 
         print(str(amount) + " points were gifted from " + sender['username'] + " to " + recipient['username'])
 
+        # The condition guarantees that the sender's total was unchanged before the transfer
+        return int(sender['total_score']) - amount
+
     def __initialize_gift_data(self, user_id):
         """
-        Creates empty gift data for the user
+        Creates empty gift data for the user, unless the user already has some
+
+        Returns the empty gift data
         """
+        empty_gift_dict = {
+            "sent" : {},
+            "received" : {}
+        }
         user_key = {'user_id' : user_id}
-        user_update_expr = "set gifts = :gift_dict"
-        user_expr_attrs = {
-            ":gift_dict" : 
-            {
-               "sent" : {},
-               "received" : {}
-            }}
+        user_update_expr = "set gifts = if_not_exists(gifts, :gift_dict)"
+        user_expr_attrs = {":gift_dict" : empty_gift_dict}
         self.bot.data_access.update_item(
-            DataAccess.Tables.USERS, user_key, user_update_expr, user_expr_attrs)
\ No newline at end of file
+            DataAccess.Tables.USERS, user_key, user_update_expr, user_expr_attrs)
+        return empty_gift_dict
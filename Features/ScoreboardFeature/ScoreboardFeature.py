@@ -6,6 +6,7 @@ from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key
 import json
 import re
+import threading
 import time
 from datetime import datetime, timedelta, tzinfo
 from Utils.DataAccess import DataAccess
@@ -35,8 +36,8 @@ class ScoreboardFeature(Feature):
     # How long before the scoreboard posting to start preparing the rankings, in seconds
     RANKING_UPDATE_OFFSET_TIME = 30 * 60 # Half an hour
 
-    # Maximum number of user rankings to update per cycle
-    MAX_UPDATES_PER_CYCLE = 100
+    # The number of segments to read in parallel when scanning the Users table for rankings
+    RANKING_SCAN_SEGMENTS = 4
 
     # Number of places per scoreboard row and column. The total number of places displayed in the scoreboard
     # is the number of rows times the number of columns
@@ -57,10 +58,11 @@ class ScoreboardFeature(Feature):
         if self.next_ranking_update_time < 0:
             self.next_ranking_update_time = self.next_ranking_update_time + (24 * 60 * 60)
 
-        self.ranking_update_offset = 0 # The offset for updating rankings on subsequent update cycles
+        self.ranking_update_offset = 0 # The number of rankings that have been written so far
         self.are_rankings_updated = False # Whether or not the bot is finished processing rankings
         self.ranking_map = None # The map of user ranking data to update
         self.user_ids = [] # A list of user IDs with the rankings to update
+        self.ranking_writer = None # The background thread that writes the rankings to the database
 
     def get_next_post_time(self):
         """
@@ -117,10 +119,6 @@ class ScoreboardFeature(Feature):
             # The bot should continue working on updating the rankings in preparation to posting the scoreboard.
             self.do_update_rankings_work()
 
-            # If all of the rankings have been updated, then we are finished!
-            if self.ranking_update_offset >= len(self.ranking_map):
-                self.are_rankings_updated = True
-
 
         if seconds_since_midnight >= self.next_post_time and self.are_rankings_updated:
             # The bot has finished updating the rankings, and it's time to post!
@@ -141,6 +139,7 @@ class ScoreboardFeature(Feature):
             self.ranking_update_offset = 0
             self.ranking_map = None
             self.user_ids = []
+            self.ranking_writer = None
 
         self.prev_update_time = int(time.time())
 
@@ -149,8 +148,15 @@ class ScoreboardFeature(Feature):
         Begin updating user rankings
         """
         
-        # Get the users from the user database
-        user_data = self.bot.data_access.scan(DataAccess.Tables.USERS)['Items']
+        # Get the users from the user database. Only the fields needed for ranking are read.
+        ranking_fields = ['user_id', 'username', 'total_score', 'submission_score', 'distribution_score']
+        try:
+            user_data = list(self.bot.data_access.scan_items(DataAccess.Tables.USERS,
+                attributes=ranking_fields, total_segments=ScoreboardFeature.RANKING_SCAN_SEGMENTS))
+        except Exception as e:
+            # Rankings from a partial list of users would be wrong, so nothing is written. The update is tried again next cycle.
+            print("ScoreboardFeature: Unable to read the users for the rankings. Error: " + str(e))
+            return
 
         # Sort by score types
         users_by_total = sorted(user_data, key=lambda x: x['total_score'], reverse=True)
@@ -187,30 +193,55 @@ class ScoreboardFeature(Feature):
             user = users_by_distribution[i]
             self.ranking_map[user['user_id']]['distribution_rank'] = decimal.Decimal(i + 1)
 
+        # Write the rankings in the background, so that the bot can keep processing comments in the meantime
+        self.ranking_update_offset = 0
+        self.ranking_writer = threading.Thread(target=self.__write_rankings, daemon=True)
+        self.ranking_writer.start()
+
     def do_update_rankings_work(self):
         """
-        Do work on updating user rankings.
-        This method allows for smaller numbers of rankings to be updated per cycle, to avoid data throttling.
+        Checks on the progress of the ranking writer started by begin_updating_rankings.
+        The rankings are written with batched writes, paced to the write capacity of the Rankings table,
+        so the time needed scales with the table's capacity rather than with the update interval.
         """
         remaining_rankings = len(self.ranking_map) - self.ranking_update_offset
-        rankings_to_update = min(ScoreboardFeature.MAX_UPDATES_PER_CYCLE, remaining_rankings)
+        print("Updated ranking for " + str(self.ranking_update_offset) + " users.")
+        print("Remaining users: " + str(remaining_rankings))
 
+        if not self.ranking_writer.is_alive():
+            # The writer has finished, so the rankings are ready for the scoreboard
+            self.are_rankings_updated = True
+
+    def __write_rankings(self):
+        """
+        Helper function for begin_updating_rankings. Writes the ranking data for every user to
+        the Rankings table. Runs on the ranking writer thread.
+        """
         begin_time = int(time.time())
-        for i in range(0, rankings_to_update):
-            user_id = self.user_ids[i + self.ranking_update_offset]
-            ranking_dict = self.ranking_map[user_id]
-            key = {'user_id' : user_id}
-            expr = "set ranking = :dict"
-            attrs = {":dict" : ranking_dict}
-            self.bot.data_access.update_item(DataAccess.Tables.USERS, key, expr, attrs)
-            #print("Updated user " + user_id + "(" + str(i) + ")")
-
-        self.ranking_update_offset = self.ranking_update_offset + rankings_to_update
-
-        end_time = int(time.time())
-        duration = end_time - begin_time
-        print("Updated ranking for " + str(rankings_to_update) + " users. (" + str(duration) + " seconds)")
-        print("Remaining users: " + str(remaining_rankings - rankings_to_update))
+        update_time = decimal.Decimal(begin_time)
+
+        ranking_items = []
+        for user_id in self.user_ids:
+            ranking_items.append({
+                'user_id' : user_id,
+                'ranking' : self.ranking_map[user_id],
+                'update_time' : update_time
+            })
+
+        def on_progress(num_written, num_items):
+            self.ranking_update_offset = num_written
+
+        # The caller context is per-thread, so it's set again on the writer thread
+        with self.bot.data_access.caller("ScoreboardFeature"):
+            num_written = self.bot.data_access.batch_put_items(
+                DataAccess.Tables.RANKINGS, ranking_items, progress_callback=on_progress)
+
+        # Mark every ranking as processed, even if some couldn't be written, so that the scoreboard is still posted
+        self.ranking_update_offset = len(ranking_items)
+
+        duration = int(time.time()) - begin_time
+        print("Finished writing rankings for " + str(num_written) + " of " + str(len(ranking_items)) + \
+            " users. (" + str(duration) + " seconds)")
 
     def post_scoreboard(self):
         """
@@ -236,8 +267,7 @@ class ScoreboardFeature(Feature):
         self.__flush_old_items() # Get rid of any outdated posts in the high score list
 
         # Get the user info for the post that finished tracking
-        user_info = self.bot.data_access.query(DataAccess.Tables.USERS,
-            key_condition_expr = Key('user_id').eq(tracking_item['author_id']))['Items'][0]
+        user_info = self.bot.data_access.get_user(tracking_item['author_id'])
 
         # The item that will be stored in the TopPosts database if it has a high score
         new_top_item = {
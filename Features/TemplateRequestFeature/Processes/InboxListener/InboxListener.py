@@ -23,7 +23,7 @@ class InboxListener:
     def __init__(self, reddit, test_mode):
         self.reddit = reddit
         self.test_mode = test_mode
-        self.data_access = DataAccess(test_mode)
+        self.data_access = DataAccess(test_mode, default_caller="InboxListener")
         self.my_id = self.reddit.user.me().id
 
         self.subreddit_name = "InsiderMemeBot_Test" if test_mode else "InsiderMemeTrading"
@@ -1,5 +1,5 @@
 # Set up sys.path so it can find the utilities
-import os, sys
+import atexit, os, sys
 top_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../..'))
 sys.path.append(top_dir)
 
@@ -8,9 +8,10 @@ import praw
 from datetime import datetime, timedelta
 import time
 from Utils.DataAccess import DataAccess
+from Utils.ProcessedIdSet import ProcessedIdSet
+from Utils.ReplyIndex import ReplyIndex
 from boto3.dynamodb.conditions import Key
 import decimal
-from sortedcontainers import SortedSet
 import traceback
 
 class TemplateRequestListener:
@@ -18,11 +19,12 @@ class TemplateRequestListener:
     This class continuously monitors subreddits for "!IMTRequest" commands
     """
     ID_STORE_LIMIT = 1000 # The number of recent comment/submission IDs stored by the listener
+    PROCESSED_IDS_FILE = "request_listener_processed_ids.txt" # The file in IMT_STATE_DIR that the processed IDs are saved to
 
     def __init__(self, reddit, test_mode):
         self.reddit = reddit
         self.test_mode = test_mode
-        self.data_access = DataAccess(test_mode)
+        self.data_access = DataAccess(test_mode, default_caller="TemplateRequestListener")
         self.my_id = self.reddit.user.me().id
 
         self.imt_subreddit_name = "InsiderMemeBot_Test" if test_mode else "InsiderMemeTrading"
@@ -30,17 +32,16 @@ class TemplateRequestListener:
 
 
         # Store the IDs of the last 1000 comments that the RequestListener has processed.
+        # If IMT_STATE_DIR is set, the IDs are saved there, so they aren't processed again after a restart.
+        # This collection shouldn't be used directly by implementing classes.
+        snapshot_path = None
+        if 'IMT_STATE_DIR' in os.environ:
+            snapshot_path = os.path.join(os.environ['IMT_STATE_DIR'], TemplateRequestListener.PROCESSED_IDS_FILE)
+        self.__processed_ids = ProcessedIdSet(TemplateRequestListener.ID_STORE_LIMIT, snapshot_path=snapshot_path)
+        atexit.register(self.__processed_ids.save) # Save the IDs processed since the last snapshot on shutdown
 
-        # For efficiency the IDs are stored twice, in two different orders.
-        # -  One set is a simple list that keeps the comments in the order they were processed, so that we can
-        #    easily know which comment to pop off the collection once 1000 comments are exceeded.
-        # 
-        # -  One set is sorted by the hash of the comment. This makes it easy to determine if a 
-        #    given comment has already been processed, without having to iterate over the entire list.
-        #
-        # These collections shouldn't be used directly by implementing classes.
-        self.__processed_ids_by_time = []
-        self.__processed_ids_by_hash = SortedSet()
+        # The comments that the bot has replied to
+        self.reply_index = ReplyIndex(self.reddit)
 
 
     def run(self):
@@ -75,6 +76,8 @@ class TemplateRequestListener:
                         traceback.print_exc()
                         self.mark_item_processed(comment)
 
+            # Save the IDs processed since the last snapshot, even if no more are added for a while
+            self.__processed_ids.save_if_due()
             time.sleep(1)
 
     def process_request(self, request_comment):
@@ -105,6 +108,7 @@ class TemplateRequestListener:
             request_comment.reply(
                 "There is already an open request for this template. I will notify you when it is fullfiled!" + \
                 "You can track the request for this template [here](" + imt_permalink + ")")
+            self.reply_index.record_reply(request_comment)
             
         # Case 3: There is a completed request for the requested template
         elif submission_id in fulfilled_requests:
@@ -154,12 +158,17 @@ class TemplateRequestListener:
         """
         Returns whether or not the given comment contains a reply from InsiderMemeBot
         """
+        replied = self.reply_index.has_replied(comment)
+        if replied is not None:
+            return replied
+
+        # The reply index couldn't be loaded, so check the replies of the comment itself
         comment.refresh()
         replies = comment.replies
 
         replies.replace_more(limit=None)
         for reply in replies:
-            if reply.author.id == self.reddit.user.me().id:
+            if reply.author is not None and reply.author.id == self.my_id:
                 return True
         return False
         
@@ -171,28 +180,14 @@ class TemplateRequestListener:
         
         obj: The Comment or Submission that we are testing whether or not was processed
         """
-        return obj.id in self.__processed_ids_by_hash
+        return obj.id in self.__processed_ids
 
     def mark_item_processed(self, item):
         """ Marks that the item has been processed by the feature
         
         item: The Comment or Submission that has been processed
         """
-      
-        if item.id in self.__processed_ids_by_hash:
-            # The edge case is if we're replying to a comment that's already been replied to.
-            # Having duplicate comment IDs in the collections can make things messy, so we don't want to add it again.
-            # In this case, we will have to traverse the entire comments_by_time collection ( O(n) ) to find and remove the comment
-            self.__processed_ids_by_time.remove(item.id)
-            self.__processed_ids_by_time.append(item.id) # Add it back on the end     
-        else:    
-            # This is the usual case, where a comment hasn't already been replied to.
-            self.__processed_ids_by_time.append(item.id)
-            self.__processed_ids_by_hash.add(item.id)
-        
-        if len(self.__processed_ids_by_time) > TemplateRequestListener.ID_STORE_LIMIT:
-            oldest_id = self.__processed_ids_by_time.pop(0) # Pop oldest comment at 0
-            self.__processed_ids_by_hash.remove(oldest_id)
+        self.__processed_ids.add(item.id)
 
     def is_old(self, obj):
         """
@@ -3,6 +3,8 @@ This application runs as its own process, and continuously monitors the subreddi
 in the AWS DynamoDB Database for IMT template requests
 """
 import os
+import signal
+import sys
 import praw
 from TemplateRequestListener import TemplateRequestListener
 
@@ -20,6 +22,9 @@ reddit = praw.Reddit(client_id = os.environ['IMT_CLIENT_ID'],
 
 TEST_MODE = os.environ['IMT_TEST_MODE'] == "true"
 
+# Exit normally when stopped, so that the listener's shutdown handlers run
+signal.signal(signal.SIGTERM, lambda signal_number, frame: sys.exit(0))
+
 request_listener = TemplateRequestListener(reddit, TEST_MODE)
 
 request_listener.run()
@@ -1,5 +1,4 @@
 from Features.Feature import Feature
-import decimal
 import praw
 import boto3
 from botocore.exceptions import ClientError
@@ -42,10 +41,9 @@ class TemplateRequestFeature(Feature):
         self.fulfilled_flair_id = self.bot.data_access.get_variable("templaterequest_fulfilled_flair_id")
 
         # Get the mods to notify for when a template request is made or fulfilled
-        notified_names = self.bot.data_access.get_variable("templaterequest_notified_mods")
+        self.notified_mod_names = None
         self.notified_mods = []
-        for name in notified_names:
-            self.notified_mods.append(self.bot.reddit.redditor(name))
+        self.update_notified_mods()
 
 
     def update(self):
@@ -57,10 +55,7 @@ class TemplateRequestFeature(Feature):
             return # Not time to update yet
 
         # Get the mods to notify for when a template request is made or fulfilled. May have changed if mods opt in/out
-        notified_names = self.bot.data_access.get_variable("templaterequest_notified_mods")
-        self.notified_mods = []
-        for name in notified_names:
-            self.notified_mods.append(self.bot.reddit.redditor(name))
+        self.update_notified_mods()
 
         # Update the pending requests.
         # A pending request means it has been registered in the AWS Database,
@@ -86,17 +81,26 @@ class TemplateRequestFeature(Feature):
         self.prev_update_time = int(time.time())
         print("Time to update template request feature: " + str(int(self.prev_update_time - cur_time)) + " seconds.")
 
-    def process_comment(self, comment):
+    def update_notified_mods(self):
         """
-        Processes comments
+        Updates the list of moderators to notify about template requests.
+        The Redditor objects are only rebuilt if the list of names has changed.
         """
-        if self.is_active_request_reply(comment):
-            # The comment was a reply to an active request
-            self.process_active_reply(comment)
+        notified_names = self.bot.data_access.get_variable("templaterequest_notified_mods")
+        if notified_names is None or notified_names == self.notified_mod_names:
+            return
+
+        self.notified_mod_names = notified_names
+        self.notified_mods = []
+        for name in notified_names:
+            self.notified_mods.append(self.bot.reddit.redditor(name))
 
-        elif self.is_fulfilled_request_reply(comment):
-            # The comment was a reply to a fulfilled request
-            self.process_fulfilled_reply(comment)
+    def register_commands(self, router):
+        # A reply to the bot on an active request, or else on a request that has already been fulfilled
+        router.register(self, "!template", lambda comment, context: self.process_active_reply(comment),
+            reply_to_bot=True, predicate=lambda context: self.is_active_request(context.comment.submission.id))
+        router.register(self, "!template", lambda comment, context: self.process_fulfilled_reply(comment),
+            reply_to_bot=True, predicate=lambda context: self.is_fulfilled_request(context.comment.submission.id))
 
     def process_pending_requests(self, pending_requests):
         """
@@ -150,6 +154,7 @@ class TemplateRequestFeature(Feature):
                     "Your template request has been received!\n\n" + \
                     "I will reply to this comment again when the template has been provided. " + \
                     "You can track the request [here](" + bot_comment.permalink + ").")
+                    self.bot.reply_index.record_reply(request_comment)
 
             except Exception as e:
                 print("!!!! Unable to process request!   Submission ID: " + str(submission_id))
@@ -359,16 +364,12 @@ class TemplateRequestFeature(Feature):
         distribution_points = int(total_points / 2) # Distribute evenly between distribution and submission score
         submission_points = total_points - distribution_points
 
-        user_data = self.bot.data_access.query(DataAccess.Tables.USERS, Key('user_id').eq(comment.author.id))['Items'][0]
-        user_key = {'user_id' : user_data['user_id']}
-        user_update_expr = "set distribution_score = :dist, submission_score = :sub, total_score = :tot"
-        user_expr_attrs = {
-            ":dist" : decimal.Decimal(int(user_data['distribution_score']) + distribution_points),
-            ":sub"  : decimal.Decimal(int(user_data['submission_score']) + submission_points),
-            ":tot"  : decimal.Decimal(int(user_data['total_score']) + total_points)
-        }
-        self.bot.data_access.update_item(
-            DataAccess.Tables.USERS, user_key, user_update_expr, user_expr_attrs)
+        if self.bot.data_access.get_user(comment.author.id) is None:
+            # Scores are only added to existing users, so the submitter needs an account first
+            self.bot.data_access.create_new_user(comment.author)
+        if self.bot.data_access.update_user_score(comment.author.id,
+            submission_delta=submission_points, distribution_delta=distribution_points) is None:
+            print("!!!!! Unable to award template request points to user: " + str(comment.author.name))
 
         # 3. Remove from the active templates, and add to the Templates table
         fulfilled_request = {
@@ -399,10 +400,11 @@ class TemplateRequestFeature(Feature):
         ### Reply to the original comment(s) requesting the IMT Template
         for request_comment_id in request_info['requestor_comments']:
             request_comment = self.bot.reddit.comment(id=request_comment_id)
-            request_comment_reply = "The template has been provided by u/" + user_data['username'] + "!\n\n" + \
+            request_comment_reply = "The template has been provided by u/" + comment.author.name + "!\n\n" + \
                "[Template](" + template_url + ")"
                
             request_comment.reply(request_comment_reply)
+            self.bot.reply_index.record_reply(request_comment)
 
         ### Update the bot's sticky post to say the template was fulfilled
         bot_comment = self.bot.reddit.comment(id=request_info["imt_bot_comment_id"])
@@ -425,42 +427,21 @@ class TemplateRequestFeature(Feature):
 
         self.bot.reply(comment, "This template request has already been fulfilled.")
 
-    def is_active_request_reply(self, comment):
+    def is_active_request(self, submission_id):
         """
-        Returns true if the comment is a reply to the bot on an active template request post
+        Returns true if the submission is an active template request post
         """
         active_requests = self.bot.data_access.get_variable("templaterequest_active_requests")
-        active_ids = []
         for request_dict in active_requests.values():
-            active_ids.append(request_dict["imt_request_submission_id"])
+            if request_dict["imt_request_submission_id"] == submission_id:
+                return True
+        return False
 
-        return self.__is_request_reply(comment, active_ids)
-
-    def is_fulfilled_request_reply(self, comment):
+    def is_fulfilled_request(self, submission_id):
         """
-        Returns true if the comment is a reply to the bot's sticky post on a fulfilled request
+        Returns true if the submission is a template request post that has already been fulfilled
         """
-        if comment.parent().author.id == None or comment.parent().author.id != self.bot.reddit.user.me().id:
-            return False
-
-        # This is a reply to the bot's comment
-
-        # See if the template was already fulfilled
         items = self.bot.data_access.query(DataAccess.Tables.TEMPLATE_REQUESTS,
-            key_condition_expr = Key('id').eq(comment.submission.id))['Items']
+            key_condition_expr = Key('id').eq(submission_id))['Items']
 
-        return len(items) > 0 # If there is an entry in the TEMPLATE_REQUESTS table for this ID, then it's been fulfilled already
-
-
-    def __is_request_reply(self, comment, request_submission_ids):
-        """
-        Helper method for is_active_request_reply and is_fulfilled_request_reply
-        """
-        if comment.parent().author == None:
-            return False # Author can be none if a comment was deleted somehow, so add a check just to be safe
-        elif comment.parent().author.id != self.bot.reddit.user.me().id:
-            return False # The reply wasn't made to the bot
-        else:
-            # Return true if the comment is a reply to the bot, and the comment's submission is one of the requests in the given list
-            submission_id = comment.submission.id
-            return submission_id in request_submission_ids
\ No newline at end of file
+        return len(items) > 0 # If there is an entry in the TEMPLATE_REQUESTS table for this ID, then it's been fulfilled already
\ No newline at end of file
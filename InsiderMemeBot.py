@@ -6,16 +6,22 @@
 from datetime import datetime, timedelta
 from praw.models.reddit.submission import Submission
 from praw.models.reddit.comment import Comment
-from sortedcontainers import SortedSet
+import atexit
+import os
 import time
 import traceback
 
+from Features.Feature import Feature
 from Features.BaseScoringFeature.BaseScoringFeature import BaseScoringFeature
 from Features.ScoreboardFeature.ScoreboardFeature import ScoreboardFeature
 from Features.GiftFeature.GiftFeature import GiftFeature
 from Features.TemplateRequestFeature.TemplateRequestFeature import TemplateRequestFeature
 
+from Utils.CommandRouter import CommandRouter
 from Utils.DataAccess import DataAccess
+from Utils.ListingStream import ListingStream
+from Utils.ProcessedIdSet import ProcessedIdSet
+from Utils.ReplyIndex import ReplyIndex
 from boto3.dynamodb.conditions import Key
 import decimal
 
@@ -24,6 +30,7 @@ class InsiderMemeBot:
     VERSION = "2.3" # The version of InsiderMemeBot
 
     ID_STORE_LIMIT = 1000 # The number of recent comment/submission IDs stored by the feature
+    PROCESSED_IDS_FILE = "processed_ids.txt" # The file in IMT_STATE_DIR that the processed IDs are saved to
 
     def __init__(self, reddit, test_mode):
         """
@@ -46,19 +53,31 @@ class InsiderMemeBot:
         print("User: " + self.reddit.user.me().name)
         print("Subreddit: " + self.subreddit_name)
 
-        self.data_access = DataAccess(test_mode)
+        # Comments and submissions are read on the main thread, so it never waits for throttled database calls
+        self.data_access = DataAccess(test_mode, wait_on_main_thread=False)
+
+        # The streams of new submissions and comments in the subreddit
+        self.submission_stream = ListingStream(self.subreddit.new)
+        self.comment_stream = ListingStream(self.subreddit.comments)
   
-        # Store the IDs of the last 1000 comments that the feature has processed.
-        # For efficiency the IDs are stored twice, in two different orders.
-        # -  One set is a simple list that keeps the comments in the order they were processed, so that we can
-        #    easily know which comment to pop off the collection once 1000 comments are exceeded.
-        # 
-        # -  One set is sorted by the hash of the comment. This makes it easy to determine if a 
-        #    given comment has already been processed, without having to iterate over the entire list.
-        #
-        # These collections shouldn't be used directly by implementing classes.
-        self.__processed_ids_by_time = []
-        self.__processed_ids_by_hash = SortedSet()
+        # Store the IDs of the last 1000 comments and submissions that the bot has processed.
+        # If IMT_STATE_DIR is set, the IDs are saved there, so they aren't processed again after a restart.
+        # This collection shouldn't be used directly by implementing classes.
+        snapshot_path = None
+        if 'IMT_STATE_DIR' in os.environ:
+            snapshot_path = os.path.join(os.environ['IMT_STATE_DIR'], InsiderMemeBot.PROCESSED_IDS_FILE)
+        self.__processed_ids = ProcessedIdSet(InsiderMemeBot.ID_STORE_LIMIT, snapshot_path=snapshot_path)
+        atexit.register(self.__processed_ids.save) # Save the IDs processed since the last snapshot on shutdown
+
+        # The comments and submissions that the bot has replied to. Replies posted through reply() are
+        # added to the index, and replies posted directly with praw should be recorded with record_reply().
+        self.reply_index = ReplyIndex(self.reddit)
+
+        # The commands that each feature handles. Features that don't register any commands, and that
+        # override process_comment, are given every new comment through it.
+        self.command_router = CommandRouter(self.my_id)
+        self.comment_features = []
+
         # Initialize the features
         self.init_features()
 
@@ -72,6 +91,13 @@ class InsiderMemeBot:
         self.features.append(ScoreboardFeature(self))
         self.features.append(GiftFeature(self))
         self.features.append(TemplateRequestFeature(self))
+
+        for feature in self.features:
+            feature.register_commands(self.command_router)
+            # Features that only handle submissions or updates keep the default process_comment, which does nothing
+            handles_comments = type(feature).process_comment is not Feature.process_comment
+            if handles_comments and not self.command_router.has_routes(feature):
+                self.comment_features.append(feature)
         
         
     def run(self):
@@ -83,45 +109,61 @@ class InsiderMemeBot:
             try:
                 ### Perform any periodic updates ###
                 for feature in self.features:
-                    feature.update()
+                    with self.data_access.caller(type(feature).__name__):
+                        feature.update()
 
                 ### Get new submissions and process them ###
-                for submission in self.subreddit.new(limit=10):
-                
-                    if self.is_processed_recently(submission):
-                        # Skip over anything we've already looked at
-                        continue
-
-                    elif (submission.is_self and not self.test_mode):
-                        # Skip over text-only submisisons (Announcements, etc.)
-                        # Allow processing of text-only submissions in test-mode only
-                        self.mark_item_processed(submission)
-                        continue
-                            
-                    elif self.is_old(submission) or self.did_comment(submission):
-                        # Nothing to be done for old posts or posts that the bot has already commented on
-                        self.mark_item_processed(submission)
-                        continue
-
-                    for feature in self.features:
-                        feature.process_submission(submission)
+                for submission in self.submission_stream.fetch():
+                    try:
+                        if self.is_processed_recently(submission):
+                            # Skip over anything we've already looked at
+                            continue
+
+                        elif (submission.is_self and not self.test_mode):
+                            # Skip over text-only submisisons (Announcements, etc.)
+                            # Allow processing of text-only submissions in test-mode only
+                            self.mark_item_processed(submission)
+                            continue
+
+                        elif self.is_old(submission) or self.did_comment(submission):
+                            # Nothing to be done for old posts or posts that the bot has already commented on
+                            self.mark_item_processed(submission)
+                            continue
+
+                        for feature in self.features:
+                            with self.data_access.caller(type(feature).__name__):
+                                feature.process_submission(submission)
+                    except Exception as e:
+                        print("Unable to process submission: " + str(submission))
+                        print(e)
+                        traceback.print_exc()
 
                     self.mark_item_processed(submission)
 
 
                 ### Get new comments and process them ###
-                for comment in self.subreddit.comments(limit=10):
+                for comment in self.comment_stream.fetch():
                     try:
                         if self.is_processed_recently(comment):
                             continue
+                        # Ignore comments that no feature handles, without looking anything up
+                        elif len(self.comment_features) == 0 and not self.command_router.has_command(comment):
+                            self.mark_item_processed(comment)
+                            continue
                         # Ignore own comments, old comments, and comments already replied to
                         elif comment.author.id == self.my_id or \
                         self.is_old(comment) or self.did_reply(comment):
                             self.mark_item_processed(comment)
                             continue
 
-                        for feature in self.features:
-                            feature.process_comment(comment)
+                        context, routes = self.command_router.match(comment)
+                        for feature, handler in routes:
+                            with self.data_access.caller(type(feature).__name__):
+                                handler(comment, context)
+
+                        for feature in self.comment_features:
+                            with self.data_access.caller(type(feature).__name__):
+                                feature.process_comment(comment)
                     except Exception as e:
                         print("Unable to process comment: " + str(comment))
                         print(e)
@@ -133,6 +175,8 @@ class InsiderMemeBot:
                 print(e)
                 traceback.print_exc()    
 
+            # Save the IDs processed since the last snapshot, even if no more are added for a while
+            self.__processed_ids.save_if_due()
             time.sleep(1)
 
     ######################## Callbacks ############################
@@ -146,7 +190,8 @@ class InsiderMemeBot:
         try:
             for feature in self.features:
                 # Call the handlers
-                feature.on_finished_tracking(item)
+                with self.data_access.caller(type(feature).__name__):
+                    feature.on_finished_tracking(item)
         except Exception as e:
             print("Error in on_finished_tracking callback")
             print(e)
@@ -177,6 +222,7 @@ class InsiderMemeBot:
         # The reply Comment made by the bot
         try:
             bot_reply = item.reply(reply_with_footer)
+            self.reply_index.record_reply(item)
             print("Responded to item: " + str(item))
             print("Response: " + str(bot_reply))
         except Exception as e:
@@ -200,22 +246,8 @@ class InsiderMemeBot:
         
         item: The Comment or Submission that has been processed
         """
-      
-        if item.id in self.__processed_ids_by_hash:
-            # The edge case is if we're replying to a comment that's already been replied to.
-            # Having duplicate comment IDs in the collections can make things messy, so we don't want to add it again.
-            # In this case, we will have to traverse the entire comments_by_time collection ( O(n) ) to find and remove the comment
-            self.__processed_ids_by_time.remove(item.id)
-            self.__processed_ids_by_time.append(item.id) # Add it back on the end     
-        else:    
-            # This is the usual case, where a comment hasn't already been replied to.
-            self.__processed_ids_by_time.append(item.id)
-            self.__processed_ids_by_hash.add(item.id)
-        
-        if len(self.__processed_ids_by_time) > InsiderMemeBot.ID_STORE_LIMIT:
-            oldest_id = self.__processed_ids_by_time.pop(0) # Pop oldest comment at 0
-            self.__processed_ids_by_hash.remove(oldest_id)
-    
+        self.__processed_ids.add(item.id)
+
     def is_processed_recently(self, obj):
         """
         Returns whether or not the given submission or comment ID was processed by the Feature (Not the entire bot)
@@ -223,14 +255,27 @@ class InsiderMemeBot:
         
         obj: The Comment or Submission that we are testing whether or not was processed
         """
-        return obj.id in self.__processed_ids_by_hash
+        return obj.id in self.__processed_ids
 
     def did_comment(self, submission):
         """
         Returns whether or not the given submission already contains a top-level comment by InsiderMemeBot
         """
+        replied = self.reply_index.has_replied(submission)
+        if replied:
+            return True
+
+        # Submissions that the bot has commented on are tracked, with the ID of the bot's comment
+        response = self.data_access.get_item(DataAccess.Tables.TRACKING, {'submission_id' : submission.id})
+        if response is not None:
+            if 'Item' in response and 'bot_comment_id' in response['Item']:
+                return True
+            if replied is not None:
+                return False
+
+        # The reply index or the database couldn't be read, so check the comments of the submission itself
         for comment in submission.comments:
-            if comment.author.id == self.my_id:
+            if comment.author is not None and comment.author.id == self.my_id:
                 # The comment was by this bot
                 return True
         return False
@@ -239,12 +284,17 @@ class InsiderMemeBot:
         """
         Returns whether or not the given comment contains a reply from InsiderMemeBot
         """
+        replied = self.reply_index.has_replied(comment)
+        if replied is not None:
+            return replied
+
+        # The reply index couldn't be loaded, so check the replies of the comment itself
         comment.refresh()
         replies = comment.replies
 
         replies.replace_more(limit=None)
         for reply in replies:
-            if reply.author.id == self.reddit.user.me().id:
+            if reply.author is not None and reply.author.id == self.my_id:
                 return True
         return False
         
@@ -6,9 +6,16 @@ sys.path.append(top_dir)
 
 
 import praw
+import asyncio
+import math
+import threading
 import time
+import zlib
 from Utils.DataAccess import DataAccess
-from boto3.dynamodb.conditions import Key
+from Utils.DueQueue import DueQueue
+from Utils.ScoreHistory import ScoreSeries
+from Utils.Metrics import TrackerMetrics
+from concurrent.futures import ThreadPoolExecutor
 import decimal
 
 class Tracker:
@@ -17,12 +24,79 @@ class Tracker:
     updates them with scores retrieved from PRAW
     """
 
-    def __init__(self, reddit, test_mode):
+    INFO_BATCH_SIZE = 100 # The maximum number of fullnames that Reddit looks up in a single info request
+
+    # Each item is polled on its own schedule. Young posts and posts whose score is moving are polled
+    # often, and old, stable posts are polled rarely. Every item gets a final poll when it expires.
+    TRACK_DURATION_SECONDS = 24 * 60 * 60 # How long items are tracked for. Matches BaseScoringFeature.
+    MIN_POLL_INTERVAL = 60 # The shortest time, in seconds, between polls of an item
+    MAX_POLL_INTERVAL = 30 * 60 # The longest time, in seconds, between polls of an item
+    STABLE_BACKOFF = 1.5 # How much longer the interval gets each time an item's score hasn't changed
+    VOLATILITY_REFERENCE = 10 # A score change of this many points per minute halves the poll interval
+    MAX_POLLS_PER_CYCLE = 1000 # The most items polled in a single cycle. The items that are due first are polled first.
+    SKIP_UNCHANGED_WRITES = True # Whether to skip writing scores that haven't changed since they were last written
+    DEFAULT_MIN_CYCLE_TIME = 10 # The default minimum time, in seconds, between cycles
+
+    # The tracked items are kept in memory, and kept current by applying the changes recorded in the
+    # tracking journal. The Tracking table is only scanned at startup, when the Tracker falls too far
+    # behind the journal, and occasionally to pick up any items added without going through DataAccess.
+    RECONCILE_INTERVAL = 30 * 60 # How often, in seconds, to rescan the Tracking table
+
+    # The score read by each poll is recorded in a compact series for the item, which is written to the
+    # ScoreHistory table in chunks. An item is polled at most once a minute for a day, so its history is bounded.
+    RECORD_SCORE_HISTORY = True # Whether to record the score history of each item
+    HISTORY_CHUNK_POINTS = 60 # The number of samples in each chunk of history that's written
+
+    METRICS_SUMMARY_INTERVAL = 600 # How often, in seconds, to print a summary of the cycle metrics
+
+    # In concurrent mode, the batches of a cycle are run on an asyncio event loop, so that the Reddit lookups
+    # and database writes of several batches overlap. praw and boto3 are blocking, so the calls are made on
+    # worker threads. Neither praw nor the boto3 tables are thread safe, so each worker has a praw.Reddit
+    # instance or a table of its own. The instances all use the same account, so they share its rate limit.
+    RATE_LIMIT_RESERVE = 5 # The number of Reddit requests left in the rate limit window that aren't used by each Tracker
+
+    def __init__(self, reddit, test_mode, min_cycle_time=None, concurrency=None, shard_index=0, shard_count=1,
+        rate_limit_shares=1, reddit_factory=None):
+        """
+        reddit: The authenticated praw.Reddit instance
+        test_mode: Whether to track the development data instead of the actual data
+        min_cycle_time: (Optional) The minimum time, in seconds, between cycles
+        concurrency: (Optional) The maximum number of batches in flight at once, between being looked up and being
+                     written. If greater than 1, that many batches are looked up and written at the same time.
+                     Otherwise, the batches are polled one at a time.
+        shard_index, shard_count: (Optional) For running several Trackers side by side. Each Tracker only polls
+                                  the items whose submission IDs hash to its own shard.
+        rate_limit_shares: (Optional) The number of Trackers that share the Reddit account, and so its rate limit.
+                           Each of them holds back a reserve for the others, so that together they don't exceed it.
+        reddit_factory: (Optional) A function that returns a new praw.Reddit instance, logged in to the same account
+                        as reddit, for each lookup worker in concurrent mode. By default, they're created from reddit's config.
+        """
         self.reddit = reddit
         self.test_mode = test_mode
-        self.data_access = DataAccess(test_mode)
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.data_access = DataAccess(test_mode,
+            default_caller="Tracker" if shard_count == 1 else "Tracker-" + str(shard_index))
+        self.min_cycle_time = Tracker.DEFAULT_MIN_CYCLE_TIME if min_cycle_time is None else min_cycle_time
+        self.concurrency = 1 if concurrency is None else max(1, concurrency)
+        self.rate_limit_reserve = Tracker.RATE_LIMIT_RESERVE * max(1, rate_limit_shares)
+
+        if self.concurrency > 1:
+            self.event_loop = asyncio.new_event_loop()
+            self.reddit_factory = reddit_factory if reddit_factory is not None else self.__new_reddit__
+            self.fetch_executor = ThreadPoolExecutor(max_workers=self.concurrency)
+            self.write_executor = ThreadPoolExecutor(max_workers=self.concurrency)
+            self.worker_state = threading.local() # The praw.Reddit instance or Tracking table of each worker thread
+            self.worker_reddits = [] # The praw.Reddit instances of the lookup workers, for the rate limit check
+            self.worker_reddits_lock = threading.Lock()
 
-        self.tracked_items = []
+        self.tracked_items = {} # The items in the Tracking table, keyed by submission ID
+        self.poll_queue = DueQueue() # The submission IDs of the tracked items, ordered by the time they're next due
+        self.poll_states = {} # Maps each submission ID to the state used for scheduling its polls
+        self.tracking_version = None # The version of the tracking journal that tracked_items is up to date with
+        self.last_reconcile = 0 # The last time that the Tracking table was scanned
+        self.history_chunks = [] # The ScoreHistory items waiting to be written at the end of the cycle
+        self.metrics = TrackerMetrics(Tracker.METRICS_SUMMARY_INTERVAL)
 
     def run(self):
         """
@@ -31,10 +105,19 @@ class Tracker:
         self.__start__()
 
         while(True):
+            begin_time = time.time()
             self.__update__()
-            time.sleep(1)
+            time.sleep(max(0, self.min_cycle_time - (time.time() - begin_time)))
+
 
 
+    def owns(self, submission_id):
+        """
+        Returns whether the item with the given submission ID belongs to this Tracker's shard.
+        crc32 is used since, unlike hash(), it's the same in every process.
+        """
+        return self.shard_count == 1 or zlib.crc32(submission_id.encode('utf-8')) % self.shard_count == self.shard_index
+
 
     ######### Private helper functions ###########
 
@@ -45,83 +128,412 @@ class Tracker:
         print("*" * 40)
         print("RUNNING TRACKER")
         print("Tracking Database: " + str(self.data_access.tracking_table.name))
+        print("Minimum cycle time: " + str(self.min_cycle_time) + " seconds")
         print("*" * 40)
 
     def __update__(self):
         """
         Updates the items being tracked
         """
-        cur_time = int(time.time())
-        
-        # Get the items in the database being tracked
-        tracked_items = []
-        try:
-            response = self.data_access.scan(DataAccess.Tables.TRACKING)
-            for item in response['Items']:
-                tracked_items.append(item)
-        except Exception as e:
+        begin_time = time.time()
+        cur_time = int(begin_time)
+
+        # Bring the items being tracked up to date with the database
+        if not self.__refresh_tracked_items__(cur_time) and self.tracking_version is None:
             print("Could not load tracking data!")
-            print(e)
             return
 
-        for item in tracked_items:
-            self.__update_item__(item)
+        # Poll the items that are due, earliest first
+        next_due_time = self.poll_queue.next_due_time()
+        poll_lag = 0 if next_due_time is None else max(0, cur_time - next_due_time)
+        due_items = [self.tracked_items[submission_id] for submission_id in
+            self.poll_queue.pop_due(cur_time, limit=Tracker.MAX_POLLS_PER_CYCLE)]
+
+        # Look up the submissions in batches, so that each batch costs a single Reddit API request
+        batches = [due_items[offset : offset + Tracker.INFO_BATCH_SIZE]
+            for offset in range(0, len(due_items), Tracker.INFO_BATCH_SIZE)]
+        if self.concurrency > 1:
+            self.event_loop.run_until_complete(self.__poll_batches_async__(batches))
+        else:
+            for batch in batches:
+                delay = self.__rate_limit_delay__(0)
+                if delay > 0:
+                    print("Reddit rate limit reached, waiting " + str(int(delay)) + " seconds")
+                    time.sleep(delay)
+                submissions = self.__fetch_submissions__(batch)
+
+                new_scores = {}
+                if submissions is not None:
+                    new_scores = self.__update_items__(batch, submissions)
+                self.__schedule_batch__(batch, new_scores)
 
         end_time = int(time.time())
-        time_elapsed = end_time - cur_time
+        time_elapsed = time.time() - begin_time
+        next_due_time = self.poll_queue.next_due_time()
+
+        # The staleness of the items whose final refresh has been made doesn't matter any more
+        staleness = [end_time - (state['last_poll_time'] or state['tracked_time'])
+            for state in self.poll_states.values() if not state['is_final']]
+        self.metrics.record_cycle(time_elapsed * 1000, len(due_items), len(self.tracked_items), staleness, poll_lag)
 
         print("=" * 40)
-        print("Update cycle time: " + str(time_elapsed) + " seconds" )
+        print("Update cycle time: " + "{:.2f}".format(time_elapsed) + " seconds" )
+        print("Polled " + str(len(due_items)) + " of " + str(len(self.tracked_items)) + " tracked items. " + \
+            ("Next poll due in " + str(max(0, int(next_due_time) - end_time)) + " seconds" if next_due_time is not None else ""))
         print("=" * 40)
 
-    def __update_item__(self, item):
+        self.__write_history__()
+        if self.metrics.is_summary_due():
+            print(self.metrics.summary_line())
+
+    def __schedule_batch__(self, batch, new_scores):
         """
-        Updates a single tracked item
+        Schedules the next polls of a batch of items
+        new_scores: The new scores of the items that were polled successfully, keyed by submission ID
         """
-        begin_time = time.time()
-        try:
+        for item in batch:
+            self.__schedule_next_poll__(item, new_scores.get(item['submission_id']), int(time.time()))
 
-            if not 'expire_time' in item:
-                """
-                In the case that the tracker adds an item at the same time as one is removed by InsiderMemeBot, it is
-                possible that a remnant will remain, with only the "submission_id", "last_update", and "score" fields defined.
-
-                This check catches any such instance, as all non-deleted items will have the "expire_time" field defined.
-                If an entry without this field is found, it should simply be removed from the database since InsiderMemeBot is 
-                finished with it.
-                """
-                self.data_access.delete_item(DataAccess.Tables.TRACKING, {'submission_id' : item['submission_id']})
-                print("Removing invalid item: " + str(item))
+    async def __poll_batches_async__(self, batches):
+        """
+        Polls the batches of a cycle concurrently, with at most self.concurrency batches in flight
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        in_flight = [0] # The number of lookups in flight, which haven't been counted by the rate limit headers yet
+        await asyncio.gather(*[self.__poll_batch_async__(batch, semaphore, in_flight) for batch in batches])
+
+    async def __poll_batch_async__(self, batch, semaphore, in_flight):
+        """
+        Looks up and updates a single batch of items. The batch waits for a free slot, and the lookup
+        waits for the Reddit rate limit to allow another request.
+        """
+        loop = self.event_loop
+        async with semaphore:
+            await self.__wait_for_rate_limit__(in_flight)
+            in_flight[0] = in_flight[0] + 1
+            try:
+                submissions = await loop.run_in_executor(self.fetch_executor, self.__fetch_submissions_on_worker__, batch)
+            finally:
+                in_flight[0] = in_flight[0] - 1
+
+            new_scores = {}
+            if submissions is not None:
+                new_scores = await loop.run_in_executor(self.write_executor, self.__update_items_on_worker__,
+                    batch, submissions)
+        # Scheduling is done on the event loop thread, so the poll queue is never shared between threads
+        self.__schedule_batch__(batch, new_scores)
+
+    async def __wait_for_rate_limit__(self, in_flight):
+        """
+        Waits until the Reddit rate limit window has room for another request, based on the rate limit
+        headers of the last response. The requests that are still in flight count against the window.
+        """
+        while True:
+            delay = self.__rate_limit_delay__(in_flight[0])
+            if delay <= 0:
                 return
+            print("Reddit rate limit reached, waiting " + str(int(delay)) + " seconds")
+            await asyncio.sleep(delay)
 
-            submission_id = item['submission_id']
-            expire_time = decimal.Decimal(item['expire_time'])
-            last_update = decimal.Decimal(0) if not 'last_update' in item else decimal.Decimal(item['last_update'])
+    def __rate_limit_delay__(self, in_flight):
+        """
+        Returns how long, in seconds, to wait before the next Reddit request, or 0 if it can be made now.
+        The headers count the requests of every process using the account, so the Trackers that share it
+        all stop once the remaining requests are down to their combined reserve.
+        in_flight: The number of requests that have been sent, but aren't counted by the headers yet
+        """
+        remaining = None
+        reset_timestamp = None
+        for limits in self.__rate_limits__():
+            if limits.get('remaining') is None or limits.get('reset_timestamp') is None:
+                continue # No requests have been made with this instance yet
+            # The latest window's headers are the current ones, and within a window, the fewest remaining is the latest
+            if reset_timestamp is None or limits['reset_timestamp'] > reset_timestamp or \
+                (limits['reset_timestamp'] == reset_timestamp and limits['remaining'] < remaining):
+                remaining = limits['remaining']
+                reset_timestamp = limits['reset_timestamp']
+        if remaining is None:
+            return 0 # No requests have been made yet
+        if remaining - in_flight > self.rate_limit_reserve:
+            return 0
+        return max(0, reset_timestamp - time.time())
+
+    def __rate_limits__(self):
+        """
+        Returns the rate limit headers last seen by each of the praw.Reddit instances
+        """
+        limits = [self.reddit.auth.limits]
+        if self.concurrency > 1:
+            with self.worker_reddits_lock:
+                limits.extend(reddit.auth.limits for reddit in self.worker_reddits)
+        return limits
 
-            submission = self.reddit.submission(id=submission_id)
-            new_score = decimal.Decimal(submission.score)
-            update_time = decimal.Decimal(int(time.time()))
-            author = '[None]' if submission.author == None else submission.author.name
+    def __new_reddit__(self):
+        """
+        Returns a new praw.Reddit instance, logged in with the same credentials as the Tracker's own
+        """
+        config = self.reddit.config
+        return praw.Reddit(client_id=config.client_id, client_secret=config.client_secret,
+            password=config.password, user_agent=config.user_agent, username=config.username)
 
-            key = {'submission_id' : submission_id}
-            update_expr = 'set last_update = :update, score = :score'
-            expr_vals = {':update' : update_time, ':score' : new_score}
+    def __fetch_submissions_on_worker__(self, items):
+        """
+        Looks up a batch of items on a lookup worker thread, with the worker's own praw.Reddit instance
+        """
+        reddit = getattr(self.worker_state, 'reddit', None)
+        if reddit is None:
+            reddit = self.reddit_factory()
+            self.worker_state.reddit = reddit
+            with self.worker_reddits_lock:
+                self.worker_reddits.append(reddit)
+        return self.__fetch_submissions__(items, reddit)
 
-            # Make sure the item still exists since we added it to the list of items to update.
-            # If it's been removed from the tracking database, then we don't need to update it anymore
-            key_condition_expr = Key('submission_id').eq(submission_id)
-            response = self.data_access.query(DataAccess.Tables.TRACKING, key_condition_expr)
-            item_exists = len(response['Items']) == 1
+    def __update_items_on_worker__(self, items, submissions):
+        """
+        Writes the scores of a batch of items on a write worker thread, with the worker's own Tracking table
+        """
+        table = getattr(self.worker_state, 'table', None)
+        if table is None:
+            table = self.data_access.worker_table(DataAccess.Tables.TRACKING)
+            self.worker_state.table = table
+        return self.__update_items__(items, submissions, table)
+
+    def __refresh_tracked_items__(self, cur_time):
+        """
+        Applies the changes in the tracking journal to the set of tracked items, or rescans the
+        Tracking table if the journal can't be used
 
-            if item_exists:
-                self.data_access.update_item(DataAccess.Tables.TRACKING, key, update_expr, expr_vals)
-                end_time = time.time()
-                update_duration = round(end_time - begin_time, 2)
+        Returns whether the tracked items are up to date
+        """
+        # The journal is read before any scan, so that changes made during the scan are applied again next cycle
+        journal = self.data_access.get_tracking_changes(self.tracking_version)
+        if journal is None:
+            return False
+        version, changes = journal
+
+        if changes is None or cur_time >= self.last_reconcile + Tracker.RECONCILE_INTERVAL:
+            response = self.data_access.scan(DataAccess.Tables.TRACKING)
+            if response is None:
+                return False
+            self.__sync_tracked_items__(response['Items'], cur_time)
+            self.last_reconcile = cur_time
+            self.tracking_version = version
+            return True
 
+        for submission_id, is_added in changes:
+            if not self.owns(submission_id):
+                continue
+            if not is_added:
+                self.__untrack_item__(submission_id)
+                continue
+
+            response = self.data_access.get_item(DataAccess.Tables.TRACKING, {'submission_id' : submission_id},
+                consistent_read=True)
+            if response is None:
+                # The change can't be applied, so rescan the table next cycle instead
+                self.last_reconcile = 0
+                return False
+            if 'Item' in response:
+                self.__track_item__(response['Item'], cur_time)
             else:
-                print("Submission has been removed from tracking: " + str(submission_id))
+                self.__untrack_item__(submission_id) # It's been removed again since
+
+        self.tracking_version = version
+        return True
+
+    def __sync_tracked_items__(self, items, cur_time):
+        """
+        Brings the set of tracked items up to date with all of the items read from the Tracking table.
+        New items are due to be polled right away, and items that are no longer in the table are dropped.
+        """
+        scanned_ids = set()
+        for item in items:
+            scanned_ids.add(item['submission_id'])
+            self.__track_item__(item, cur_time)
+
+        for submission_id in list(self.tracked_items.keys()):
+            if not submission_id in scanned_ids:
+                self.__untrack_item__(submission_id)
+
+    def __track_item__(self, item, cur_time):
+        """
+        Adds an item read from the Tracking table to the tracked items, or refreshes it if it's already tracked.
+        Items that belong to another shard are ignored.
+        """
+        submission_id = item['submission_id']
+        if not self.owns(submission_id):
+            return
+        self.tracked_items[submission_id] = item
+        if not submission_id in self.poll_states:
+            self.poll_states[submission_id] = {'last_poll_time' : None, 'last_score' : None, 'interval' : None,
+                'is_final' : False, 'history' : ScoreSeries(), 'tracked_time' : cur_time}
+            self.poll_queue.schedule(submission_id, cur_time)
+
+    def __untrack_item__(self, submission_id):
+        """
+        Drops an item that has been settled and removed from the Tracking table
+        """
+        self.tracked_items.pop(submission_id, None)
+        state = self.poll_states.pop(submission_id, None)
+        self.poll_queue.remove(submission_id)
+        if state is not None:
+            self.__queue_history_chunk__(submission_id, state)
+
+    def __queue_history_chunk__(self, submission_id, state):
+        """
+        Moves the samples recorded for an item into a ScoreHistory item, to be written at the end of the cycle
+        """
+        series = state['history']
+        if len(series) == 0:
+            return
+        self.history_chunks.append({
+            'submission_id' : submission_id,
+            'start_time' : decimal.Decimal(series.start_time),
+            'num_points' : decimal.Decimal(len(series)),
+            'data' : series.encode()
+        })
+        state['history'] = ScoreSeries()
+
+    def __write_history__(self):
+        """
+        Writes the chunks of score history that are waiting. Chunks that can't be written are dropped,
+        so that the history never holds up the tracking.
+        """
+        if len(self.history_chunks) == 0:
+            return
+        self.data_access.batch_put_items(DataAccess.Tables.SCORE_HISTORY, self.history_chunks)
+        self.history_chunks = []
+
+    def __schedule_next_poll__(self, item, new_score, cur_time):
+        """
+        Schedules the next poll of an item, based on its age and how quickly its score is changing
+
+        item: The item that was just polled
+        new_score: The score read by the poll, or None if the poll failed
+        cur_time: The time of the poll
+        """
+        submission_id = item['submission_id']
+        state = self.poll_states.get(submission_id)
+        if state is None or not 'expire_time' in item:
+            return # The item was removed
+        if new_score is None:
+            # Try again soon. A failed final poll is retried as well, so the item can still be settled.
+            self.poll_queue.schedule(submission_id, cur_time + Tracker.MIN_POLL_INTERVAL)
+            return
+
+        if Tracker.RECORD_SCORE_HISTORY:
+            state['history'].append(cur_time, new_score)
+            if len(state['history']) >= Tracker.HISTORY_CHUNK_POINTS:
+                self.__queue_history_chunk__(submission_id, state)
+
+        # The final poll is made once the item has expired, so that its last update is at or after the
+        # expire time. Once that's done, the item doesn't need polling until it's settled and removed.
+        final_poll_time = int(math.ceil(item['expire_time']))
+        if cur_time >= final_poll_time:
+            state['is_final'] = True
+            state['last_poll_time'] = cur_time
+            state['last_score'] = new_score
+            self.__queue_history_chunk__(submission_id, state) # No more samples will be recorded
+            return
+
+        # Young items start at the minimum interval, and old ones at the maximum
+        age = cur_time - (item['expire_time'] - Tracker.TRACK_DURATION_SECONDS)
+        age_fraction = min(1.0, max(0.0, float(age) / Tracker.TRACK_DURATION_SECONDS))
+        interval = Tracker.MIN_POLL_INTERVAL * (float(Tracker.MAX_POLL_INTERVAL) / Tracker.MIN_POLL_INTERVAL) ** age_fraction
+
+        if state['last_poll_time'] is not None:
+            score_change = abs(new_score - state['last_score'])
+            if score_change == 0:
+                # The score is stable, so back off from the previous interval
+                interval = max(interval, state['interval'] * Tracker.STABLE_BACKOFF)
+            else:
+                # The score is moving, so poll more often
+                minutes = max(1, cur_time - state['last_poll_time']) / 60.0
+                interval = interval / (1 + float(score_change) / minutes / Tracker.VOLATILITY_REFERENCE)
+
+        interval = min(Tracker.MAX_POLL_INTERVAL, max(Tracker.MIN_POLL_INTERVAL, interval))
+        state['last_poll_time'] = cur_time
+        state['last_score'] = new_score
+        state['interval'] = interval
+        self.poll_queue.schedule(submission_id, min(cur_time + int(interval), final_poll_time))
+
+    def __fetch_submissions__(self, items, reddit=None):
+        """
+        Looks up the submissions of a batch of tracked items with a single reddit.info request
+        reddit: (Optional) The praw.Reddit instance to use. By default, the Tracker's own instance is used.
+
+        Returns a dictionary mapping each submission ID to its praw Submission, or None if the lookup failed.
+        Submissions that Reddit didn't return are left out of the dictionary.
+        """
+        reddit = self.reddit if reddit is None else reddit
+        submission_kind = reddit.config.kinds['submission']
+        fullnames = [submission_kind + "_" + item['submission_id'] for item in items if 'expire_time' in item]
+        if len(fullnames) == 0:
+            return {}
+
+        begin_time = time.time()
+        try:
+            submissions = {submission.id : submission for submission in reddit.info(fullnames=fullnames)}
+            self.metrics.record_fetch((time.time() - begin_time) * 1000, len(fullnames), True)
+            return submissions
         except Exception as e:
-            print("Failed to update submission: " + submission_id)
+            self.metrics.record_fetch((time.time() - begin_time) * 1000, len(fullnames), False)
+            print("Failed to look up " + str(len(fullnames)) + " submissions")
             print(e)
+            return None
+
+    def __update_items__(self, items, submissions, table=None):
+        """
+        Updates the scores of a batch of tracked items.
+        Scores that haven't changed aren't written, unless the item has expired and needs its final update.
+        items: The items from the Tracking table
+        submissions: The praw Submissions for the items, keyed by submission ID. Submissions that Reddit
+                     didn't return are missing.
+        table: (Optional) The Tracking table to write to. By default, the table shared by the data access is used.
+
+        Returns a dictionary of the new score of each item that was polled successfully, keyed by submission ID
+        """
+        new_scores = {}
+        updates = [] # The (item, new score) pairs that need to be written
+        update_time = decimal.Decimal(int(time.time()))
+        for item in items:
+            if not 'expire_time' in item:
+                continue # Only complete items are polled
+            submission_id = item['submission_id']
+            submission = submissions.get(submission_id)
+            if submission is None:
+                # The submission no longer exists, so its score can't change. The update time is still
+                # written with the last known score, so that the item is settled when it expires.
+                print("Submission not found, keeping its last score: " + str(submission_id))
+                new_score = decimal.Decimal(item.get('score', 0))
+            else:
+                new_score = decimal.Decimal(submission.score)
+
+            # The settlement of an item needs a last update at or after its expire time, so that write always goes through
+            is_final = update_time >= item['expire_time']
+            if Tracker.SKIP_UNCHANGED_WRITES and not is_final and new_score == item.get('score'):
+                new_scores[submission_id] = new_score
+            else:
+                updates.append((item, new_score))
+
+        if len(updates) == 0:
+            return new_scores
 
+        # The updates are conditional, so that an item that was settled and removed since it was read isn't
+        # brought back as a remnant. Its removal is picked up from the tracking journal.
+        begin_time = time.time()
+        results = self.data_access.batch_update_existing_items(DataAccess.Tables.TRACKING,
+            [({'submission_id' : item['submission_id']}, {'score' : new_score, 'last_update' : update_time})
+                for item, new_score in updates], table=table)
+        self.metrics.record_write((time.time() - begin_time) * 1000, results.count(True), results.count(None))
 
+        for (item, new_score), result in zip(updates, results):
+            if result:
+                item['score'] = new_score
+                item['last_update'] = update_time
+                new_scores[item['submission_id']] = new_score
+                if update_time >= item['expire_time']:
+                    self.metrics.record_final_refresh(float(update_time - item['expire_time']))
+            elif result is None:
+                print("Failed to update submission: " + str(item['submission_id']))
+        return new_scores
@@ -1,26 +1,105 @@
 """
-This application runs as its own service, and continuously tracks the 
+This application runs as its own service, and continuously tracks the
 items in the AWS Tracking database. It updates the scores in the database as it reads the updated values
 from PRAW
+
+The tracking can be split across several processes by setting IMT_TRACKER_SHARDS. Without IMT_TRACKER_SHARD_INDEX,
+this process then acts as a supervisor, which runs one Tracker process per shard and restarts any that exit.
+Each shard uses the Reddit credentials with its index as a suffix (such as IMT_CLIENT_ID_1) if they're set, so
+that it has its own rate limit. Otherwise, the shard uses the main account. praw's rate limiter in each shard only
+paces its own requests, so the shards that share the account hold back a reserve of the remaining requests that's
+scaled by the number of shards, and stop before the account's rate limit runs out between them.
+
+When the supervisor is stopped with SIGTERM or SIGINT, it stops the shards before exiting.
 """
 import os
+import signal
+import subprocess
+import sys
+import time
 import praw
 from Tracker import Tracker
 
+SHARD_COUNT = int(os.environ['IMT_TRACKER_SHARDS']) if 'IMT_TRACKER_SHARDS' in os.environ else 1
+RESTART_DELAY = 30 # The time, in seconds, the supervisor waits before restarting a shard that exited
+STOP_TIMEOUT = 10 # The time, in seconds, the supervisor waits for the shards to stop before killing them
+
+
+###########################
+##       SUPERVISOR      ##
+###########################
+
+if SHARD_COUNT > 1 and not 'IMT_TRACKER_SHARD_INDEX' in os.environ:
+    def start_shard(shard_index):
+        env = dict(os.environ)
+        env['IMT_TRACKER_SHARD_INDEX'] = str(shard_index)
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+
+    def stop_shards(signal_number, frame):
+        # Forward the signal to the shards, so that none of them are left running without a supervisor
+        print("Stopping tracker shards")
+        for shard in shards:
+            if shard.poll() is None:
+                shard.terminate()
+        stop_time = time.time() + STOP_TIMEOUT
+        for shard in shards:
+            try:
+                shard.wait(timeout=max(0, stop_time - time.time()))
+            except subprocess.TimeoutExpired:
+                shard.kill()
+                shard.wait()
+        sys.exit(0)
+
+    shards = [start_shard(shard_index) for shard_index in range(0, SHARD_COUNT)]
+    exit_times = [None] * SHARD_COUNT
+    signal.signal(signal.SIGTERM, stop_shards)
+    signal.signal(signal.SIGINT, stop_shards)
+    while True:
+        time.sleep(5)
+        for shard_index in range(0, SHARD_COUNT):
+            if shards[shard_index].poll() is None:
+                continue
+            if exit_times[shard_index] is None:
+                print("Tracker shard " + str(shard_index) + " exited with code " + str(shards[shard_index].returncode))
+                exit_times[shard_index] = time.time()
+            elif time.time() >= exit_times[shard_index] + RESTART_DELAY:
+                print("Restarting tracker shard " + str(shard_index))
+                shards[shard_index] = start_shard(shard_index)
+                exit_times[shard_index] = None
+
 
 ###########################
 ##     AUTHENTICATION    ##
 ###########################
 
+SHARD_INDEX = int(os.environ.get('IMT_TRACKER_SHARD_INDEX', 0))
+HAS_OWN_CREDENTIALS = ('IMT_CLIENT_ID_' + str(SHARD_INDEX)) in os.environ # Whether the shard has its own rate limit
+
+def credential(name):
+    """
+    Returns the shard's own value of a credential if it's set, or the main account's otherwise
+    """
+    return os.environ.get(name + "_" + str(SHARD_INDEX), os.environ[name])
+
 # Authenticate and create reddit instance
-reddit = praw.Reddit(client_id = os.environ['IMT_CLIENT_ID'],
-                     client_secret = os.environ['IMT_CLIENT_SECRET'],
-                     password=os.environ['IMT_PASSWORD'],
-                     user_agent="InsiderMemeBotScript by " + os.environ['IMT_USERNAME'],
-                     username=os.environ['IMT_USERNAME'])
+reddit = praw.Reddit(client_id = credential('IMT_CLIENT_ID'),
+                     client_secret = credential('IMT_CLIENT_SECRET'),
+                     password=credential('IMT_PASSWORD'),
+                     user_agent="InsiderMemeBotScript by " + credential('IMT_USERNAME'),
+                     username=credential('IMT_USERNAME'))
 
 TEST_MODE = os.environ['IMT_TEST_MODE'] != "false"
 
-tracker = Tracker(reddit, TEST_MODE)
+# (Optional) The minimum time, in seconds, between tracker cycles
+MIN_CYCLE_TIME = int(os.environ['IMT_TRACKER_MIN_CYCLE']) if 'IMT_TRACKER_MIN_CYCLE' in os.environ else None
+
+# (Optional) The maximum number of batches in flight at once. Greater than 1 looks up and writes that many batches at the same time.
+CONCURRENCY = int(os.environ['IMT_TRACKER_CONCURRENCY']) if 'IMT_TRACKER_CONCURRENCY' in os.environ else None
+
+# The shards that use the main account share its rate limit
+RATE_LIMIT_SHARES = 1 if HAS_OWN_CREDENTIALS else SHARD_COUNT
+
+tracker = Tracker(reddit, TEST_MODE, min_cycle_time=MIN_CYCLE_TIME, concurrency=CONCURRENCY,
+    shard_index=SHARD_INDEX, shard_count=SHARD_COUNT, rate_limit_shares=RATE_LIMIT_SHARES)
 
-tracker.run()
\ No newline at end of file
+tracker.run()
@@ -0,0 +1,116 @@
+"""
+Unit tests for reading the new items of a listing with ListingStream
+"""
+import pytest
+
+from Utils.ListingStream import ListingStream
+
+
+class FakeItem:
+    def __init__(self, number):
+        self.id = "i" + str(number)
+        self.fullname = "t1_" + self.id
+        self.created_utc = 1000000 + number
+
+
+class FakeListing:
+    """
+    A listing of items, newest first, that's paged like a Reddit listing
+    """
+
+    def __init__(self):
+        self.items = [] # The items, newest first
+        self.requests = [] # The (limit, after) of each request
+        self.next_number = 0
+
+    def post(self, count):
+        """
+        Adds the given number of new items to the listing, and returns them oldest first
+        """
+        new_items = []
+        for i in range(0, count):
+            new_items.append(FakeItem(self.next_number))
+            self.next_number = self.next_number + 1
+        self.items = list(reversed(new_items)) + self.items
+        return new_items
+
+    def delete(self, item):
+        self.items.remove(item)
+
+    def __call__(self, limit, params):
+        after = params.get('after')
+        self.requests.append((limit, after))
+        start = 0
+        if after is not None:
+            start = [item.fullname for item in self.items].index(after) + 1
+        return iter(self.items[start : start + limit])
+
+
+@pytest.fixture
+def listing():
+    return FakeListing()
+
+def ids(items):
+    return [item.id for item in items]
+
+
+def test_first_fetch_returns_the_newest_items(listing):
+    listing.post(30)
+    stream = ListingStream(listing, initial_fetch_size=10)
+
+    assert ids(stream.fetch()) == ["i" + str(i) for i in range(20, 30)]
+    assert listing.requests == [(10, None)]
+
+def test_quiet_fetch_is_a_single_small_request(listing):
+    listing.post(30)
+    stream = ListingStream(listing, initial_fetch_size=10)
+    stream.fetch()
+    listing.requests = []
+
+    assert stream.fetch() == []
+    new_items = listing.post(2)
+    assert ids(stream.fetch()) == ids(new_items)
+    assert listing.requests == [(20, None), (ListingStream.MIN_FETCH_SIZE, None)]
+
+def test_burst_larger_than_a_page_is_read_in_full(listing):
+    listing.post(10)
+    stream = ListingStream(listing, initial_fetch_size=10)
+    stream.fetch()
+    listing.requests = []
+
+    new_items = listing.post(150)
+    assert ids(stream.fetch()) == ids(new_items)
+    # The page size doubles while the burst continues, up to the largest page Reddit returns
+    assert [limit for limit, after in listing.requests] == [20, 40, 80, 100]
+    assert listing.requests[1][1] == new_items[-20].fullname
+
+    # Every item was returned once, so the next fetch starts from the newest one
+    assert stream.fetch() == []
+    assert stream.fetch_size == ListingStream.MIN_FETCH_SIZE
+
+def test_deleted_mark_stops_at_older_items(listing):
+    listing.post(10)
+    stream = ListingStream(listing, initial_fetch_size=10)
+    newest = stream.fetch()[-1]
+
+    listing.delete(newest)
+    new_items = listing.post(3)
+    assert ids(stream.fetch()) == ids(new_items)
+
+def test_overflow_stops_after_the_most_pages(listing, monkeypatch, capsys):
+    monkeypatch.setattr(ListingStream, 'MAX_PAGES', 2)
+    listing.post(10)
+    stream = ListingStream(listing, initial_fetch_size=10)
+    stream.fetch()
+    listing.requests = []
+
+    new_items = listing.post(500)
+    items = stream.fetch()
+    # Only the newest items that fit in the pages are returned, and the rest are reported as missed
+    assert len(listing.requests) == 2
+    assert ids(items) == ids(new_items[-60:])
+    assert "Older items may have been missed" in capsys.readouterr().out
+
+    # The mark is the newest item, so the next fetch doesn't go back to the missed items
+    later_items = listing.post(2)
+    assert ids(stream.fetch()) == ids(later_items)
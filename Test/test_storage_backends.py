@@ -0,0 +1,254 @@
+"""
+Unit tests for the stand-in storage backends, and the DataAccess calls made through them
+"""
+import decimal
+import pytest
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+
+from Utils import StorageBackends
+from Utils.DataAccess import DataAccess
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        return StorageBackends.MemoryBackend()
+    return StorageBackends.SqliteBackend(str(tmp_path / "tables.sqlite"))
+
+@pytest.fixture
+def data_access(backend, monkeypatch):
+    monkeypatch.setattr(DataAccess, 'RETRY_BASE_DELAY', 0)
+    return DataAccess(True, backend=backend)
+
+def error_code(error):
+    return error.response['Error']['Code']
+
+
+class UnprocessedBackend:
+    """
+    Wraps a backend, and leaves the second half of every BatchWriteItem request unprocessed
+    until the given number of requests have been throttled
+    """
+
+    def __init__(self, backend, num_throttled):
+        self.backend = backend
+        self.num_throttled = num_throttled
+        self.requests = []
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def batch_write_item(self, request_items, return_consumed_capacity='NONE'):
+        self.requests.append(request_items)
+        if self.num_throttled == 0:
+            return self.backend.batch_write_item(request_items, return_consumed_capacity)
+
+        self.num_throttled = self.num_throttled - 1
+        processed = {}
+        unprocessed = {}
+        for table_name, requests in request_items.items():
+            half = len(requests) // 2
+            processed[table_name] = requests[:half]
+            unprocessed[table_name] = requests[half:]
+        response = self.backend.batch_write_item(processed, return_consumed_capacity)
+        response['UnprocessedItems'] = unprocessed
+        return response
+
+
+###########################################################################
+###                             Pagination                              ###
+###########################################################################
+
+def test_scan_pages_stop_at_one_megabyte(data_access, backend):
+    table_name = data_access.tableIdToString(DataAccess.Tables.TRACKING)
+    backend.batch_load(table_name, [{'submission_id' : 's' + str(i), 'blob' : 'x' * 10000} for i in range(300)])
+
+    seen = []
+    pages = 0
+    scan_args = {}
+    while True:
+        response = backend.scan(table_name, **scan_args)
+        pages = pages + 1
+        seen.extend(item['submission_id'] for item in response['Items'])
+        if not 'LastEvaluatedKey' in response:
+            break
+        scan_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    assert pages > 1
+    assert sorted(seen) == sorted('s' + str(i) for i in range(300))
+
+def test_scan_follows_every_page(data_access, backend):
+    table_name = data_access.tableIdToString(DataAccess.Tables.TRACKING)
+    backend.batch_load(table_name, [{'submission_id' : 's' + str(i), 'score' : i} for i in range(120)])
+
+    assert data_access.scan(DataAccess.Tables.TRACKING)['Count'] == 120
+    assert len(list(data_access.scan_items(DataAccess.Tables.TRACKING, page_size=7))) == 120
+    assert len(list(data_access.scan_items(DataAccess.Tables.TRACKING, total_segments=4, page_size=7))) == 120
+    assert backend.stats()['calls'][table_name]['Scan'] > 4
+
+def test_query_limit_pages_in_sort_key_order(data_access, backend):
+    table_name = data_access.tableIdToString(DataAccess.Tables.SCORE_HISTORY)
+    backend.batch_load(table_name, [{'submission_id' : 'a', 'start_time' : decimal.Decimal(t)} for t in range(10)] + \
+        [{'submission_id' : 'b', 'start_time' : decimal.Decimal(0)}])
+
+    start_times = []
+    query_args = {}
+    while True:
+        response = backend.query(table_name, KeyConditionExpression=Key('submission_id').eq('a'), Limit=3, **query_args)
+        assert len(response['Items']) <= 3
+        start_times.extend(int(item['start_time']) for item in response['Items'])
+        if not 'LastEvaluatedKey' in response:
+            break
+        query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    assert start_times == list(range(10))
+
+
+###########################################################################
+###                           UnprocessedItems                          ###
+###########################################################################
+
+def test_batch_put_items_retries_unprocessed_items(data_access, backend):
+    throttling_backend = UnprocessedBackend(backend, num_throttled=2)
+    data_access.backend = throttling_backend
+    items = [{'user_id' : 'u' + str(i), 'ranking' : i} for i in range(25)]
+
+    assert data_access.batch_put_items(DataAccess.Tables.RANKINGS, items) == 25
+    assert [len(list(request.values())[0]) for request in throttling_backend.requests] == [25, 13, 7]
+    assert data_access.scan(DataAccess.Tables.RANKINGS)['Count'] == 25
+
+def test_batch_put_items_gives_up_on_unprocessed_items(data_access, backend, monkeypatch):
+    monkeypatch.setattr(DataAccess, 'MAX_BATCH_RETRIES', 2)
+    data_access.backend = UnprocessedBackend(backend, num_throttled=100)
+    items = [{'user_id' : 'u' + str(i), 'ranking' : i} for i in range(8)]
+
+    # Each of the 3 attempts writes half of the remaining items
+    assert data_access.batch_put_items(DataAccess.Tables.RANKINGS, items) == 7
+
+def test_batch_write_counts_one_call_per_request(data_access, backend):
+    table_name = data_access.tableIdToString(DataAccess.Tables.RANKINGS)
+    backend.reset_stats()
+    items = [{'user_id' : 'u' + str(i), 'ranking' : i} for i in range(3000)]
+
+    assert data_access.batch_put_items(DataAccess.Tables.RANKINGS, items) == 3000
+    stats = backend.stats()
+    assert stats['calls'][table_name]['BatchWriteItem'] == 120
+    assert stats['write_units'][table_name] == 3000
+
+def test_batch_write_rejects_more_than_25_items(data_access, backend):
+    table_name = data_access.tableIdToString(DataAccess.Tables.RANKINGS)
+    requests = [{'PutRequest' : {'Item' : {'user_id' : 'u' + str(i)}}} for i in range(26)]
+    with pytest.raises(ClientError) as error:
+        backend.batch_write_item({table_name : requests})
+    assert error_code(error.value) == 'ValidationException'
+
+
+###########################################################################
+###                         Conditional Updates                         ###
+###########################################################################
+
+def test_conditional_update_of_missing_item_fails(data_access, backend):
+    table_name = data_access.tableIdToString(DataAccess.Tables.USERS)
+    with pytest.raises(ClientError) as error:
+        backend.update_item(table_name, Key={'user_id' : 'ghost'}, UpdateExpression="ADD total_score :d",
+            ConditionExpression="attribute_exists(user_id)", ExpressionAttributeValues={':d' : decimal.Decimal(1)})
+    assert error_code(error.value) == 'ConditionalCheckFailedException'
+    assert not 'Item' in backend.get_item(table_name, Key={'user_id' : 'ghost'})
+
+def test_conditional_update_holds(data_access, backend):
+    table_name = data_access.tableIdToString(DataAccess.Tables.USERS)
+    backend.batch_load(table_name, [{'user_id' : 'u1', 'total_score' : decimal.Decimal(5)}])
+
+    assert data_access.update_item(DataAccess.Tables.USERS, {'user_id' : 'u1'}, "ADD total_score :d",
+        {':d' : 2, ':expected' : 5}, condition_expr="total_score = :expected")
+    assert not data_access.update_item(DataAccess.Tables.USERS, {'user_id' : 'u1'}, "ADD total_score :d",
+        {':d' : 2, ':expected' : 5}, condition_expr="total_score = :expected")
+    assert data_access.get_user('u1')['total_score'] == 7
+
+def test_update_user_score_doesnt_create_users(data_access):
+    assert data_access.update_user_score('ghost', submission_delta=5) is None
+    assert data_access.get_user('ghost') is None
+
+    data_access.put_item(DataAccess.Tables.USERS, {'user_id' : 'u1', 'username' : 'bob',
+        'submission_score' : 0, 'distribution_score' : 0, 'total_score' : 0})
+    assert data_access.update_user_score('u1', submission_delta=5, distribution_delta=2)['total_score'] == 7
+
+
+###########################################################################
+###                             Transactions                            ###
+###########################################################################
+
+def transfer(data_access, expected_total, amount):
+    return data_access.transact_update_items([
+        {'table_id' : DataAccess.Tables.USERS, 'key' : {'user_id' : 'sender'},
+         'update_expr' : "ADD total_score :d", 'condition_expr' : "total_score = :expected",
+         'expr_attr_vals' : {':d' : decimal.Decimal(-amount), ':expected' : decimal.Decimal(expected_total)}},
+        {'table_id' : DataAccess.Tables.USERS, 'key' : {'user_id' : 'recipient'},
+         'update_expr' : "ADD total_score :d", 'condition_expr' : "attribute_exists(user_id)",
+         'expr_attr_vals' : {':d' : decimal.Decimal(amount)}}
+    ])
+
+def test_transaction_applies_every_update(data_access, backend):
+    table_name = data_access.tableIdToString(DataAccess.Tables.USERS)
+    backend.batch_load(table_name, [{'user_id' : 'sender', 'total_score' : decimal.Decimal(10)},
+        {'user_id' : 'recipient', 'total_score' : decimal.Decimal(0)}])
+    backend.reset_stats()
+
+    assert transfer(data_access, 10, 4)
+    assert data_access.get_user('sender')['total_score'] == 6
+    assert data_access.get_user('recipient')['total_score'] == 4
+    assert backend.stats()['calls'][table_name]['TransactWriteItems'] == 1
+
+def test_cancelled_transaction_applies_nothing(data_access, backend):
+    table_name = data_access.tableIdToString(DataAccess.Tables.USERS)
+    backend.batch_load(table_name, [{'user_id' : 'sender', 'total_score' : decimal.Decimal(10)}])
+
+    # The recipient doesn't exist, so the sender isn't charged either
+    assert transfer(data_access, 10, 4) is False
+    assert data_access.get_user('sender')['total_score'] == 10
+    assert data_access.get_user('recipient') is None
+
+def test_cancellation_reasons(data_access, backend):
+    table_name = data_access.tableIdToString(DataAccess.Tables.USERS)
+    backend.batch_load(table_name, [{'user_id' : 'sender', 'total_score' : decimal.Decimal(10)},
+        {'user_id' : 'recipient', 'total_score' : decimal.Decimal(0)}])
+
+    with pytest.raises(ClientError) as error:
+        backend.transact_write_items([
+            {'Update' : {'TableName' : table_name, 'Key' : {'user_id' : 'sender'}, 'UpdateExpression' : "ADD total_score :d",
+                'ConditionExpression' : "total_score = :expected",
+                'ExpressionAttributeValues' : {':d' : decimal.Decimal(-1), ':expected' : decimal.Decimal(3)}}},
+            {'Update' : {'TableName' : table_name, 'Key' : {'user_id' : 'recipient'}, 'UpdateExpression' : "ADD total_score :d",
+                'ExpressionAttributeValues' : {':d' : decimal.Decimal(1)}}}
+        ])
+    assert error_code(error.value) == 'TransactionCanceledException'
+    assert [reason['Code'] for reason in error.value.response['CancellationReasons']] == ['ConditionalCheckFailed', 'None']
+
+def test_transaction_rejects_two_updates_to_one_item(data_access, backend):
+    table_name = data_access.tableIdToString(DataAccess.Tables.USERS)
+    update = {'Update' : {'TableName' : table_name, 'Key' : {'user_id' : 'sender'}, 'UpdateExpression' : "ADD total_score :d",
+        'ExpressionAttributeValues' : {':d' : decimal.Decimal(1)}}}
+    with pytest.raises(ClientError) as error:
+        backend.transact_write_items([update, update])
+    assert error_code(error.value) == 'ValidationException'
+
+
+###########################################################################
+###                             Token Buckets                           ###
+###########################################################################
+
+def test_token_buckets_split_capacity_between_the_tables_processes(monkeypatch):
+    monkeypatch.setenv('IMT_TRACKER_SHARDS', '2')
+    monkeypatch.delenv(DataAccess.PROCESS_COUNT_ENV_VAR, raising=False)
+    data_access = DataAccess(True, backend=StorageBackends.MemoryBackend(read_capacity=50, write_capacity=25))
+    data_access.put_item(DataAccess.Tables.USERS, {'user_id' : 'u1'})
+    data_access.put_item(DataAccess.Tables.RANKINGS, {'user_id' : 'u1', 'ranking' : 1})
+    data_access.put_item(DataAccess.Tables.SCORE_HISTORY, {'submission_id' : 's1', 'start_time' : 0})
+
+    def write_rate(table_id):
+        return data_access.token_buckets[(data_access.tableIdToString(table_id), True)].provisioned_rate
+
+    assert write_rate(DataAccess.Tables.USERS) == 25 / 5.0 # The bot, two listeners, and two Tracker shards
+    assert write_rate(DataAccess.Tables.RANKINGS) == 25 # Only the scoreboard writes the rankings
+    assert write_rate(DataAccess.Tables.SCORE_HISTORY) == 25 / 2.0 # Only the Tracker shards write the history
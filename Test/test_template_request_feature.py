@@ -0,0 +1,135 @@
+"""
+Unit tests for fulfilling a template request, with the database held in the memory backend
+"""
+import pytest
+
+from Features.TemplateRequestFeature.TemplateRequestFeature import TemplateRequestFeature
+from Utils import StorageBackends
+from Utils.DataAccess import DataAccess
+
+
+class FakeRedditor:
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+class FakeComment:
+    def __init__(self, id, body="", author=None, submission=None):
+        self.id = id
+        self.fullname = "t1_" + id
+        self.body = body
+        self.author = author
+        self.submission = submission
+        self.replies = [] # The bodies of the replies made to the comment
+        self.edited_body = None
+
+    def reply(self, body):
+        self.replies.append(body)
+
+    def edit(self, body):
+        self.edited_body = body
+
+
+class FakeFlair:
+    def __init__(self):
+        self.selected = None
+
+    def select(self, flair_id):
+        self.selected = flair_id
+
+
+class FakeSubmission:
+    def __init__(self, id):
+        self.id = id
+        self.permalink = "/r/InsiderMemeBot_Test/comments/" + id
+        self.flair = FakeFlair()
+
+
+class FakeReddit:
+    def __init__(self, comments):
+        self.comments = {comment.id : comment for comment in comments}
+
+    def comment(self, id):
+        return self.comments[id]
+
+
+class FakeReplyIndex:
+    def __init__(self):
+        self.replied = []
+
+    def record_reply(self, parent):
+        self.replied.append(parent.id)
+
+
+class FakeBot:
+    def __init__(self, data_access, reddit):
+        self.data_access = data_access
+        self.reddit = reddit
+        self.reply_index = FakeReplyIndex()
+        self.replies = [] # The (item, reply) pairs posted through reply()
+
+    def reply(self, item, reply, is_sticky=False, suppress_footer=False):
+        self.replies.append((item, reply))
+
+
+@pytest.fixture
+def data_access(monkeypatch):
+    monkeypatch.setattr(DataAccess, 'RETRY_BASE_DELAY', 0)
+    data_access = DataAccess(True, backend=StorageBackends.MemoryBackend())
+    data_access.set_variable("templaterequest_flair_id", "request-flair")
+    data_access.set_variable("templaterequest_fulfilled_flair_id", "fulfilled-flair")
+    data_access.set_variable("templaterequest_notified_mods", [])
+    return data_access
+
+@pytest.fixture
+def request_post(data_access):
+    """
+    An active request for a template, with a request post made by the bot, and two requestor comments
+    """
+    request_post = FakeSubmission("imt1")
+    data_access.set_variable("templaterequest_active_requests", {
+        'orig1' : {
+            'imt_request_submission_id' : request_post.id,
+            'imt_bot_comment_id' : 'bot1',
+            'permalink' : "/r/memes/comments/orig1",
+            'requestor_comments' : ['req1', 'req2']
+        }
+    })
+    return request_post
+
+def submit(data_access, request_post, submitter):
+    comment = FakeComment('tmpl1', body="!template https://i.imgur.com/abc.png", author=submitter, submission=request_post)
+    requestor_comments = [FakeComment('req1'), FakeComment('req2')]
+    bot_comment = FakeComment('bot1')
+    bot = FakeBot(data_access, FakeReddit(requestor_comments + [bot_comment]))
+
+    TemplateRequestFeature(bot).submit_template(comment)
+    return (bot, requestor_comments, bot_comment)
+
+
+def test_submit_template_notifies_requestors(data_access, request_post):
+    submitter = FakeRedditor('u1', 'template_maker')
+    data_access.create_new_user(submitter)
+
+    bot, requestor_comments, bot_comment = submit(data_access, request_post, submitter)
+
+    for request_comment in requestor_comments:
+        assert request_comment.replies == ["The template has been provided by u/template_maker!\n\n" + \
+            "[Template](https://i.imgur.com/abc.png)"]
+    assert bot.reply_index.replied == ['req1', 'req2']
+    assert bot_comment.edited_body.startswith("**This template request has been fulfilled!**")
+    assert request_post.flair.selected == "fulfilled-flair"
+
+    assert data_access.get_variable("templaterequest_active_requests") == {}
+    assert data_access.get_item(DataAccess.Tables.TEMPLATE_REQUESTS, {'id' : 'imt1'})['Item']['fulfilled_by'] == 'u1'
+    user = data_access.get_user('u1')
+    assert user['total_score'] == TemplateRequestFeature.REQUEST_REWARD
+    assert user['submission_score'] + user['distribution_score'] == TemplateRequestFeature.REQUEST_REWARD
+
+def test_submit_template_creates_the_submitter(data_access, request_post):
+    submit(data_access, request_post, FakeRedditor('u2', 'newcomer'))
+
+    user = data_access.get_user('u2')
+    assert user['username'] == 'newcomer'
+    assert user['total_score'] == TemplateRequestFeature.REQUEST_REWARD
@@ -0,0 +1,111 @@
+"""
+Unit tests for the Tracker's polling of Reddit, with the database held in the memory backend
+"""
+import decimal
+import threading
+import time
+import pytest
+
+from Processes.Tracker.Tracker import Tracker
+from Utils import StorageBackends
+from Utils.DataAccess import DataAccess
+
+LOOKUP_SECONDS = 0.2 # How long each fake reddit.info request takes
+
+
+class FakeSubmission:
+    def __init__(self, id, score):
+        self.id = id
+        self.score = score
+
+
+class FakeConfig:
+    kinds = {'submission' : 't3'}
+
+
+class FakeAuth:
+    def __init__(self):
+        self.limits = {'remaining' : None, 'reset_timestamp' : None, 'used' : None}
+
+
+class FakeReddit:
+    """
+    Looks up every submission with a score of 10, and records the threads that made its requests
+    """
+
+    def __init__(self):
+        self.config = FakeConfig()
+        self.auth = FakeAuth()
+        self.threads = set()
+
+    def info(self, fullnames):
+        self.threads.add(threading.current_thread().ident)
+        time.sleep(LOOKUP_SECONDS)
+        return [FakeSubmission(fullname.split("_", 1)[1], 10) for fullname in fullnames]
+
+
+@pytest.fixture
+def worker_reddits():
+    return []
+
+@pytest.fixture
+def make_tracker(monkeypatch, worker_reddits):
+    monkeypatch.setenv(StorageBackends.BACKEND_ENV_VAR, "memory")
+    monkeypatch.setattr(StorageBackends, '_shared_memory_backend', None)
+    monkeypatch.setattr(Tracker, 'INFO_BATCH_SIZE', 2)
+
+    def reddit_factory():
+        reddit = FakeReddit()
+        worker_reddits.append(reddit)
+        return reddit
+
+    def make_tracker(concurrency):
+        tracker = Tracker(FakeReddit(), True, concurrency=concurrency, reddit_factory=reddit_factory)
+        expire_time = decimal.Decimal(int(time.time()) + 3600)
+        for i in range(0, 6):
+            tracker.data_access.put_item(DataAccess.Tables.TRACKING,
+                {'submission_id' : 's' + str(i), 'score' : 0, 'expire_time' : expire_time})
+        return tracker
+    return make_tracker
+
+def cycle_time(tracker):
+    begin_time = time.time()
+    tracker.__update__()
+    return time.time() - begin_time
+
+def scores(tracker):
+    return sorted(int(item['score']) for item in tracker.data_access.scan(DataAccess.Tables.TRACKING)['Items'])
+
+
+def test_serial_cycle_looks_up_one_batch_at_a_time(make_tracker):
+    tracker = make_tracker(None)
+    assert cycle_time(tracker) >= 3 * LOOKUP_SECONDS
+    assert scores(tracker) == [10] * 6
+
+def test_concurrent_cycle_overlaps_the_lookups(make_tracker, worker_reddits):
+    tracker = make_tracker(4)
+    # The three batches are looked up at the same time, so the cycle takes about as long as one lookup
+    assert cycle_time(tracker) < 2 * LOOKUP_SECONDS
+    assert scores(tracker) == [10] * 6
+
+    # Each lookup worker has a praw.Reddit instance of its own, and the Tracker's own instance isn't used
+    assert len(worker_reddits) == 3
+    assert all(len(reddit.threads) == 1 for reddit in worker_reddits)
+    assert len(set().union(*[reddit.threads for reddit in worker_reddits])) == 3
+    assert len(tracker.reddit.threads) == 0
+
+def test_rate_limit_is_shared_by_the_workers(make_tracker, worker_reddits):
+    tracker = make_tracker(4)
+    tracker.__update__()
+    assert tracker.__rate_limit_delay__(0) == 0
+
+    # The latest response seen by any of the workers counts against the rate limit
+    reset_timestamp = time.time() + 60
+    tracker.reddit.auth.limits = {'remaining' : 500, 'reset_timestamp' : reset_timestamp - 600, 'used' : 100}
+    worker_reddits[0].auth.limits = {'remaining' : 200, 'reset_timestamp' : reset_timestamp, 'used' : 400}
+    worker_reddits[1].auth.limits = {'remaining' : Tracker.RATE_LIMIT_RESERVE, 'reset_timestamp' : reset_timestamp, 'used' : 595}
+    assert tracker.__rate_limit_delay__(0) > 0
+
+    worker_reddits[1].auth.limits = {'remaining' : Tracker.RATE_LIMIT_RESERVE + 2, 'reset_timestamp' : reset_timestamp, 'used' : 593}
+    assert tracker.__rate_limit_delay__(0) == 0
+    assert tracker.__rate_limit_delay__(2) > 0 # The requests in flight count against the window
@@ -0,0 +1,91 @@
+"""
+Unit tests for the journal of items added to and removed from the Tracking table
+"""
+import pytest
+
+from Utils import StorageBackends
+from Utils.DataAccess import DataAccess
+
+
+@pytest.fixture
+def data_access(monkeypatch):
+    monkeypatch.setattr(DataAccess, 'RETRY_BASE_DELAY', 0)
+    monkeypatch.setattr(DataAccess, 'TRACKING_JOURNAL_SIZE', 5)
+    monkeypatch.setattr(DataAccess, 'TRACKING_JOURNAL_TRIM_SLACK', 2)
+    return DataAccess(True, backend=StorageBackends.MemoryBackend())
+
+def track(data_access, submission_id):
+    assert data_access.put_item(DataAccess.Tables.TRACKING, {'submission_id' : submission_id, 'score' : 0})
+
+def untrack(data_access, submission_id):
+    assert data_access.delete_item(DataAccess.Tables.TRACKING, {'submission_id' : submission_id})
+
+def read_journal(data_access):
+    return data_access.get_item(DataAccess.Tables.VARS, {'key' : DataAccess.TRACKING_JOURNAL_KEY})['Item']
+
+
+def test_empty_journal(data_access):
+    assert data_access.get_tracking_changes(None) == (0, None)
+    assert data_access.get_tracking_changes(0) == (0, [])
+
+def test_changes_are_appended_in_order(data_access):
+    track(data_access, 's1')
+    track(data_access, 's2')
+    untrack(data_access, 's1')
+
+    assert data_access.get_tracking_changes(0) == (3, [('s1', True), ('s2', True), ('s1', False)])
+    assert data_access.get_tracking_changes(2) == (3, [('s1', False)])
+    assert data_access.get_tracking_changes(3) == (3, [])
+
+    journal = read_journal(data_access)
+    assert journal['base_version'] == 0
+    assert journal['entries'] == ['+s1', '+s2', '-s1']
+
+def test_journal_is_trimmed_once_the_slack_is_used(data_access):
+    for i in range(0, 6):
+        track(data_access, 's' + str(i))
+    # One entry over the size isn't enough to trim
+    assert read_journal(data_access)['base_version'] == 0
+    assert len(read_journal(data_access)['entries']) == 6
+
+    track(data_access, 's6')
+    journal = read_journal(data_access)
+    # The two oldest entries are removed, and the version stays the same
+    assert journal['base_version'] == 2
+    assert journal['entries'] == ['+s2', '+s3', '+s4', '+s5', '+s6']
+    assert data_access.get_tracking_changes(2) == (7, [('s' + str(i), True) for i in range(2, 7)])
+    assert data_access.get_tracking_changes(5) == (7, [('s5', True), ('s6', True)])
+
+def test_trim_is_skipped_if_another_writer_trimmed_first(data_access, monkeypatch):
+    for i in range(0, 6):
+        track(data_access, 's' + str(i))
+    # Another process trims the journal between this process's append and its trim
+    original_update_item = data_access.vars_table.update_item
+    def update_item(**kwargs):
+        response = original_update_item(**kwargs)
+        if kwargs['UpdateExpression'].startswith("SET entries"):
+            original_update_item(Key={'key' : DataAccess.TRACKING_JOURNAL_KEY},
+                UpdateExpression="REMOVE entries[0] SET base_version = base_version + :one",
+                ExpressionAttributeValues={':one' : 1})
+        return response
+    monkeypatch.setattr(data_access.vars_table, 'update_item', update_item)
+
+    track(data_access, 's6')
+    journal = read_journal(data_access)
+    # Only the other writer's trim is applied, so no entry is lost twice
+    assert journal['base_version'] == 1
+    assert journal['entries'] == ['+s' + str(i) for i in range(1, 7)]
+    assert data_access.get_tracking_changes(1)[0] == 7
+
+def test_reader_behind_the_journal_must_rescan(data_access):
+    for i in range(0, 7):
+        track(data_access, 's' + str(i))
+
+    # The changes after versions 0 and 1 have been trimmed, so the reader can't catch up from the journal
+    assert data_access.get_tracking_changes(0) == (7, None)
+    assert data_access.get_tracking_changes(1) == (7, None)
+    assert data_access.get_tracking_changes(2)[1] is not None
+
+    # A reader ahead of the journal, such as after the journal was deleted, must rescan as well
+    assert data_access.get_tracking_changes(8) == (7, None)
+    assert data_access.get_tracking_changes(None) == (7, None)
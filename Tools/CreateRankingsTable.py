@@ -0,0 +1,32 @@
+"""
+This script creates the Rankings tables, which store the user rankings from the latest Scoreboard.
+
+The rankings are written in bulk before each Scoreboard is posted, so the write capacity of the
+table determines how long it takes to prepare the rankings.
+"""
+
+
+import boto3
+from botocore.exceptions import ClientError
+
+# The provisioned capacity for the tables
+READ_CAPACITY_UNITS = 5
+WRITE_CAPACITY_UNITS = 25
+
+dynamodb = boto3.resource('dynamodb', region_name='us-east-2')
+
+for table_name in ["Rankings", "Rankings-dev"]:
+    try:
+        table = dynamodb.create_table(
+            TableName = table_name,
+            KeySchema = [{'AttributeName' : 'user_id', 'KeyType' : 'HASH'}],
+            AttributeDefinitions = [{'AttributeName' : 'user_id', 'AttributeType' : 'S'}],
+            ProvisionedThroughput = {
+                'ReadCapacityUnits' : READ_CAPACITY_UNITS,
+                'WriteCapacityUnits' : WRITE_CAPACITY_UNITS
+            })
+        table.meta.client.get_waiter('table_exists').wait(TableName=table_name)
+        print("Created table: " + table_name)
+
+    except ClientError as e:
+        print(e.response['Error']['Message'])
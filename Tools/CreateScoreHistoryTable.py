@@ -0,0 +1,38 @@
+"""
+This script creates the ScoreHistory tables, which store the scores sampled by the Tracker.
+
+Each item holds a chunk of the samples for one submission, keyed by the submission ID and the time of the
+chunk's first sample. The samples are encoded by Utils/ScoreHistory.py, at 6 bytes per sample.
+"""
+
+
+import boto3
+from botocore.exceptions import ClientError
+
+# The provisioned capacity for the tables
+READ_CAPACITY_UNITS = 5
+WRITE_CAPACITY_UNITS = 5
+
+dynamodb = boto3.resource('dynamodb', region_name='us-east-2')
+
+for table_name in ["ScoreHistory", "ScoreHistory-dev"]:
+    try:
+        table = dynamodb.create_table(
+            TableName = table_name,
+            KeySchema = [
+                {'AttributeName' : 'submission_id', 'KeyType' : 'HASH'},
+                {'AttributeName' : 'start_time', 'KeyType' : 'RANGE'}
+            ],
+            AttributeDefinitions = [
+                {'AttributeName' : 'submission_id', 'AttributeType' : 'S'},
+                {'AttributeName' : 'start_time', 'AttributeType' : 'N'}
+            ],
+            ProvisionedThroughput = {
+                'ReadCapacityUnits' : READ_CAPACITY_UNITS,
+                'WriteCapacityUnits' : WRITE_CAPACITY_UNITS
+            })
+        table.meta.client.get_waiter('table_exists').wait(TableName=table_name)
+        print("Created table: " + table_name)
+
+    except ClientError as e:
+        print(e.response['Error']['Message'])
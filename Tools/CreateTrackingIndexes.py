@@ -0,0 +1,61 @@
+"""
+This script creates the global secondary indexes on the Tracking tables.
+
+author_id-index: Partitioned by author_id, so that the tracked items for a single user can be
+                 queried by the !score command without scanning the entire table.
+
+Indexes that already exist are skipped, so the script is safe to run more than once.
+"""
+
+
+import boto3
+from botocore.exceptions import ClientError
+
+# The provisioned capacity for each index. Only used for tables with provisioned capacity.
+READ_CAPACITY_UNITS = 5
+WRITE_CAPACITY_UNITS = 5
+
+# The indexes to create. Only the attributes needed for reporting scores are projected.
+INDEXES = [
+    {
+        'IndexName' : 'author_id-index',
+        'KeySchema' : [{'AttributeName' : 'author_id', 'KeyType' : 'HASH'}],
+        'AttributeDefinitions' : [{'AttributeName' : 'author_id', 'AttributeType' : 'S'}],
+        'Projection' : {'ProjectionType' : 'INCLUDE', 'NonKeyAttributes' : ['score', 'is_example']}
+    }
+]
+
+client = boto3.client('dynamodb', region_name='us-east-2')
+
+for table_name in ["Tracking", "Tracking-dev"]:
+    try:
+        description = client.describe_table(TableName=table_name)['Table']
+        existing_indexes = [index['IndexName'] for index in description.get('GlobalSecondaryIndexes', [])]
+        is_provisioned = description.get('BillingModeSummary', {}).get('BillingMode', 'PROVISIONED') == 'PROVISIONED'
+
+        for index in INDEXES:
+            if index['IndexName'] in existing_indexes:
+                print(table_name + ": Index already exists: " + index['IndexName'])
+                continue
+
+            create_args = {
+                'IndexName' : index['IndexName'],
+                'KeySchema' : index['KeySchema'],
+                'Projection' : index['Projection']
+            }
+            if is_provisioned:
+                create_args['ProvisionedThroughput'] = {
+                    'ReadCapacityUnits' : READ_CAPACITY_UNITS,
+                    'WriteCapacityUnits' : WRITE_CAPACITY_UNITS
+                }
+
+            # DynamoDB only allows one index to be created per update
+            client.update_table(
+                TableName = table_name,
+                AttributeDefinitions = index['AttributeDefinitions'],
+                GlobalSecondaryIndexUpdates = [{'Create' : create_args}])
+            print(table_name + ": Creating index " + index['IndexName'] + \
+                ". The index can be queried once its status is ACTIVE.")
+
+    except ClientError as e:
+        print(e.response['Error']['Message'])
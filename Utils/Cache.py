@@ -0,0 +1,110 @@
+"""
+This module contains an in-process cache for records read from the database
+"""
+from collections import OrderedDict
+import copy
+import threading
+import time
+
+class TTLCache:
+    """
+    A least-recently-used cache whose entries expire after a time-to-live.
+
+    A value of None can be stored to remember that a record doesn't exist (negative caching).
+    Negative entries use their own, usually shorter, time-to-live.
+
+    Values are copied on the way in and out of the cache, so callers are free to modify
+    the records they get back. The cache is safe to share between threads.
+    """
+
+    def __init__(self, capacity, ttl, negative_ttl=None):
+        """
+        capacity: The maximum number of entries to keep. The least recently used entry is evicted first.
+        ttl: The default number of seconds that an entry stays valid
+        negative_ttl: The number of seconds that a negative (None) entry stays valid. Defaults to ttl.
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+
+        self.__entries = OrderedDict() # Maps each key to a (value, expire_time) pair
+        self.__lock = threading.Lock()
+
+        # Counters for reporting the effectiveness of the cache
+        self.hits = 0
+        self.negative_hits = 0 # The hits that found a negative entry. Included in self.hits.
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key):
+        """
+        Looks up a key in the cache.
+
+        Returns a pair (is_cached, value). If is_cached is False, the caller needs to read the
+        record from the database. If is_cached is True and value is None, the record is known not to exist.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self.__entries.move_to_end(key)
+                self.hits = self.hits + 1
+                if entry[0] is None:
+                    self.negative_hits = self.negative_hits + 1
+                return (True, copy.deepcopy(entry[0]))
+
+            if entry is not None:
+                # The entry has expired
+                del self.__entries[key]
+            self.misses = self.misses + 1
+            return (False, None)
+
+    def put(self, key, value, ttl=None):
+        """
+        Stores a value in the cache
+        key: The key to store the value under
+        value: The value to store. None means that the record doesn't exist.
+        ttl: (Optional) The number of seconds the entry stays valid, overriding the default
+        """
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        if ttl <= 0:
+            self.invalidate(key)
+            return
+
+        with self.__lock:
+            self.__entries[key] = (copy.deepcopy(value), time.time() + ttl)
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.capacity:
+                self.__entries.popitem(last=False) # Evict the least recently used entry
+                self.evictions = self.evictions + 1
+
+    def invalidate(self, key):
+        """
+        Removes a key from the cache, so that the next lookup reads it from the database
+        """
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every entry from the cache
+        """
+        with self.__lock:
+            self.__entries.clear()
+
+    def stats(self):
+        """
+        Returns a dictionary with the cache counters, and the hit and miss rates
+        """
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                'size' : len(self.__entries),
+                'hits' : self.hits,
+                'negative_hits' : self.negative_hits,
+                'misses' : self.misses,
+                'evictions' : self.evictions,
+                'hit_rate' : 0.0 if lookups == 0 else self.hits / float(lookups),
+                'miss_rate' : 0.0 if lookups == 0 else self.misses / float(lookups)
+            }
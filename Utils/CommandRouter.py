@@ -0,0 +1,144 @@
+"""
+This module routes the commands in new comments to the features that handle them
+"""
+
+class CommandContext:
+    """
+    The parsed form of a single comment, shared by every feature that the comment is routed to.
+    The body is tokenized once, and the parent is only looked up if a route needs it, and then only once.
+    """
+
+    def __init__(self, comment, bot_id):
+        """
+        comment: The praw Comment
+        bot_id: The ID of the bot's account
+        """
+        self.comment = comment
+        self.bot_id = bot_id
+        self.body = comment.body.strip()
+        self.lower_body = self.body.lower()
+        self.tokens = self.body.split() # The whitespace-separated words of the body
+        self.__parent = None
+        self.__parent_author = None
+        self.__is_parent_loaded = False
+
+    @property
+    def parent(self):
+        """
+        The Comment or Submission that the comment replied to
+        """
+        self.__load_parent()
+        return self.__parent
+
+    @property
+    def parent_author(self):
+        """
+        The Redditor who wrote the parent, or None if it was deleted
+        """
+        self.__load_parent()
+        return self.__parent_author
+
+    def is_reply_to_bot(self):
+        """
+        Returns whether the comment is a direct reply to a comment or submission made by the bot
+        """
+        return self.parent_author is not None and self.parent_author.id == self.bot_id
+
+    def __load_parent(self):
+        # Each call to Comment.parent() returns a new lazy object, which would be fetched again on every access
+        if not self.__is_parent_loaded:
+            self.__parent = self.comment.parent()
+            self.__parent_author = self.__parent.author
+            self.__is_parent_loaded = True
+
+
+class CommandRouter:
+    """
+    A table of the commands that each feature handles.
+
+    Features register each command with a handler, and optionally the context that the command is valid in,
+    such as a reply to the bot, or a reply on a particular post. A comment is matched against the table once, and
+    only the features with a matching route are called. Comments that don't start with any registered command
+    never reach feature code, and the checks that need a Reddit or database lookup only run for comments that do.
+    """
+
+    def __init__(self, bot_id):
+        """
+        bot_id: The ID of the bot's account, used for the reply-to-bot context
+        """
+        self.bot_id = bot_id
+        self.routes = [] # The registered routes, in the order that they were registered
+        self.commands = set() # The registered commands
+
+    def register(self, feature, command, handler, exact=False, reply_to_bot=False, predicate=None):
+        """
+        Registers a command for a feature.
+        If more than one of a feature's routes match a comment, only the first one registered is used.
+
+        feature: The Feature that handles the command
+        command: The command, such as "!gift". Commands are matched case-insensitively.
+        handler: The function called with the comment and its CommandContext when the command matches
+        exact: If true, the command must be the entire comment. Otherwise, the comment must start with it.
+        reply_to_bot: If true, the command only matches a direct reply to the bot
+        predicate: (Optional) A function that's called with the CommandContext, and returns whether the command
+                   matches. It's only called once the command and the reply context have matched.
+        """
+        route = {
+            'feature' : feature,
+            'command' : command.lower(),
+            'handler' : handler,
+            'exact' : exact,
+            'reply_to_bot' : reply_to_bot,
+            'predicate' : predicate
+        }
+        self.routes.append(route)
+        self.commands.add(route['command'])
+
+    def has_routes(self, feature):
+        """
+        Returns whether the feature has registered any commands
+        """
+        return any(route['feature'] is feature for route in self.routes)
+
+    def has_command(self, comment):
+        """
+        Returns whether the comment starts with any registered command. This only reads the body,
+        so it can be used to skip comments before any other checks are made.
+        """
+        lower_body = comment.body.lstrip().lower()
+        return any(lower_body.startswith(command) for command in self.commands)
+
+    def match(self, comment):
+        """
+        Returns the CommandContext for the comment, and the list of (feature, handler) pairs that it's routed to,
+        in the order that the features registered them.
+        The context is None, and the list is empty, if the comment doesn't start with a registered command.
+        """
+        if not self.has_command(comment):
+            return (None, [])
+
+        context = CommandContext(comment, self.bot_id)
+        matches = []
+        matched_features = []
+        for route in self.routes:
+            if any(route['feature'] is feature for feature in matched_features):
+                continue
+            if not self.__matches(route, context):
+                continue
+            matched_features.append(route['feature'])
+            matches.append((route['feature'], route['handler']))
+
+        if len(matches) == 0:
+            return (None, [])
+        return (context, matches)
+
+    def __matches(self, route, context):
+        if route['exact']:
+            if context.lower_body != route['command']:
+                return False
+        elif not context.lower_body.startswith(route['command']):
+            return False
+
+        if route['reply_to_bot'] and not context.is_reply_to_bot():
+            return False
+        return route['predicate'] is None or route['predicate'](context)
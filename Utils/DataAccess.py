@@ -1,34 +1,151 @@
-import boto3
 from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Key, Attr
+from concurrent.futures import ThreadPoolExecutor
 import decimal
+import math
+import os
+import queue
+import threading
 import time
 import traceback
+from Utils.Cache import TTLCache
+from Utils.Metrics import CallMetrics
+from Utils import Throttling
+from Utils import DynamoExpressions
+from Utils import StorageBackends
+from Utils.ScoreHistory import ScoreSeries
 
 class DataAccess:
     """
-    This class provides read/write access to the AWS DynamoDB Service
+    This class provides read/write access to the AWS DynamoDB Service, or to one of the
+    stand-in storage backends defined in Utils.StorageBackends
     """
 
-    def __init__(self, test_mode):
-    
-        # Initialize the Amazon Web Service DynamoDB.
-        # For this to work, the AWS credentials must be present on the system.
+    REGION = 'us-east-2' # The AWS region that hosts the tables
+
+    # How long, in seconds, a parallel scan worker waits on a full page queue before
+    # checking whether the consumer has stopped reading
+    SCAN_QUEUE_TIMEOUT = 1
+
+    BATCH_WRITE_SIZE = 25 # The maximum number of items that DynamoDB accepts in a single BatchWriteItem request
+    MAX_BATCH_RETRIES = 8 # The number of times to retry unprocessed items before giving up on them
+
+    # botocore retries each DynamoDB request itself. Calls that still fail with a throttling or other transient error,
+    # and transactions cancelled by throttling, which botocore doesn't retry, are retried with a jittered exponential backoff.
+    # Permanent errors, such as a failed condition or an invalid request, are reported right away.
+    MAX_CALL_ATTEMPTS = 3 # The number of times a call is attempted before its error is reported
+    RETRY_BASE_DELAY = 0.05 # The maximum delay, in seconds, before the first retry
+    RETRY_MAX_DELAY = 5 # The maximum delay, in seconds, before any retry
+
+    # Calls are paced on the client side by a token bucket per table. The bucket only sees this process's calls,
+    # so it's a hint sized to this process's share of the provisioned capacity, rather than a hard limit.
+    # Tables used by only some of the processes are split between those processes alone.
+    CAPACITY_REFRESH_INTERVAL = 15 * 60 # How often, in seconds, to read the provisioned capacity of a table again
+    PROCESS_COUNT_ENV_VAR = "IMT_DATABASE_PROCESSES" # (Optional) The number of processes sharing the tables that every process uses
+    OTHER_PROCESS_COUNT = 3 # The bot and the two template request listeners, which share the tables with the Tracker shards
+    BOT_ONLY_TABLES = ['Rankings'] # Tables only the bot uses. Its scoreboard thread is the only writer.
+    TRACKER_ONLY_TABLES = ['ScoreHistory'] # Tables only the Tracker shards write to
+
+    # User records are cached in-process, since most commands look up the same user several times
+    USER_CACHE_SIZE = 5000 # The maximum number of users to cache
+    USER_CACHE_TTL = 5 * 60 # How long, in seconds, a cached user stays valid
+    USER_CACHE_NEGATIVE_TTL = 30 # How long, in seconds, to remember that a user doesn't exist
+
+    # Variables from the Vars table are cached in-process as well. Every write to the Vars table through
+    # DataAccess increments the version variable, so a single small read tells each process whether any
+    # of its cached variables might be out of date.
+    VARS_VERSION_KEY = "vars_version" # The variable holding the version of the Vars table
+    VARS_VERSION_CHECK_INTERVAL = 5 # How often, in seconds, to check the version before using cached variables
+    VARS_CACHE_SIZE = 256 # The maximum number of variables to cache
+    VARS_CACHE_DEFAULT_TTL = 5 * 60 # How long, in seconds, a cached variable stays valid by default
+
+    # Items added to or removed from the Tracking table through DataAccess are recorded in a small journal,
+    # so that the Tracker can keep its set of tracked items current without scanning the table
+    TRACKING_JOURNAL_KEY = "tracking_journal" # The Vars item holding the journal. Not a variable, so it isn't cached.
+    TRACKING_JOURNAL_SIZE = 100 # The number of changes kept in the journal. Readers further behind must rescan the table.
+    TRACKING_JOURNAL_TRIM_SLACK = 20 # The number of extra changes allowed before the journal is trimmed
+
+    # How long, in seconds, specific variables stay valid in the cache. The request queues are
+    # read, modified and written back by several processes, so they are never cached.
+    VARS_CACHE_TTLS = {
+        "basescoring_multiplier" : 10 * 60,
+        "basescoring_submission_footer" : 10 * 60,
+        "basescoring_example_footer" : 10 * 60,
+        "templaterequest_flair_id" : 60 * 60,
+        "templaterequest_fulfilled_flair_id" : 60 * 60,
+        "templaterequest_monitored_subreddits" : 60 * 60,
+        "templaterequest_notified_mods" : 10 * 60,
+        "templaterequest_approved_users" : 5 * 60,
+        "templaterequest_active_requests" : 60,
+        "templaterequest_pending_requests" : 0,
+        "templaterequest_approved_requests" : 0,
+        "templaterequest_rejected_requests" : 0
+    }
+
+    # Every database call is timed, and its consumed capacity and payload are recorded by table and calling feature
+    METRICS_SUMMARY_INTERVAL = 10 * 60 # How often, in seconds, to print a summary of the database calls. 0 disables it.
+    WRITE_OPERATIONS = ['put_item', 'update_item', 'delete_item', 'batch_write_item', 'transact_write_items']
+
+    # The key schema of each table. DynamoDB tables define their own, so these are only
+    # used by the stand-in storage backends in Utils.StorageBackends.
+    TABLE_SCHEMAS = {
+        'Users' : {'hash_key' : 'user_id'},
+        'Tracking' : {
+            'hash_key' : 'submission_id',
+            'indexes' : {
+                'author_id-index' : {'hash_key' : 'author_id', 'projection' : ['score', 'is_example']}
+            }
+        },
+        'Vars' : {'hash_key' : 'key'},
+        'TemplateRequests' : {'hash_key' : 'id'},
+        'Rankings' : {'hash_key' : 'user_id'},
+        'ScoreHistory' : {'hash_key' : 'submission_id', 'range_key' : 'start_time'}
+    }
+
+    def __init__(self, test_mode, backend=None, default_caller="InsiderMemeBot", wait_on_main_thread=True):
+        """
+        test_mode: Whether to use the development tables instead of the actual data
+        backend: (Optional) The storage backend to use. By default, the backend is selected by the
+                 IMT_STORAGE_BACKEND environment variable, and is the AWS DynamoDB service if it isn't set.
+        default_caller: The name that database calls are attributed to in the metrics, outside of a caller() context
+        wait_on_main_thread: Whether calls made on the main thread may wait for the token bucket, or sleep before
+                             a retry. If False, those calls go ahead right away, and aren't retried beyond botocore's
+                             own retries, so that the main loop is never stalled.
+        """
+        self.wait_on_main_thread = wait_on_main_thread
+        self.table_process_counts = {} # The number of processes sharing the capacity of each table, keyed by table name
+
+        # Initialize the storage backend. For the Amazon Web Service DynamoDB to work,
+        # the AWS credentials must be present on the system.
         # This can be done by using "pip install awscli", and then running "aws configure"
-        self.dynamodb = boto3.resource('dynamodb', region_name='us-east-2')
-        self.client = boto3.client('dynamodb', region_name='us-east-2')
+        self.backend = backend if backend is not None else StorageBackends.create_backend(DataAccess.REGION)
 
         # Determine if we're using the actual data, or the development data
-        if not test_mode:
-            self.user_table = self.dynamodb.Table('Users')
-            self.tracking_table = self.dynamodb.Table('Tracking')
-            self.vars_table = self.dynamodb.Table('Vars')
-            self.template_request_table = self.dynamodb.Table('TemplateRequests')
-        else:
-            self.user_table = self.dynamodb.Table('Users-dev')
-            self.tracking_table = self.dynamodb.Table('Tracking-dev')
-            self.vars_table = self.dynamodb.Table('Vars-dev')
-            self.template_request_table = self.dynamodb.Table('TemplateRequests-dev')
+        table_suffix = "-dev" if test_mode else ""
+        self.user_table = self.__open_table('Users', table_suffix)
+        self.tracking_table = self.__open_table('Tracking', table_suffix)
+        self.vars_table = self.__open_table('Vars', table_suffix)
+        self.template_request_table = self.__open_table('TemplateRequests', table_suffix)
+        self.rankings_table = self.__open_table('Rankings', table_suffix)
+        self.score_history_table = self.__open_table('ScoreHistory', table_suffix)
+
+        # The read-through cache of Users items, keyed by user_id.
+        # Writes to the Users table through DataAccess update or invalidate the cached items.
+        self.user_cache = TTLCache(DataAccess.USER_CACHE_SIZE, DataAccess.USER_CACHE_TTL,
+            negative_ttl=DataAccess.USER_CACHE_NEGATIVE_TTL)
+
+        # The cache of variables from the Vars table, keyed by variable name
+        self.vars_cache = TTLCache(DataAccess.VARS_CACHE_SIZE, DataAccess.VARS_CACHE_DEFAULT_TTL)
+        self.vars_version = None # The version of the Vars table that the cached variables belong to
+        self.last_vars_version_check = 0 # The last time that the version of the Vars table was read
+
+        # The latency, consumed capacity and payload of every database call
+        self.metrics = CallMetrics(default_caller, DataAccess.METRICS_SUMMARY_INTERVAL)
+
+        # The client-side rate limiters, keyed by (table name, is_write)
+        self.token_buckets = {}
+        self.token_buckets_lock = threading.Lock()
+        self.capacity_check_times = {} # The last time that the provisioned capacity of each table was read
 
     ###########################################################################
     ###                         CORE FUNCTIONS                              ###
@@ -43,7 +160,13 @@ class DataAccess:
         returns: True if successful, false otherwise 
         """
         try:
-            response = self.get_table(table_id).put_item(Item=item)
+            response = self.__execute(self.get_table(table_id), 'put_item', Item=item)
+            if table_id == DataAccess.Tables.USERS:
+                self.user_cache.put(item['user_id'], item)
+            elif table_id == DataAccess.Tables.VARS:
+                self.__on_vars_changed(item['key'])
+            elif table_id == DataAccess.Tables.TRACKING:
+                self.__record_tracking_change(item['submission_id'], True)
             return True
         except Exception as e:
             message = "Unable to add item to " + self.tableIdToString(table_id) + " table:\n" + str(item)
@@ -53,14 +176,15 @@ class DataAccess:
 
             return False
 
-    def get_item(self, table_id, key):
+    def get_item(self, table_id, key, consistent_read=False):
         """
         Gets an item from the AWS database
         table_id: One of the IDs defined in the Tables subclass
         key: The boto3 Key item for identifying the item to get
+        consistent_read: Whether to use a strongly consistent read
         """
         try:
-            return self.get_table(table_id).get_item(Key=key)
+            return self.__execute(self.get_table(table_id), 'get_item', Key=key, ConsistentRead=consistent_read)
         except Exception as e:
             message = "Unable to get item!\n" + \
                 "    Table: " + self.tableIdToString(table_id) + "\n" + \
@@ -71,23 +195,44 @@ class DataAccess:
             return None
 
 
-    def update_item(self, table_id, key, update_expr, expr_attr_vals):
+    def update_item(self, table_id, key, update_expr, expr_attr_vals, expr_attr_names=None, return_values=None,
+        condition_expr=None):
         """
         Updates the item in the database
         table_id: One of the IDs defined in the Tables subclass
         key: The boto3 Key item for identifying the item to update
         update_expr: The boto3 UpdateExpression for updating the item
-        expr_attr_vals: The boto3 ExpressionAttributeValues for updating the item
+        expr_attr_vals: The boto3 ExpressionAttributeValues for the update and condition expressions
+        expr_attr_names: (Optional) The boto3 ExpressionAttributeNames for the update and condition expressions
+        return_values: (Optional) The boto3 ReturnValues option, such as "UPDATED_NEW"
+        condition_expr: (Optional) A ConditionExpression that must hold for the item to be updated,
+                        such as "attribute_exists(submission_id)"
 
-        Returns whether or not the update was successful
+        Returns whether or not the update was successful.
+        If return_values is given, returns the dictionary of returned attributes instead, or None on failure.
+        A condition that doesn't hold is reported as a failure, but isn't logged as an error.
         """
+        update_args = {}
+        if expr_attr_names is not None:
+            update_args['ExpressionAttributeNames'] = expr_attr_names
+        if return_values is not None:
+            update_args['ReturnValues'] = return_values
+        if condition_expr is not None:
+            update_args['ConditionExpression'] = condition_expr
 
-        try:            
-            response = self.get_table(table_id).update_item(
-                Key=key, UpdateExpression=update_expr, ExpressionAttributeValues=expr_attr_vals)
+        try:
+            response = self.__execute(self.get_table(table_id), 'update_item',
+                Key=key, UpdateExpression=update_expr, ExpressionAttributeValues=expr_attr_vals, **update_args)
 
+            if table_id == DataAccess.Tables.VARS:
+                self.__on_vars_changed(key['key'])
+            if return_values is not None:
+                return response.get('Attributes', {})
             return True
         except Exception as e:
+            if condition_expr is not None and Throttling.error_code(e) == 'ConditionalCheckFailedException':
+                return None if return_values is not None else False
+
             message = "Unable to update item!\n" + \
                 "    Table: " + self.tableIdToString(table_id) + "\n" + \
                 "    Key: " + str(key) + "\n" + \
@@ -96,7 +241,12 @@ class DataAccess:
             print(message)
             print("Error: " + str(e))
             traceback.print_exc()
-            return False
+            return None if return_values is not None else False
+        finally:
+            if table_id == DataAccess.Tables.USERS:
+                # The new values aren't known, so the cached user needs to be read again. This is done after
+                # the write, so that a concurrent read can't put the old record back in the cache.
+                self.user_cache.invalidate(key['user_id'])
 
     def delete_item(self, table_id, key):
         """
@@ -107,7 +257,11 @@ class DataAccess:
         Returns whether or not the delete was successful
         """
         try:
-            response = self.get_table(table_id).delete_item(Key=key)
+            response = self.__execute(self.get_table(table_id), 'delete_item', Key=key)
+            if table_id == DataAccess.Tables.VARS:
+                self.__on_vars_changed(key['key'])
+            elif table_id == DataAccess.Tables.TRACKING:
+                self.__record_tracking_change(key['submission_id'], False)
             return True
         except Exception as e:
             message = "Unable to delete item!\n" + \
@@ -117,6 +271,9 @@ class DataAccess:
             print("Error: " + str(e))
             traceback.print_exc()
             return False
+        finally:
+            if table_id == DataAccess.Tables.USERS:
+                self.user_cache.invalidate(key['user_id'])
 
     def query(self, table_id, key_condition_expr):
         """
@@ -125,7 +282,7 @@ class DataAccess:
         key_condition_expr: The KeyConditionExpression to query with
         """
         try:
-            return self.get_table(table_id).query(KeyConditionExpression=key_condition_expr)
+            return self.__execute(self.get_table(table_id), 'query', KeyConditionExpression=key_condition_expr)
         except Exception as e:
             message = "Unable to query table: " + self.tableIdToString(table_id) + \
                 "table:\n" + "Key condition expr: " + str(key_condition_expr)
@@ -134,17 +291,184 @@ class DataAccess:
             traceback.print_exc()
             return None
 
-    def scan(self, table_id):
+    def query_index(self, table_id, index_name, key_condition_expr, filter_expr=None, attributes=None):
+        """
+        Queries a global secondary index of the AWS database, yielding the matching items as a generator.
+        Every page of the query is read.
+
+        table_id: One of the IDs defined in the Tables subclass
+        index_name: One of the index names defined in the Indexes subclass
+        key_condition_expr: The KeyConditionExpression to query the index with
+        filter_expr: (Optional) The FilterExpression to query with
+        attributes: (Optional) A list of the attribute names to read. All projected attributes are read if None.
+
+        If the query fails partway through, the error is printed and the generator stops early.
+        """
+        try:
+            for page in self.__query_pages(table_id, index_name, key_condition_expr, filter_expr, attributes):
+                for item in page:
+                    yield item
+        except Exception as e:
+            print("Unable to query index " + index_name + " of table: " + self.tableIdToString(table_id))
+            print("Key condition expr: " + str(key_condition_expr))
+            print("Error: " + str(e))
+            traceback.print_exc()
+
+    def scan(self, table_id, filter_expr=None):
         """
-        Scans the AWS database
+        Scans the AWS database. Every page of the scan is read, so the response contains
+        all of the items in the table even when the table is larger than 1 MB.
         table_id: One of the IDs defined in the Tables subclass
+        filter_expr: (Optional) The FilterExpression to scan with
+
+        returns: A response dictionary with the scanned items in 'Items', or None on failure
         """ 
         try:
-            return self.get_table(table_id).scan()
+            items = []
+            for page in self.__scan_pages(self.get_table(table_id), filter_expr=filter_expr):
+                items.extend(page)
+            return {'Items' : items, 'Count' : len(items)}
+        except Exception as e:
+            print("Unable to scan table: " + self.tableIdToString(table_id))
+            print("Error: " + str(e))
+            traceback.print_exc()
+            return None
+
+    def scan_items(self, table_id, filter_expr=None, attributes=None, total_segments=1, page_size=None):
+        """
+        Scans the AWS database, yielding the items one page at a time as a generator.
+        Only one page per worker is held in memory at a time, so this should be preferred
+        over scan() for large tables.
+
+        table_id: One of the IDs defined in the Tables subclass
+        filter_expr: (Optional) The FilterExpression to scan with
+        attributes: (Optional) A list of the attribute names to read. All attributes are read if None.
+        total_segments: The number of segments to scan. If greater than 1, each segment is
+                        scanned in parallel by its own worker thread.
+        page_size: (Optional) The maximum number of items to evaluate per page
+
+        If the scan fails partway through, the error is printed and raised, so that a partial scan
+        is never mistaken for the whole table.
+        """
+        try:
+            if total_segments <= 1:
+                for page in self.__scan_pages(self.get_table(table_id), filter_expr, attributes, page_size=page_size):
+                    for item in page:
+                        yield item
+            else:
+                for item in self.__parallel_scan(table_id, filter_expr, attributes, total_segments, page_size):
+                    yield item
         except Exception as e:
             print("Unable to scan table: " + self.tableIdToString(table_id))
             print("Error: " + str(e))
             traceback.print_exc()
+            raise
+
+    def batch_put_items(self, table_id, items, progress_callback=None):
+        """
+        Adds a list of items to the database with BatchWriteItem, 25 items per request.
+        Unprocessed items are retried with an exponential backoff, and the writes are paced by the
+        table's token bucket so that they don't exceed its provisioned write capacity.
+
+        Note that BatchWriteItem replaces entire items, so this should only be used for items that
+        are owned entirely by the caller.
+
+        table_id: One of the IDs defined in the Tables subclass
+        items: The list of boto3 item dictionaries to add
+        progress_callback: (Optional) Called as progress_callback(num_written, num_items) after each batch
+
+        returns: The number of items that were written successfully
+        """
+        table_name = self.tableIdToString(table_id)
+        num_written = 0
+        try:
+            for offset in range(0, len(items), DataAccess.BATCH_WRITE_SIZE):
+                batch = items[offset : offset + DataAccess.BATCH_WRITE_SIZE]
+                requests = [{'PutRequest' : {'Item' : item}} for item in batch]
+
+                num_unprocessed = self.__write_batch(table_name, requests)
+                num_written = num_written + len(batch) - num_unprocessed
+
+                if progress_callback is not None:
+                    progress_callback(num_written, len(items))
+        finally:
+            if table_id == DataAccess.Tables.USERS:
+                for item in items:
+                    self.user_cache.invalidate(item['user_id'])
+
+        if num_written < len(items):
+            print("Unable to write " + str(len(items) - num_written) + " items to table: " + table_name)
+        return num_written
+
+    def batch_update_existing_items(self, table_id, updates, table=None):
+        """
+        Sets attributes on several existing items. Items that no longer exist are left alone, rather than being created.
+
+        Each item is updated on its own with a conditional update, so that an item that has been removed isn't created again.
+
+        table_id: One of the IDs defined in the Tables subclass
+        updates: A list of (key, values) tuples, where key is the boto3 Key item for identifying the item,
+                 and values is a dictionary of the attributes to set
+        table: (Optional) The table to write to, such as one returned by worker_table for a worker thread.
+               By default, the table shared by the calls of this DataAccess is used.
+
+        returns: A list with the result of each update: True if the item was updated, False if the item
+                 doesn't exist, and None if the update failed
+        """
+        try:
+            return [self.__update_existing_item(table_id, key, values, table) for key, values in updates]
+        finally:
+            if table_id == DataAccess.Tables.USERS:
+                for key, values in updates:
+                    self.user_cache.invalidate(key['user_id'])
+
+    def transact_update_items(self, updates):
+        """
+        Updates several items in a single TransactWriteItems request. Either every update succeeds, or none of them do.
+
+        updates: A list of dictionaries, one per item to update, with the following keys:
+            'table_id': One of the IDs defined in the Tables subclass
+            'key': The boto3 Key item for identifying the item to update
+            'update_expr': The UpdateExpression for updating the item
+            'expr_attr_vals': The ExpressionAttributeValues for the update and condition expressions
+            'expr_attr_names': (Optional) The ExpressionAttributeNames for the update and condition expressions
+            'condition_expr': (Optional) A ConditionExpression string that must hold for the item to be updated
+
+        Returns True if the transaction succeeded, False if it was cancelled because a condition didn't hold
+        or another request changed one of the items, and None if the request failed for any other reason.
+        """
+        transact_items = []
+        for update in updates:
+            update_request = {
+                'TableName' : self.tableIdToString(update['table_id']),
+                'Key' : update['key'],
+                'UpdateExpression' : update['update_expr'],
+                'ExpressionAttributeValues' : update['expr_attr_vals']
+            }
+            if update.get('expr_attr_names') is not None:
+                update_request['ExpressionAttributeNames'] = update['expr_attr_names']
+            if update.get('condition_expr') is not None:
+                update_request['ConditionExpression'] = update['condition_expr']
+            transact_items.append({'Update' : update_request})
+
+        try:
+            written = [update['expr_attr_vals'] for update in updates]
+            self.__instrument(transact_items[0]['Update']['TableName'], 'transact_write_items',
+                lambda: self.backend.transact_write_items(transact_items, 'TOTAL'), written)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'TransactionCanceledException':
+                print("Transaction cancelled: " + str(e))
+                return False
+
+            print("Unable to write transaction:\n" + str(transact_items))
+            print("Error: " + str(e))
+            traceback.print_exc()
+            return None
+        finally:
+            for update in updates:
+                if update['table_id'] == DataAccess.Tables.USERS:
+                    self.user_cache.invalidate(update['key']['user_id'])
 
     def describe_table(self, table_id):
         """
@@ -152,7 +476,8 @@ class DataAccess:
         table_id: One of the IDs defined in the Tables subclass
         """
         try:
-            return self.client.describe_table(TableName = self.tableIdToString(table_id))
+            table_name = self.tableIdToString(table_id)
+            return self.__instrument(table_name, 'describe_table', lambda: self.backend.describe_table(table_name))
         except Exception as e:
             print("Unable to get table description: " + self.tableIdToString(table_id))
             print("Error: " + str(e))
@@ -163,10 +488,54 @@ class DataAccess:
     ###                      CONVENIENCE FUNCTIONS                            ###
     #############################################################################
 
+    def caller(self, name):
+        """
+        Returns a context manager that attributes the database calls made by the current thread to the
+        given caller, such as the name of a feature. Used for breaking down the metrics by caller.
+        """
+        return self.metrics.caller(name)
+
+    def cache_stats(self):
+        """
+        Returns the counters of the user and variable caches
+        """
+        return {'users' : self.user_cache.stats(), 'vars' : self.vars_cache.stats()}
+
+    def get_provisioned_capacity(self, table_id):
+        """
+        Returns the provisioned capacity of the table as a dictionary with 'read' and 'write' keys,
+        or None if the table description is unavailable. On-demand tables have 0 read and write capacity.
+        """
+        response = self.describe_table(table_id)
+        if response is None:
+            return None
+
+        throughput = response['Table'].get('ProvisionedThroughput', {})
+        return {
+            'read' : int(throughput.get('ReadCapacityUnits', 0)),
+            'write' : int(throughput.get('WriteCapacityUnits', 0))
+        }
+
+    @staticmethod
+    def estimate_write_units(item):
+        """
+        Returns an estimate of the write capacity units consumed by writing the item.
+        Each write unit covers up to 1 KB of item data.
+        """
+        return max(1, int(math.ceil(len(str(item)) / 1024.0)))
+
     def get_variable(self, var_name):
         """
-        Shortcut method for getting the value of a variable defined in the Vars table
+        Shortcut method for getting the value of a variable defined in the Vars table.
+        The value is served from the variable cache if the Vars table hasn't changed since it was cached.
         """
+        self.__check_vars_version()
+        ttl = DataAccess.VARS_CACHE_TTLS.get(var_name, DataAccess.VARS_CACHE_DEFAULT_TTL)
+        if ttl > 0:
+            is_cached, value = self.vars_cache.lookup(var_name)
+            if is_cached:
+                return value
+
         key = {"key" : var_name}
         response = self.get_item(DataAccess.Tables.VARS, key)
 
@@ -175,12 +544,21 @@ class DataAccess:
             if not 'Item' in response:
                 print("No such variable: " + var_name)
                 return None
-            # If the variable exists, return it
+            # If the variable exists, cache and return it
             value = response['Item']['val']
+            self.vars_cache.put(var_name, value, ttl=ttl)
             return value
         else:
             return None
 
+    def refresh_variables(self):
+        """
+        Discards every cached variable, so that the next reads come from the Vars table
+        """
+        self.vars_cache.clear()
+        self.vars_version = None
+        self.last_vars_version_check = 0
+
     def set_variable(self, var_name, var_value):
         """
         Shortcut method for setting the value of a variable defined in the Vars table
@@ -189,7 +567,9 @@ class DataAccess:
             "key" : var_name,
             "val" : var_value
         }
-        self.put_item(DataAccess.Tables.VARS, item)
+        if self.put_item(DataAccess.Tables.VARS, item):
+            ttl = DataAccess.VARS_CACHE_TTLS.get(var_name, DataAccess.VARS_CACHE_DEFAULT_TTL)
+            self.vars_cache.put(var_name, var_value, ttl=ttl)
 
     def create_new_user(self, redditor):
         """
@@ -215,22 +595,574 @@ class DataAccess:
             return False
 
 
+    def get_user(self, user_id):
+        """
+        Returns the item from the Users table for the given user ID, or None if there is no such user.
+        The item is served from the user cache when possible, and read from the database otherwise.
+        """
+        is_cached, user = self.user_cache.lookup(user_id)
+        if is_cached:
+            return user
+
+        # Use a consistent read, so that a stale user isn't cached right after it's been updated
+        response = self.get_item(DataAccess.Tables.USERS, {'user_id' : user_id}, consistent_read=True)
+        if response is None:
+            return None # The read failed, so don't cache anything
+
+        user = response.get('Item') # None if the user doesn't exist
+        self.user_cache.put(user_id, user)
+        return user
+
+    def update_user_score(self, user_id, submission_delta=0, distribution_delta=0):
+        """
+        Atomically adds to the submission and distribution scores of a user. The total score is
+        updated by the sum of the two, in the same request.
+
+        user_id: The ID of the user to update
+        submission_delta: The amount to add to the submission score. May be negative.
+        distribution_delta: The amount to add to the distribution score. May be negative.
+
+        Returns a dictionary with the new 'submission_score', 'distribution_score' and 'total_score'
+        of the user, or None if there's no such user or the update failed. ADD would otherwise create
+        a record without a username for a user that doesn't exist, so the update is conditional on the user existing.
+        """
+        key = {'user_id' : user_id}
+        update_expr = "ADD submission_score :sub, distribution_score :dist, total_score :tot"
+        expr_attrs = {
+            ":sub" : decimal.Decimal(submission_delta),
+            ":dist" : decimal.Decimal(distribution_delta),
+            ":tot" : decimal.Decimal(submission_delta + distribution_delta)
+        }
+        return self.update_item(DataAccess.Tables.USERS, key, update_expr, expr_attrs, return_values="UPDATED_NEW",
+            condition_expr="attribute_exists(user_id)")
+
+    def get_tracking_changes(self, since_version):
+        """
+        Reads the journal of items added to and removed from the Tracking table.
+
+        since_version: The journal version that the caller is up to date with, or None
+
+        Returns a pair (version, changes), where version is the current journal version, and changes is a
+        list of (submission_id, is_added) pairs for the changes after since_version, oldest first.
+        changes is None if the journal doesn't go back to since_version, in which case the caller needs to
+        rescan the table. Returns None if the journal couldn't be read.
+        """
+        response = self.get_item(DataAccess.Tables.VARS, {"key" : DataAccess.TRACKING_JOURNAL_KEY}, consistent_read=True)
+        if response is None:
+            return None
+
+        journal = response.get('Item', {})
+        base_version = int(journal.get('base_version', 0))
+        entries = journal.get('entries', [])
+        version = base_version + len(entries)
+        if since_version is None or since_version < base_version or since_version > version:
+            return (version, None)
+
+        # Each entry is the submission ID, prefixed with '+' if it was added or '-' if it was removed
+        changes = [(entry[1:], entry[0] == '+') for entry in entries[since_version - base_version:]]
+        return (version, changes)
+
+    def get_tracked_items_by_author(self, author_id):
+        """
+        Returns a list of the items in the Tracking table that were posted by the given author.
+
+        The items are looked up through the author_id index, so the cost depends only on the number
+        of items that the author has. If the index hasn't been created, the Tracking table is scanned instead.
+        Items read from the index only contain the submission_id, author_id, score and is_example fields.
+        """
+        try:
+            items = []
+            for page in self.__query_pages(DataAccess.Tables.TRACKING, DataAccess.Indexes.TRACKING_BY_AUTHOR,
+                Key('author_id').eq(author_id)):
+                items.extend(page)
+            return items
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ['ValidationException', 'ResourceNotFoundException']:
+                raise
+
+            # The index doesn't exist yet. Tools/CreateTrackingIndexes.py creates it.
+            print("No index " + DataAccess.Indexes.TRACKING_BY_AUTHOR + " for table " + \
+                self.tableIdToString(DataAccess.Tables.TRACKING) + ", scanning instead")
+            return list(self.scan_items(DataAccess.Tables.TRACKING, filter_expr=Attr('author_id').eq(author_id)))
+
+    def get_score_history(self, submission_id):
+        """
+        Returns the list of (timestamp, score) samples recorded by the Tracker for a submission, in order of time,
+        or None if the history couldn't be read
+        """
+        try:
+            points = []
+            for page in self.__query_pages(DataAccess.Tables.SCORE_HISTORY, None, Key('submission_id').eq(submission_id)):
+                for item in page:
+                    points.extend(ScoreSeries.decode(item['data']).points())
+            return points
+        except Exception as e:
+            print("Unable to read score history for: " + str(submission_id))
+            print("Error: " + str(e))
+            traceback.print_exc()
+            return None
+
     def is_user(self, redditor):
         """
         Returns true if the given redditor is a user in the DynamoDB database.
         """
-        
-        # Query the table to get any user with a user_id matching the author's id
-        response = self.query(DataAccess.Tables.USERS, Key('user_id').eq(redditor.id))
-        num_matches = len(response['Items'])
-        
-        # If there is a match, then the author is already a user
-        return num_matches > 0
+        return self.get_user(redditor.id) is not None
 
     ###########################################################################
     ###                    Private Helper Functions                         ###
     ###########################################################################
 
+    def __query_pages(self, table_id, index_name, key_condition_expr, filter_expr=None, attributes=None):
+        """
+        Helper function for query_index. Yields the items of each page of the query,
+        following LastEvaluatedKey until every matching item has been read.
+        If index_name is None, the table itself is queried.
+        """
+        query_args = {'KeyConditionExpression' : key_condition_expr}
+        if index_name is not None:
+            query_args['IndexName'] = index_name
+        if filter_expr is not None:
+            query_args['FilterExpression'] = filter_expr
+        if attributes is not None:
+            query_args.update(DataAccess.__projection_args(attributes))
+
+        table = self.get_table(table_id)
+        while True:
+            response = self.__execute(table, 'query', **query_args)
+            yield response['Items']
+
+            if not 'LastEvaluatedKey' in response:
+                return # This was the last page
+            query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    @staticmethod
+    def __projection_args(attributes):
+        """
+        Helper function that returns the ProjectionExpression arguments for reading the given attribute names.
+        Placeholders are used for every attribute, so that reserved words can be projected.
+        """
+        names = {}
+        for i in range(0, len(attributes)):
+            names['#attr' + str(i)] = attributes[i]
+        return {
+            'ProjectionExpression' : ", ".join(sorted(names.keys())),
+            'ExpressionAttributeNames' : names
+        }
+
+    def __scan_pages(self, table, filter_expr=None, attributes=None, segment=None, total_segments=None, page_size=None):
+        """
+        Helper function for scan and scan_items. Yields the items of each page of the scan,
+        following LastEvaluatedKey until the table (or segment) has been read completely.
+
+        table: The boto3 Table to scan
+        segment, total_segments: The segment of a parallel scan to read, if any
+        """
+        scan_args = {}
+        if filter_expr is not None:
+            scan_args['FilterExpression'] = filter_expr
+        if attributes is not None:
+            scan_args.update(DataAccess.__projection_args(attributes))
+        if segment is not None:
+            scan_args['Segment'] = segment
+            scan_args['TotalSegments'] = total_segments
+        if page_size is not None:
+            scan_args['Limit'] = page_size
+
+        while True:
+            response = self.__execute(table, 'scan', **scan_args)
+            yield response['Items']
+
+            if not 'LastEvaluatedKey' in response:
+                return # This was the last page
+            scan_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def __parallel_scan(self, table_id, filter_expr, attributes, total_segments, page_size):
+        """
+        Helper function for scan_items. Scans each segment of the table on its own worker thread,
+        and yields the items as the pages arrive.
+
+        The pages are passed through a bounded queue, so a worker waits for the consumer to catch up
+        instead of reading ahead of it. If a worker fails, its exception is passed through the queue
+        and raised by the consumer.
+        """
+        pages = queue.Queue(maxsize=total_segments)
+        stop_event = threading.Event()
+        table_name = self.tableIdToString(table_id)
+        done_marker = object() # Put on the queue by each worker when its segment is finished
+        caller = self.metrics.current_caller() # The workers' calls are attributed to the consumer's caller
+
+        def put_page(page):
+            # Returns False if the consumer stopped reading before the page could be queued
+            while not stop_event.is_set():
+                try:
+                    pages.put(page, timeout=DataAccess.SCAN_QUEUE_TIMEOUT)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def scan_segment(segment):
+            try:
+                table = self.backend.worker_table(table_name)
+                with self.metrics.caller(caller):
+                    for page in self.__scan_pages(table, filter_expr, attributes, segment, total_segments, page_size):
+                        if not put_page(page):
+                            return
+            except Exception as e:
+                print("Unable to scan segment " + str(segment) + " of table: " + table_name)
+                put_page(e)
+            finally:
+                put_page(done_marker)
+
+        executor = ThreadPoolExecutor(max_workers=total_segments)
+        try:
+            for segment in range(0, total_segments):
+                executor.submit(scan_segment, segment)
+
+            remaining_workers = total_segments
+            while remaining_workers > 0:
+                page = pages.get()
+                if page is done_marker:
+                    remaining_workers = remaining_workers - 1
+                    continue
+                if isinstance(page, Exception):
+                    raise page # The segment couldn't be read, so the scan is incomplete
+                for item in page:
+                    yield item
+        finally:
+            # Release any workers that are still waiting, in case the consumer stopped early
+            stop_event.set()
+            executor.shutdown(wait=False)
+
+    def __check_vars_version(self):
+        """
+        Helper function for get_variable. Reads the version of the Vars table if it hasn't been checked
+        recently, and discards the cached variables if another process has changed the table.
+        """
+        cur_time = time.time()
+        if cur_time < self.last_vars_version_check + DataAccess.VARS_VERSION_CHECK_INTERVAL:
+            return
+        self.last_vars_version_check = cur_time
+
+        response = self.get_item(DataAccess.Tables.VARS, {"key" : DataAccess.VARS_VERSION_KEY})
+        if response is None:
+            # The version is unknown, so the cached variables can't be trusted
+            self.vars_cache.clear()
+            return
+
+        version = response['Item']['val'] if 'Item' in response else 0
+        if version != self.vars_version:
+            self.vars_cache.clear()
+            self.vars_version = version
+
+    def __on_vars_changed(self, var_name):
+        """
+        Helper function called after a variable in the Vars table is written. Discards the cached value
+        and increments the version of the Vars table, so that other processes discard theirs as well.
+        """
+        self.vars_cache.invalidate(var_name)
+        if var_name == DataAccess.VARS_VERSION_KEY:
+            return
+
+        try:
+            response = self.__execute(self.vars_table, 'update_item',
+                Key={"key" : DataAccess.VARS_VERSION_KEY},
+                UpdateExpression="ADD val :one",
+                ExpressionAttributeValues={":one" : decimal.Decimal(1)},
+                ReturnValues="UPDATED_NEW")
+            new_version = response['Attributes']['val']
+
+            if self.vars_version is not None and new_version == self.vars_version + 1:
+                # Nobody else has changed the table since it was last checked, so the other
+                # cached variables are still valid
+                self.vars_version = new_version
+            else:
+                self.vars_cache.clear()
+                self.vars_version = new_version
+        except Exception as e:
+            print("Unable to update the version of the Vars table")
+            print("Error: " + str(e))
+            traceback.print_exc()
+            self.vars_cache.clear()
+
+    def __record_tracking_change(self, submission_id, is_added):
+        """
+        Helper function called after an item is added to or removed from the Tracking table.
+        Appends the change to the tracking journal, and trims the oldest changes once the journal is full.
+
+        The version of the journal is its base_version plus the number of entries, so appending an
+        entry and trimming old ones are both single updates.
+        """
+        key = {"key" : DataAccess.TRACKING_JOURNAL_KEY}
+        try:
+            response = self.__execute(self.vars_table, 'update_item', Key=key,
+                UpdateExpression="SET entries = list_append(if_not_exists(entries, :empty), :entry), " + \
+                    "base_version = if_not_exists(base_version, :zero)",
+                ExpressionAttributeValues={
+                    ":empty" : [],
+                    ":entry" : [("+" if is_added else "-") + submission_id],
+                    ":zero" : decimal.Decimal(0)
+                },
+                ReturnValues="ALL_NEW")
+            journal = response['Attributes']
+
+            num_trimmed = len(journal['entries']) - DataAccess.TRACKING_JOURNAL_SIZE
+            if num_trimmed < DataAccess.TRACKING_JOURNAL_TRIM_SLACK:
+                return
+
+            # The condition makes sure that no other writer has trimmed the journal in the meantime
+            self.__execute(self.vars_table, 'update_item', Key=key,
+                UpdateExpression="REMOVE " + ", ".join("entries[" + str(i) + "]" for i in range(0, num_trimmed)) + \
+                    " SET base_version = :new_base",
+                ConditionExpression="base_version = :base",
+                ExpressionAttributeValues={
+                    ":base" : journal['base_version'],
+                    ":new_base" : journal['base_version'] + num_trimmed
+                })
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                print("Unable to record tracking change for: " + str(submission_id))
+                print("Error: " + str(e))
+        except Exception as e:
+            print("Unable to record tracking change for: " + str(submission_id))
+            print("Error: " + str(e))
+            traceback.print_exc()
+
+    def __write_batch(self, table_name, requests):
+        """
+        Helper function for batch_put_items. Writes a single batch of put requests,
+        retrying any unprocessed items with a jittered exponential backoff.
+
+        returns: The number of items that could not be written
+        """
+        for attempt in range(0, DataAccess.MAX_BATCH_RETRIES + 1):
+            # Unprocessed items mean that the table is over its capacity
+            if attempt > 0 and not self.__back_off(table_name, attempt):
+                break
+            try:
+                written = [request['PutRequest']['Item'] for request in requests]
+                response = self.__instrument(table_name, 'batch_write_item',
+                    lambda: self.backend.batch_write_item({table_name : requests}, 'TOTAL'), written)
+                requests = response.get('UnprocessedItems', {}).get(table_name, [])
+            except Exception as e:
+                # Throttling errors have already been retried by __instrument
+                print("Error writing batch to table: " + table_name)
+                print("Error: " + str(e))
+                traceback.print_exc()
+                return len(requests)
+
+            if len(requests) == 0:
+                return 0
+
+        return len(requests)
+
+    def __update_existing_item(self, table_id, key, values, table=None):
+        """
+        Helper function for batch_update_existing_items. Sets attributes on a single item with a conditional update.
+
+        returns: True if the item was updated, False if it doesn't exist, and None if the update failed
+        """
+        names = {}
+        expr_vals = {}
+        assignments = []
+        for i, (name, value) in enumerate(sorted(values.items())):
+            names['#a' + str(i)] = name
+            expr_vals[':a' + str(i)] = value
+            assignments.append('#a' + str(i) + ' = :a' + str(i))
+        names['#key'] = sorted(key.keys())[0]
+
+        try:
+            self.__execute(table if table is not None else self.get_table(table_id), 'update_item', Key=key,
+                UpdateExpression='SET ' + ', '.join(assignments), ConditionExpression='attribute_exists(#key)',
+                ExpressionAttributeNames=names, ExpressionAttributeValues=expr_vals)
+            if table_id == DataAccess.Tables.VARS:
+                self.__on_vars_changed(key['key'])
+            return True
+        except Exception as e:
+            if Throttling.error_code(e) == 'ConditionalCheckFailedException':
+                return False
+            print("Unable to update item!\n    Table: " + self.tableIdToString(table_id) + "\n    Key: " + str(key))
+            print("Error: " + str(e))
+            traceback.print_exc()
+            return None
+
+    def __execute(self, table, operation, **request):
+        """
+        Helper function that calls a method of a table with the given request arguments, requesting
+        the consumed capacity, and records the metrics of the call
+
+        table: The boto3 Table (or stand-in table) to call
+        operation: The name of the method to call, such as 'get_item'
+        """
+        written = None
+        if operation == 'put_item':
+            written = [request['Item']]
+        elif operation in ['update_item', 'delete_item']:
+            written = [request.get('ExpressionAttributeValues', request['Key'])]
+
+        return self.__instrument(table.name, operation,
+            lambda: getattr(table, operation)(ReturnConsumedCapacity='TOTAL', **request), written)
+
+    def __instrument(self, table_name, operation, call, written=None):
+        """
+        Helper function that makes a database call, and records its latency, consumed capacity,
+        item count and payload size under the table, the operation and the current caller.
+        Errors are recorded and raised again.
+
+        call: A function that makes the call and returns the response
+        written: For writes, the list of items (or expression values) that the call sends
+        """
+        is_write = operation in DataAccess.WRITE_OPERATIONS
+        token_bucket = None
+        estimated_units = 1
+        if operation != 'describe_table':
+            token_bucket = self.__get_token_bucket(table_name, is_write)
+            if written is not None:
+                estimated_units = sum(DataAccess.estimate_write_units(item) for item in written)
+
+        can_wait = self.__can_wait()
+        attempt = 0
+        while True:
+            attempt = attempt + 1
+            if token_bucket is not None:
+                token_bucket.acquire(estimated_units, wait=can_wait)
+
+            begin_time = time.time()
+            try:
+                response = call()
+                break
+            except Exception as e:
+                retry = can_wait and Throttling.is_retryable(e) and attempt < DataAccess.MAX_CALL_ATTEMPTS
+                self.metrics.record(table_name, operation, latency_ms=(time.time() - begin_time) * 1000,
+                    error=not retry, retried=retry)
+                if token_bucket is not None:
+                    token_bucket.settle(estimated_units, 0) # Failed calls don't consume any capacity
+                    if Throttling.is_throttling(e):
+                        token_bucket.on_throttled()
+                if not retry:
+                    raise
+                time.sleep(Throttling.backoff_delay(attempt, DataAccess.RETRY_BASE_DELAY, DataAccess.RETRY_MAX_DELAY))
+        latency_ms = (time.time() - begin_time) * 1000
+
+        if written is not None:
+            items = written
+        elif 'Items' in response:
+            items = response['Items']
+        elif 'Item' in response:
+            items = [response['Item']]
+        else:
+            items = []
+        payload_bytes = sum(DynamoExpressions.item_size(item) for item in items)
+
+        # The consumed capacity is a list for requests that span several tables
+        consumed = response.get('ConsumedCapacity', [])
+        if isinstance(consumed, dict):
+            consumed = [consumed]
+        units_by_table = {table_name : 0}
+        for entry in consumed:
+            units_by_table[entry['TableName']] = units_by_table.get(entry['TableName'], 0) + entry.get('CapacityUnits', 0)
+
+        if token_bucket is not None:
+            token_bucket.settle(estimated_units, units_by_table[table_name])
+            token_bucket.on_success()
+
+        for name, units in units_by_table.items():
+            is_primary = name == table_name
+            self.metrics.record(name, operation,
+                latency_ms=latency_ms if is_primary else None,
+                read_units=0 if is_write else units,
+                write_units=units if is_write else 0,
+                items=len(items) if is_primary else 0,
+                payload_bytes=payload_bytes if is_primary else 0)
+
+        summary = self.metrics.summary_line(only_if_due=True)
+        if summary is not None:
+            print(summary + " | " + self.__describe_cache_stats())
+        return response
+
+    @staticmethod
+    def database_process_count(base_name):
+        """
+        Returns the number of processes that share the capacity of the table with the given base name.
+        This is 1 for the tables that only the bot uses, and the number of Tracker shards for the tables that
+        only the Trackers write to. For every other table, it's IMT_DATABASE_PROCESSES if it's set, or else
+        the bot, its listeners, and each Tracker shard.
+        """
+        tracker_count = max(1, int(os.environ.get('IMT_TRACKER_SHARDS', 1)))
+        if base_name in DataAccess.BOT_ONLY_TABLES:
+            return 1
+        elif base_name in DataAccess.TRACKER_ONLY_TABLES:
+            return tracker_count
+        elif DataAccess.PROCESS_COUNT_ENV_VAR in os.environ:
+            return max(1, int(os.environ[DataAccess.PROCESS_COUNT_ENV_VAR]))
+        return DataAccess.OTHER_PROCESS_COUNT + tracker_count
+
+    def __can_wait(self):
+        """
+        Helper function that returns whether the current thread may wait for throttling
+        """
+        return self.wait_on_main_thread or threading.current_thread() is not threading.main_thread()
+
+    def __back_off(self, table_name, attempt):
+        """
+        Helper function for batch_put_items. Slows down the table's writes, and waits before retrying
+        the throttled part of a batch. Returns False if the current thread can't wait, so the retry should be skipped.
+        """
+        self.__get_token_bucket(table_name, True).on_throttled()
+        if not self.__can_wait():
+            return False
+        time.sleep(Throttling.backoff_delay(attempt, DataAccess.RETRY_BASE_DELAY, DataAccess.RETRY_MAX_DELAY))
+        return True
+
+    def __get_token_bucket(self, table_name, is_write):
+        """
+        Helper function for __instrument. Returns the token bucket for the reads or writes of a table,
+        sizing it from the table's provisioned capacity if it hasn't been read recently.
+        """
+        with self.token_buckets_lock:
+            key = (table_name, is_write)
+            if not key in self.token_buckets:
+                # The bucket doesn't limit anything until the capacity has been read
+                self.token_buckets[(table_name, False)] = Throttling.TokenBucket(0)
+                self.token_buckets[(table_name, True)] = Throttling.TokenBucket(0)
+
+            cur_time = time.time()
+            needs_refresh = cur_time >= self.capacity_check_times.get(table_name, 0) + DataAccess.CAPACITY_REFRESH_INTERVAL
+            if needs_refresh:
+                self.capacity_check_times[table_name] = cur_time
+
+        if needs_refresh:
+            try:
+                response = self.__instrument(table_name, 'describe_table', lambda: self.backend.describe_table(table_name))
+                throughput = response['Table'].get('ProvisionedThroughput', {})
+                for bucket_is_write, units_name in [(False, 'ReadCapacityUnits'), (True, 'WriteCapacityUnits')]:
+                    bucket = self.token_buckets[(table_name, bucket_is_write)]
+                    # The other processes use the same capacity, but their calls aren't seen here
+                    units = int(throughput.get(units_name, 0)) / float(self.table_process_counts.get(table_name, 1))
+                    if units != bucket.provisioned_rate:
+                        bucket.set_provisioned_rate(units)
+            except Exception as e:
+                print("Unable to read the provisioned capacity of table: " + table_name)
+                print("Error: " + str(e))
+
+        return self.token_buckets[(table_name, is_write)]
+
+    def __describe_cache_stats(self):
+        """
+        Helper function that returns the hit rates of the in-process caches, for the metrics summary
+        """
+        parts = []
+        for cache_name, stats in self.cache_stats().items():
+            parts.append("{} cache {:.0%} hit of {}".format(cache_name, stats['hit_rate'], stats['hits'] + stats['misses']))
+        return ", ".join(parts)
+
+    def __open_table(self, base_name, table_suffix):
+        """
+        Helper function for __init__. Opens the table with the given base name through the storage backend.
+        """
+        self.table_process_counts[base_name + table_suffix] = DataAccess.database_process_count(base_name)
+        return self.backend.table(base_name + table_suffix, DataAccess.TABLE_SCHEMAS[base_name])
+
     # Helper function
     def get_table(self, table_id):
         if table_id == DataAccess.Tables.USERS:
@@ -241,9 +1173,20 @@ class DataAccess:
             return self.vars_table
         elif table_id == DataAccess.Tables.TEMPLATE_REQUESTS:
             return self.template_request_table
+        elif table_id == DataAccess.Tables.RANKINGS:
+            return self.rankings_table
+        elif table_id == DataAccess.Tables.SCORE_HISTORY:
+            return self.score_history_table
         else:
             raise RuntimeError("Bad Table Id: " + str(table_id))
 
+    def worker_table(self, table_id):
+        """
+        Returns a table for use by a single worker thread. The boto3 tables aren't thread safe,
+        so each worker that writes alongside other threads needs its own.
+        table_id: One of the IDs defined in the Tables subclass
+        """
+        return self.backend.worker_table(self.tableIdToString(table_id))
 
     def tableIdToString(self, id):
         """
@@ -258,6 +1201,10 @@ class DataAccess:
             return self.vars_table.name
         elif id == DataAccess.Tables.TEMPLATE_REQUESTS:
             return self.template_request_table.name
+        elif id == DataAccess.Tables.RANKINGS:
+            return self.rankings_table.name
+        elif id == DataAccess.Tables.SCORE_HISTORY:
+            return self.score_history_table.name
         else:
             print("Invalid ID for idToString: " + str(id))
             return "unknown"
@@ -270,3 +1217,12 @@ class DataAccess:
         TRACKING = 1
         VARS = 2
         TEMPLATE_REQUESTS = 3
+        RANKINGS = 4
+        SCORE_HISTORY = 5
+
+    class Indexes:
+        """
+        This helper class defines the names of the global secondary indexes that can be queried.
+        The indexes are created by Tools/CreateTrackingIndexes.py
+        """
+        TRACKING_BY_AUTHOR = "author_id-index" # Tracking items, partitioned by author_id
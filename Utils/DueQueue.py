@@ -0,0 +1,88 @@
+"""
+This module contains a priority queue of keys that are due at a given time
+"""
+import heapq
+import itertools
+
+class DueQueue:
+    """
+    A min-heap of keys, ordered by the time at which each key is next due.
+
+    Each key is scheduled at most once. Rescheduling or removing a key leaves its old heap entry
+    in place, and stale entries are skipped when they reach the top of the heap.
+    """
+
+    def __init__(self):
+        self.__heap = [] # Entries of (due_time, sequence_number, key)
+        self.__due_times = {} # Maps each scheduled key to its current due time
+        self.__sequence = itertools.count() # Breaks ties between keys with the same due time
+
+    def schedule(self, key, due_time):
+        """
+        Schedules the key to be due at the given time, replacing any previous due time for the key
+        """
+        self.__due_times[key] = due_time
+        heapq.heappush(self.__heap, (due_time, next(self.__sequence), key))
+
+        # Rebuild the heap if it's mostly made up of stale entries
+        if len(self.__heap) > 2 * len(self.__due_times) + 64:
+            self.__heap = [(self.__due_times[k], next(self.__sequence), k) for k in self.__due_times]
+            heapq.heapify(self.__heap)
+
+    def remove(self, key):
+        """
+        Removes the key from the queue, if it's scheduled
+        """
+        self.__due_times.pop(key, None)
+
+    def due_time(self, key):
+        """
+        Returns the time that the key is due, or None if it isn't scheduled
+        """
+        return self.__due_times.get(key)
+
+    def next_due_time(self):
+        """
+        Returns the earliest due time in the queue, or None if the queue is empty
+        """
+        self.__discard_stale()
+        return self.__heap[0][0] if len(self.__heap) > 0 else None
+
+    def pop_due(self, cur_time, limit=None):
+        """
+        Removes and returns the keys that are due at or before cur_time, earliest first
+
+        cur_time: The current time
+        limit: (Optional) The maximum number of keys to return
+        """
+        due_keys = []
+        while limit is None or len(due_keys) < limit:
+            self.__discard_stale()
+            if len(self.__heap) == 0 or self.__heap[0][0] > cur_time:
+                break
+            due_time, sequence, key = heapq.heappop(self.__heap)
+            del self.__due_times[key]
+            due_keys.append(key)
+        return due_keys
+
+    def keys(self):
+        """
+        Returns a list of every scheduled key, in no particular order
+        """
+        return list(self.__due_times.keys())
+
+    def __contains__(self, key):
+        return key in self.__due_times
+
+    def __len__(self):
+        return len(self.__due_times)
+
+    def __discard_stale(self):
+        """
+        Pops entries off the top of the heap that were removed or rescheduled
+        """
+        while len(self.__heap) > 0:
+            due_time, sequence, key = self.__heap[0]
+            if self.__due_times.get(key) == due_time:
+                return
+            heapq.heappop(self.__heap)
@@ -0,0 +1,644 @@
+"""
+This module evaluates DynamoDB expressions against items held in memory. It's used by the
+stand-in storage backends in Utils.StorageBackends, so that DataAccess can run without AWS.
+
+Supported expressions:
+- Condition expressions, as strings or as boto3.dynamodb.conditions objects (Key and Attr)
+- Update expressions: SET (including +, -, if_not_exists and list_append), REMOVE, ADD and DELETE
+- Projection expressions
+"""
+from boto3.dynamodb.conditions import AttributeBase, ConditionBase
+from botocore.exceptions import ClientError
+import decimal
+import re
+
+class _Missing:
+    """ The value of a path that doesn't exist in an item """
+    def __repr__(self):
+        return "MISSING"
+
+MISSING = _Missing()
+
+# Functions that evaluate to a boolean, and can be used as a whole condition
+CONDITION_FUNCTIONS = ['attribute_exists', 'attribute_not_exists', 'attribute_type', 'begins_with', 'contains']
+
+COMPARATORS = ['=', '<>', '<', '<=', '>', '>=']
+
+_TOKEN_REGEX = re.compile(r"\s*(?:(<>|<=|>=|[=<>+\-.,()\[\]])|(#[A-Za-z0-9_]+)|(:[A-Za-z0-9_]+)|([0-9]+)|([A-Za-z_][A-Za-z0-9_]*))")
+
+
+def validation_error(message, operation_name="Expression"):
+    """
+    Returns the ClientError that DynamoDB raises for an invalid request
+    """
+    return ClientError({'Error' : {'Code' : 'ValidationException', 'Message' : message}}, operation_name)
+
+
+###########################################################################
+###                          Value helpers                              ###
+###########################################################################
+
+def normalize(value):
+    """
+    Converts a value from the caller into the form that's stored in items.
+    Integers become Decimals, like they do when they're read back from DynamoDB.
+    """
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, int):
+        return decimal.Decimal(value)
+    if isinstance(value, float):
+        raise TypeError("Float types are not supported. Use Decimal types instead.")
+    if isinstance(value, dict):
+        return {k : normalize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [normalize(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return set(normalize(v) for v in value)
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    return value
+
+def value_type(value):
+    """
+    Returns the DynamoDB type descriptor for a value
+    """
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return 'BOOL'
+    if isinstance(value, (int, decimal.Decimal)):
+        return 'N'
+    if isinstance(value, str):
+        return 'S'
+    if isinstance(value, bytes):
+        return 'B'
+    if isinstance(value, dict):
+        return 'M'
+    if isinstance(value, list):
+        return 'L'
+    if isinstance(value, set):
+        if len(value) == 0:
+            return 'SS'
+        member_type = value_type(next(iter(value)))
+        return {'N' : 'NS', 'S' : 'SS', 'B' : 'BS'}[member_type]
+    raise TypeError("Unsupported type: " + str(type(value)))
+
+def item_size(value):
+    """
+    Returns an estimate of the number of bytes that DynamoDB counts for a value or item
+    """
+    if isinstance(value, dict):
+        return 3 + sum(len(str(k).encode('utf-8')) + item_size(v) for k, v in value.items())
+    if isinstance(value, (list, set)):
+        return 3 + sum(item_size(v) for v in value)
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, (int, decimal.Decimal)):
+        return 1 + (len(str(value).lstrip('-').replace('.', '')) + 1) // 2
+    return 1 # Booleans and nulls
+
+def compare(left, operator, right):
+    """
+    Compares two values the way DynamoDB does. Values of different types never compare as equal or ordered.
+    """
+    if left is MISSING or right is MISSING:
+        return operator == '<>' and not (left is MISSING and right is MISSING)
+
+    left_type = value_type(left)
+    right_type = value_type(right)
+    if operator == '=':
+        return left_type == right_type and left == right
+    if operator == '<>':
+        return left_type != right_type or left != right
+
+    if left_type != right_type or left_type not in ['N', 'S', 'B']:
+        return False
+    if operator == '<':
+        return left < right
+    if operator == '<=':
+        return left <= right
+    if operator == '>':
+        return left > right
+    if operator == '>=':
+        return left >= right
+    raise validation_error("Invalid comparator: " + str(operator))
+
+
+###########################################################################
+###                            Paths                                    ###
+###########################################################################
+
+def parse_path_string(path_string):
+    """
+    Parses a plain attribute path, such as "gifts.sent" or "items[2]", into a list of path elements.
+    Used for the names of boto3 Key and Attr objects.
+    """
+    parser = _Parser(path_string, {}, {})
+    path = parser.parse_path(allow_placeholders=False)
+    parser.expect_end()
+    return path
+
+def get_path(item, path):
+    """
+    Returns the value at the path in the item, or MISSING if there is no such value
+    """
+    value = item
+    for element in path:
+        if isinstance(element, int):
+            if not isinstance(value, list) or element >= len(value):
+                return MISSING
+        elif not isinstance(value, dict) or not element in value:
+            return MISSING
+        value = value[element]
+    return value
+
+def set_path(item, path, value):
+    """
+    Sets the value at the path in the item. Every element of the path except the last one must exist.
+    """
+    parent = get_path(item, path[:-1])
+    last = path[-1]
+    if isinstance(last, int):
+        if not isinstance(parent, list):
+            raise validation_error("The document path provided in the update expression is invalid for update")
+        if last >= len(parent):
+            parent.append(value)
+        else:
+            parent[last] = value
+    else:
+        if not isinstance(parent, dict):
+            raise validation_error("The document path provided in the update expression is invalid for update")
+        parent[last] = value
+
+def remove_path(item, path):
+    """
+    Removes the value at the path in the item, if there is one
+    """
+    parent = get_path(item, path[:-1])
+    last = path[-1]
+    if isinstance(last, int):
+        if isinstance(parent, list) and last < len(parent):
+            del parent[last]
+    elif isinstance(parent, dict):
+        parent.pop(last, None)
+
+def project(item, paths):
+    """
+    Returns a copy of the item that only contains the values at the given paths
+    """
+    projected = {}
+    for path in paths:
+        value = get_path(item, path)
+        if value is MISSING:
+            continue
+        # Rebuild the containers along the path. List indexes are kept as map entries of the nearest container.
+        target = projected
+        for i in range(0, len(path) - 1):
+            element = path[i]
+            if not element in target:
+                target[element] = {}
+            target = target[element]
+        target[path[-1]] = value
+    return projected
+
+def parse_projection(projection_expr, names):
+    """
+    Parses a ProjectionExpression into a list of paths
+    """
+    parser = _Parser(projection_expr, names, {})
+    paths = [parser.parse_path()]
+    while parser.accept(','):
+        paths.append(parser.parse_path())
+    parser.expect_end()
+    return paths
+
+
+###########################################################################
+###                          Conditions                                 ###
+###########################################################################
+
+def evaluate_condition(condition, item, names=None, values=None):
+    """
+    Returns whether or not the condition holds for the item
+
+    condition: A condition expression string, or a boto3.dynamodb.conditions object
+    item: The item to evaluate against. Use an empty dictionary for an item that doesn't exist.
+    names: The ExpressionAttributeNames, for string conditions
+    values: The ExpressionAttributeValues, for string conditions
+    """
+    if condition is None:
+        return True
+    return _evaluate_node(parse_condition(condition, names, values), item)
+
+def parse_condition(condition, names=None, values=None):
+    """
+    Parses a condition expression string or boto3.dynamodb.conditions object into a condition node
+    """
+    if isinstance(condition, ConditionBase):
+        return _condition_object_to_node(condition)
+
+    parser = _Parser(condition, names or {}, values or {})
+    node = parser.parse_condition()
+    parser.expect_end()
+    return node
+
+def key_condition_values(condition, names=None, values=None):
+    """
+    Returns a dictionary of the attribute names that a key condition requires to be equal to a value.
+    Used to look up the partition key of a query.
+    """
+    equalities = {}
+    pending = [parse_condition(condition, names, values)]
+    while len(pending) > 0:
+        node = pending.pop()
+        if node[0] == 'and':
+            pending.extend(node[1:])
+        elif node[0] == 'compare' and node[2] == '=' and node[1][0] == 'path' and node[3][0] == 'value':
+            equalities[node[1][1][0]] = node[3][1]
+    return equalities
+
+def _condition_object_to_node(condition):
+    """
+    Converts a boto3.dynamodb.conditions object into the node form used by _evaluate_node
+    """
+    expression = condition.get_expression()
+    operator = expression['operator']
+    operands = []
+    for value in expression['values']:
+        if isinstance(value, ConditionBase) and value.expression_operator != 'size':
+            operands.append(_condition_object_to_node(value))
+        else:
+            operands.append(_operand_object_to_node(value))
+
+    if operator in COMPARATORS:
+        return ('compare', operands[0], operator, operands[1])
+    if operator == 'AND':
+        return ('and', operands[0], operands[1])
+    if operator == 'OR':
+        return ('or', operands[0], operands[1])
+    if operator == 'NOT':
+        return ('not', operands[0])
+    if operator == 'BETWEEN':
+        return ('between', operands[0], operands[1], operands[2])
+    if operator == 'IN':
+        # The values of an IN condition are given as a single list
+        return ('in', operands[0], [('value', normalize(v)) for v in expression['values'][1]])
+    return ('function', operator, operands)
+
+def _operand_object_to_node(value):
+    """
+    Helper function for _condition_object_to_node. Converts a single operand.
+    """
+    if isinstance(value, ConditionBase):
+        # Size is the only operand that is also a condition
+        return ('function', 'size', [_operand_object_to_node(value.get_expression()['values'][0])])
+    if isinstance(value, AttributeBase):
+        return ('path', parse_path_string(value.name))
+    return ('value', normalize(value))
+
+def _evaluate_node(node, item):
+    """
+    Evaluates a parsed condition node against the item
+    """
+    kind = node[0]
+    if kind == 'and':
+        return _evaluate_node(node[1], item) and _evaluate_node(node[2], item)
+    if kind == 'or':
+        return _evaluate_node(node[1], item) or _evaluate_node(node[2], item)
+    if kind == 'not':
+        return not _evaluate_node(node[1], item)
+    if kind == 'compare':
+        return compare(_evaluate_operand(node[1], item), node[2], _evaluate_operand(node[3], item))
+    if kind == 'between':
+        value = _evaluate_operand(node[1], item)
+        return compare(value, '>=', _evaluate_operand(node[2], item)) and \
+               compare(value, '<=', _evaluate_operand(node[3], item))
+    if kind == 'in':
+        value = _evaluate_operand(node[1], item)
+        return any(compare(value, '=', _evaluate_operand(candidate, item)) for candidate in node[2])
+    if kind == 'function':
+        return _evaluate_condition_function(node[1], node[2], item)
+    raise validation_error("Invalid condition: " + str(node))
+
+def _evaluate_condition_function(name, args, item):
+    """
+    Helper function for _evaluate_node. Evaluates one of the boolean condition functions.
+    """
+    if name == 'attribute_exists':
+        return _evaluate_operand(args[0], item) is not MISSING
+    if name == 'attribute_not_exists':
+        return _evaluate_operand(args[0], item) is MISSING
+    if name == 'attribute_type':
+        value = _evaluate_operand(args[0], item)
+        return value is not MISSING and value_type(value) == _evaluate_operand(args[1], item)
+    if name == 'begins_with':
+        value = _evaluate_operand(args[0], item)
+        prefix = _evaluate_operand(args[1], item)
+        return isinstance(value, (str, bytes)) and type(value) == type(prefix) and value.startswith(prefix)
+    if name == 'contains':
+        value = _evaluate_operand(args[0], item)
+        member = _evaluate_operand(args[1], item)
+        if isinstance(value, str):
+            return isinstance(member, str) and member in value
+        if isinstance(value, (list, set)):
+            return any(compare(v, '=', member) for v in value)
+        return False
+    raise validation_error("Invalid function name: " + name)
+
+def _evaluate_operand(node, item):
+    """
+    Returns the value of an operand node for the item
+    """
+    kind = node[0]
+    if kind == 'value':
+        return node[1]
+    if kind == 'path':
+        return get_path(item, node[1])
+    if kind == 'function':
+        name = node[1]
+        args = node[2]
+        if name == 'size':
+            value = _evaluate_operand(args[0], item)
+            if value is MISSING:
+                return MISSING
+            if isinstance(value, str):
+                return decimal.Decimal(len(value.encode('utf-8')))
+            return decimal.Decimal(len(value))
+        if name == 'if_not_exists':
+            value = _evaluate_operand(args[0], item)
+            return _evaluate_operand(args[1], item) if value is MISSING else value
+        if name == 'list_append':
+            first = _evaluate_operand(args[0], item)
+            second = _evaluate_operand(args[1], item)
+            if not isinstance(first, list) or not isinstance(second, list):
+                raise validation_error("Incorrect operand type for operator or function; operator or function: list_append")
+            return first + second
+        raise validation_error("Invalid function name: " + name)
+    if kind == 'arithmetic':
+        left = _evaluate_operand(node[1], item)
+        right = _evaluate_operand(node[3], item)
+        if left is MISSING or right is MISSING or value_type(left) != 'N' or value_type(right) != 'N':
+            raise validation_error("An operand in the update expression has an incorrect data type")
+        return left + right if node[2] == '+' else left - right
+    raise validation_error("Invalid operand: " + str(node))
+
+
+###########################################################################
+###                            Updates                                  ###
+###########################################################################
+
+def apply_update(update_expr, item, names=None, values=None):
+    """
+    Applies an update expression to the item in place
+
+    Returns the list of top-level attribute names that the update changed
+    """
+    parser = _Parser(update_expr, names or {}, values or {})
+    actions = parser.parse_update()
+    parser.expect_end()
+
+    # Every operand is evaluated against the item as it was before the update
+    # List elements are removed by their positions before the update, so the highest positions are removed first
+    removes = [action for action in actions if action[0] == 'REMOVE']
+    removes.sort(key=lambda action: action[1][-1] if isinstance(action[1][-1], int) else -1, reverse=True)
+    actions = [action for action in actions if action[0] != 'REMOVE'] + removes
+
+    original = copy_value(item)
+    updated_names = []
+    for action in actions:
+        kind = action[0]
+        path = action[1]
+        updated_names.append(path[0])
+
+        if kind == 'SET':
+            set_path(item, path, copy_value(_evaluate_operand(action[2], original)))
+        elif kind == 'REMOVE':
+            remove_path(item, path)
+        elif kind == 'ADD':
+            current = get_path(item, path)
+            value = _evaluate_operand(action[2], original)
+            if current is MISSING:
+                set_path(item, path, copy_value(value))
+            elif value_type(current) == 'N' and value_type(value) == 'N':
+                set_path(item, path, current + value)
+            elif isinstance(current, set) and isinstance(value, set):
+                set_path(item, path, current | value)
+            else:
+                raise validation_error("An operand in the update expression has an incorrect data type")
+        elif kind == 'DELETE':
+            current = get_path(item, path)
+            value = _evaluate_operand(action[2], original)
+            if isinstance(current, set) and isinstance(value, set):
+                remaining = current - value
+                if len(remaining) == 0:
+                    remove_path(item, path)
+                else:
+                    set_path(item, path, remaining)
+
+    return updated_names
+
+def copy_value(value):
+    """
+    Copies the containers in a value, so that stored items don't share state with the caller
+    """
+    if isinstance(value, dict):
+        return {k : copy_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [copy_value(v) for v in value]
+    if isinstance(value, set):
+        return set(value)
+    return value
+
+
+###########################################################################
+###                            Parser                                   ###
+###########################################################################
+
+class _Parser:
+    """
+    A recursive descent parser for DynamoDB expression strings
+    """
+
+    def __init__(self, text, names, values):
+        self.text = text
+        self.names = names
+        self.values = values
+        self.tokens = self.__tokenize(text)
+        self.position = 0
+
+    def __tokenize(self, text):
+        tokens = []
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            match = _TOKEN_REGEX.match(text, position)
+            if match is None:
+                raise validation_error("Invalid syntax in expression: " + text)
+            symbol, name_placeholder, value_placeholder, number, word = match.groups()
+            if symbol is not None:
+                tokens.append(('symbol', symbol))
+            elif name_placeholder is not None:
+                tokens.append(('name_placeholder', name_placeholder))
+            elif value_placeholder is not None:
+                tokens.append(('value_placeholder', value_placeholder))
+            elif number is not None:
+                tokens.append(('number', int(number)))
+            else:
+                tokens.append(('word', word))
+            position = match.end()
+        return tokens
+
+    ### Token helpers ###
+
+    def peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def accept(self, symbol):
+        if self.peek() == ('symbol', symbol):
+            self.position = self.position + 1
+            return True
+        return False
+
+    def accept_keyword(self, keyword):
+        token_type, token_value = self.peek()
+        if token_type == 'word' and token_value.upper() == keyword:
+            self.position = self.position + 1
+            return True
+        return False
+
+    def expect(self, symbol):
+        if not self.accept(symbol):
+            raise validation_error("Invalid syntax in expression, expected '" + symbol + "': " + self.text)
+
+    def expect_end(self):
+        if self.position != len(self.tokens):
+            raise validation_error("Invalid syntax in expression, unexpected token " + \
+                str(self.peek()[1]) + ": " + self.text)
+
+    ### Grammar ###
+
+    def parse_path(self, allow_placeholders=True):
+        path = [self.__parse_path_name(allow_placeholders)]
+        while True:
+            if self.accept('.'):
+                path.append(self.__parse_path_name(allow_placeholders))
+            elif self.accept('['):
+                token_type, token_value = self.peek()
+                if token_type != 'number':
+                    raise validation_error("Invalid list index in expression: " + self.text)
+                self.position = self.position + 1
+                self.expect(']')
+                path.append(token_value)
+            else:
+                return path
+
+    def __parse_path_name(self, allow_placeholders):
+        token_type, token_value = self.peek()
+        self.position = self.position + 1
+        if token_type == 'word':
+            return token_value
+        if token_type == 'name_placeholder' and allow_placeholders:
+            if not token_value in self.names:
+                raise validation_error("An expression attribute name used in the document path is not defined: " + token_value)
+            return self.names[token_value]
+        raise validation_error("Invalid attribute path in expression: " + self.text)
+
+    def parse_operand(self):
+        token_type, token_value = self.peek()
+        if token_type == 'value_placeholder':
+            self.position = self.position + 1
+            if not token_value in self.values:
+                raise validation_error("An expression attribute value used in expression is not defined: " + token_value)
+            return ('value', normalize(self.values[token_value]))
+        if token_type == 'word' and self.peek(1) == ('symbol', '('):
+            self.position = self.position + 2
+            args = [self.parse_operand()]
+            while self.accept(','):
+                args.append(self.parse_operand())
+            self.expect(')')
+            return ('function', token_value, args)
+        return ('path', self.parse_path())
+
+    def parse_condition(self):
+        node = self.__parse_and()
+        while self.accept_keyword('OR'):
+            node = ('or', node, self.__parse_and())
+        return node
+
+    def __parse_and(self):
+        node = self.__parse_not()
+        while self.accept_keyword('AND'):
+            node = ('and', node, self.__parse_not())
+        return node
+
+    def __parse_not(self):
+        if self.accept_keyword('NOT'):
+            return ('not', self.__parse_not())
+        return self.__parse_primary()
+
+    def __parse_primary(self):
+        if self.accept('('):
+            node = self.parse_condition()
+            self.expect(')')
+            return node
+
+        token_type, token_value = self.peek()
+        if token_type == 'word' and token_value in CONDITION_FUNCTIONS and self.peek(1) == ('symbol', '('):
+            function_node = self.parse_operand()
+            return ('function', function_node[1], function_node[2])
+
+        left = self.parse_operand()
+        token_type, token_value = self.peek()
+        if token_type == 'symbol' and token_value in COMPARATORS:
+            self.position = self.position + 1
+            return ('compare', left, token_value, self.parse_operand())
+        if self.accept_keyword('BETWEEN'):
+            low = self.parse_operand()
+            if not self.accept_keyword('AND'):
+                raise validation_error("Invalid syntax in expression, expected AND: " + self.text)
+            return ('between', left, low, self.parse_operand())
+        if self.accept_keyword('IN'):
+            self.expect('(')
+            candidates = [self.parse_operand()]
+            while self.accept(','):
+                candidates.append(self.parse_operand())
+            self.expect(')')
+            return ('in', left, candidates)
+        raise validation_error("Invalid syntax in condition expression: " + self.text)
+
+    def parse_update(self):
+        actions = []
+        while self.position < len(self.tokens):
+            if self.accept_keyword('SET'):
+                actions.append(self.__parse_set_action())
+                while self.accept(','):
+                    actions.append(self.__parse_set_action())
+            elif self.accept_keyword('REMOVE'):
+                actions.append(('REMOVE', self.parse_path()))
+                while self.accept(','):
+                    actions.append(('REMOVE', self.parse_path()))
+            elif self.accept_keyword('ADD') or self.accept_keyword('DELETE'):
+                kind = self.tokens[self.position - 1][1].upper()
+                actions.append((kind, self.parse_path(), self.parse_operand()))
+                while self.accept(','):
+                    actions.append((kind, self.parse_path(), self.parse_operand()))
+            else:
+                raise validation_error("Invalid UpdateExpression: " + self.text)
+
+        if len(actions) == 0:
+            raise validation_error("Invalid UpdateExpression: The expression can not be empty")
+        return actions
+
+    def __parse_set_action(self):
+        path = self.parse_path()
+        self.expect('=')
+        value = self.parse_operand()
+        if self.accept('+'):
+            value = ('arithmetic', value, '+', self.parse_operand())
+        elif self.accept('-'):
+            value = ('arithmetic', value, '-', self.parse_operand())
+        return ('SET', path, value)
@@ -0,0 +1,67 @@
+"""
+This module reads the new items of a Reddit listing, without missing any during bursts of activity
+"""
+
+class ListingStream:
+    """
+    Returns the items that have been added to a listing, such as the new submissions or comments of a
+    subreddit, since the last fetch.
+
+    The stream keeps a high-water mark: the fullname of the newest item it has returned. Each fetch reads the
+    listing from the newest item backwards, a page at a time, until it reaches the mark. Every new item is
+    returned exactly once, however many arrived since the last fetch. The page size adapts to the number of
+    new items, so quiet periods use small requests and bursts are read in as few requests as possible.
+    """
+
+    MIN_FETCH_SIZE = 5 # The smallest number of items requested per page
+    MAX_FETCH_SIZE = 100 # The largest number of items requested per page. Reddit returns at most 100.
+    MAX_PAGES = 10 # The most pages read in a single fetch. Reddit listings only go back 1000 items anyway.
+
+    def __init__(self, listing, initial_fetch_size=10):
+        """
+        listing: The praw listing method to read, such as subreddit.new or subreddit.comments
+        initial_fetch_size: The number of items read by the first fetch
+        """
+        self.listing = listing
+        self.fetch_size = initial_fetch_size
+        self.high_water_mark = None # The fullname of the newest item returned
+        self.high_water_time = None # The creation time of the newest item returned
+
+    def fetch(self):
+        """
+        Returns the list of new items, oldest first.
+        The first fetch returns the newest items in the listing, since there's no mark to read back to.
+        """
+        new_items = []
+        after = None
+        reached_mark = False
+        page_size = self.fetch_size
+        for page_number in range(0, ListingStream.MAX_PAGES):
+            params = {} if after is None else {'after' : after}
+            page = list(self.listing(limit=page_size, params=params))
+
+            for item in page:
+                # Items older than the mark are also a stop, in case the item at the mark has been deleted
+                if item.fullname == self.high_water_mark or \
+                    (self.high_water_time is not None and item.created_utc < self.high_water_time):
+                    reached_mark = True
+                    break
+                new_items.append(item)
+
+            if reached_mark or self.high_water_mark is None or len(page) < page_size:
+                break
+            after = page[-1].fullname
+            page_size = min(ListingStream.MAX_FETCH_SIZE, 2 * page_size) # A burst is in progress
+        else:
+            print("Listing stream read " + str(len(new_items)) + " items without reaching the last item seen. " + \
+                "Older items may have been missed.")
+
+        if len(new_items) > 0:
+            self.high_water_mark = new_items[0].fullname
+            self.high_water_time = new_items[0].created_utc
+
+        # Read twice the latest number of new items next time, so that it's usually a single page
+        self.fetch_size = max(ListingStream.MIN_FETCH_SIZE, min(ListingStream.MAX_FETCH_SIZE, 2 * len(new_items)))
+
+        new_items.reverse()
+        return new_items
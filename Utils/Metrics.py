@@ -0,0 +1,377 @@
+"""
+This module collects performance metrics for the calls made to the database, and for the Tracker's update cycles
+"""
+from contextlib import contextmanager
+import bisect
+import threading
+import time
+
+class LatencyHistogram:
+    """
+    A histogram of call latencies, with fixed buckets so that it uses a constant amount of memory
+    """
+
+    # The upper bound, in milliseconds, of each bucket. Latencies above the last bound go in an overflow bucket.
+    BUCKET_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+    def __init__(self):
+        self.counts = [0] * (len(LatencyHistogram.BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, latency_ms):
+        self.counts[bisect.bisect_left(LatencyHistogram.BUCKET_BOUNDS_MS, latency_ms)] += 1
+        self.count = self.count + 1
+        self.total_ms = self.total_ms + latency_ms
+        self.max_ms = max(self.max_ms, latency_ms)
+
+    def percentile(self, fraction):
+        """
+        Returns the upper bound of the bucket holding the given fraction (0 to 1) of the latencies.
+        Latencies in the overflow bucket are reported as the maximum latency.
+        """
+        if self.count == 0:
+            return 0.0
+        threshold = fraction * self.count
+        running_count = 0
+        for i in range(0, len(LatencyHistogram.BUCKET_BOUNDS_MS)):
+            running_count = running_count + self.counts[i]
+            if running_count >= threshold:
+                return float(min(LatencyHistogram.BUCKET_BOUNDS_MS[i], self.max_ms))
+        return self.max_ms
+
+    def merge(self, other):
+        """
+        Adds the latencies recorded by another histogram to this one
+        """
+        for i in range(0, len(self.counts)):
+            self.counts[i] = self.counts[i] + other.counts[i]
+        self.count = self.count + other.count
+        self.total_ms = self.total_ms + other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def snapshot(self):
+        return {
+            'count' : self.count,
+            'mean_ms' : 0.0 if self.count == 0 else self.total_ms / self.count,
+            'p50_ms' : self.percentile(0.5),
+            'p95_ms' : self.percentile(0.95),
+            'p99_ms' : self.percentile(0.99),
+            'max_ms' : self.max_ms
+        }
+
+
+class CallStats:
+    """
+    The metrics for a group of calls
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0 # The number of attempts that failed with a transient error, and were retried
+        self.read_units = 0.0
+        self.write_units = 0.0
+        self.items = 0 # The number of items read or written
+        self.payload_bytes = 0 # The approximate size of the items read or written
+        self.latency = LatencyHistogram()
+
+    def merge(self, other):
+        self.calls = self.calls + other.calls
+        self.errors = self.errors + other.errors
+        self.retries = self.retries + other.retries
+        self.read_units = self.read_units + other.read_units
+        self.write_units = self.write_units + other.write_units
+        self.items = self.items + other.items
+        self.payload_bytes = self.payload_bytes + other.payload_bytes
+        self.latency.merge(other.latency)
+
+    def snapshot(self):
+        return {
+            'calls' : self.calls,
+            'errors' : self.errors,
+            'retries' : self.retries,
+            'read_units' : self.read_units,
+            'write_units' : self.write_units,
+            'items' : self.items,
+            'payload_bytes' : self.payload_bytes,
+            'latency' : self.latency.snapshot()
+        }
+
+
+class CallMetrics:
+    """
+    Collects the metrics of database calls, broken down by table, operation and calling feature.
+
+    The calling feature is taken from the caller() context of the current thread, so callers don't
+    need to pass it to every call. Metrics are kept both since startup and for the current summary interval.
+    The collector is safe to share between threads.
+    """
+
+    def __init__(self, default_caller, summary_interval):
+        """
+        default_caller: The caller name used outside of any caller() context
+        summary_interval: How often, in seconds, a summary line is due. 0 disables the summary.
+        """
+        self.default_caller = default_caller
+        self.summary_interval = summary_interval
+
+        self.__lock = threading.Lock()
+        self.__local = threading.local() # Holds the stack of caller names for each thread
+        self.__totals = {} # Maps (table, operation, caller) to the CallStats since startup
+        self.__interval = {} # Maps (table, operation, caller) to the CallStats since the last summary
+        self.__interval_start = time.time()
+
+    @contextmanager
+    def caller(self, name):
+        """
+        Attributes the database calls made by this thread within the context to the given caller
+        """
+        if not hasattr(self.__local, 'callers'):
+            self.__local.callers = []
+        self.__local.callers.append(name)
+        try:
+            yield
+        finally:
+            self.__local.callers.pop()
+
+    def current_caller(self):
+        callers = getattr(self.__local, 'callers', None)
+        return callers[-1] if callers else self.default_caller
+
+    def record(self, table_name, operation, latency_ms=None, read_units=0, write_units=0, items=0,
+        payload_bytes=0, error=False, retried=False):
+        """
+        Records a call, attributed to the current caller
+
+        latency_ms: The latency of the call. If None, only the capacity and items are recorded, and the
+                    call isn't counted. Used for the other tables of a request that spans several tables.
+        """
+        key = (table_name, operation, self.current_caller())
+        with self.__lock:
+            for stats_by_key in [self.__totals, self.__interval]:
+                stats = stats_by_key.get(key)
+                if stats is None:
+                    stats = CallStats()
+                    stats_by_key[key] = stats
+
+                if latency_ms is not None:
+                    stats.calls = stats.calls + 1
+                    stats.latency.record(latency_ms)
+                if error:
+                    stats.errors = stats.errors + 1
+                if retried:
+                    stats.retries = stats.retries + 1
+                stats.read_units = stats.read_units + read_units
+                stats.write_units = stats.write_units + write_units
+                stats.items = stats.items + items
+                stats.payload_bytes = stats.payload_bytes + payload_bytes
+
+    def snapshot(self):
+        """
+        Returns a list of the metrics since startup, with one dictionary per table, operation and caller
+        """
+        with self.__lock:
+            return [dict(table=key[0], operation=key[1], caller=key[2], **stats.snapshot())
+                for key, stats in sorted(self.__totals.items())]
+
+    def totals(self, group_by):
+        """
+        Returns a dictionary of the metrics since startup, grouped by 'table', 'operation' or 'caller'
+        """
+        position = ['table', 'operation', 'caller'].index(group_by)
+        with self.__lock:
+            return {name : stats.snapshot() for name, stats in self.__group(self.__totals, position).items()}
+
+    def is_summary_due(self):
+        return self.summary_interval > 0 and time.time() >= self.__interval_start + self.summary_interval
+
+    def summary_line(self, only_if_due=False):
+        """
+        Returns a single line summarizing the calls since the last summary, and starts a new interval
+        only_if_due: If True, returns None instead unless the summary interval has passed. The check is atomic,
+                     so only one of several threads gets the summary.
+        """
+        with self.__lock:
+            if only_if_due and not self.is_summary_due():
+                return None
+            interval = self.__interval
+            duration = time.time() - self.__interval_start
+            self.__interval = {}
+            self.__interval_start = time.time()
+
+        overall = CallStats()
+        for stats in interval.values():
+            overall.merge(stats)
+
+        parts = ["DB " + str(int(duration)) + "s: " + self.__describe(overall)]
+        for position, label in [(0, "table"), (2, "caller")]:
+            groups = self.__group(interval, position)
+            # The busiest groups, by the capacity they consumed
+            names = sorted(groups, key=lambda name: -(groups[name].read_units + groups[name].write_units))
+            parts.append("by " + label + ": " + ", ".join(name + " " + self.__describe(groups[name]) for name in names))
+        return " | ".join(parts)
+
+    def reset(self):
+        with self.__lock:
+            self.__totals = {}
+            self.__interval = {}
+            self.__interval_start = time.time()
+
+    @staticmethod
+    def __group(stats_by_key, position):
+        groups = {}
+        for key, stats in stats_by_key.items():
+            if not key[position] in groups:
+                groups[key[position]] = CallStats()
+            groups[key[position]].merge(stats)
+        return groups
+
+    @staticmethod
+    def __describe(stats):
+        latency = stats.latency
+        return "{} calls ({} retry, {} err) {:.1f} RCU {:.1f} WCU {} items {}KB p50 {:.0f}ms p99 {:.0f}ms".format(
+            stats.calls, stats.retries, stats.errors, stats.read_units, stats.write_units, stats.items,
+            stats.payload_bytes // 1024, latency.percentile(0.5), latency.percentile(0.99))
+
+
+class TrackerMetrics:
+    """
+    Collects the metrics of the Tracker's update cycles: how long the cycles, Reddit lookups and database
+    writes take, how many items are polled, and how far behind the tracking is.
+
+    Staleness is the time since each tracked item's last successful poll, and poll lag is how long the most
+    overdue item had been waiting when a cycle started. A final refresh is late if it's written more than
+    LATE_FINAL_SECONDS after the item's expire time, which delays its settlement.
+    The collector is safe to share between threads.
+    """
+
+    LATE_FINAL_SECONDS = 60 # How long after the expire time a final refresh can be written before it counts as late
+
+    def __init__(self, summary_interval):
+        """
+        summary_interval: How often, in seconds, a summary line is due. 0 disables the summary.
+        """
+        self.summary_interval = summary_interval
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.__lock:
+            self.__reset()
+
+    def __reset(self):
+        # The caller holds the lock
+        self.cycle_latency = LatencyHistogram()
+        self.fetch_latency = LatencyHistogram() # The latency of each batched Reddit lookup
+        self.write_latency = LatencyHistogram() # The latency of writing the scores of each batch
+        self.items_polled = 0
+        self.items_written = 0
+        self.items_failed = 0 # Items whose lookup or write failed, and which are polled again soon
+        self.max_items_per_cycle = 0
+        self.final_refreshes = 0
+        self.late_final_refreshes = 0
+        self.max_final_delay = 0 # The longest time, in seconds, between an expire time and its final refresh
+        self.max_poll_lag = 0
+        self.last_cycle = None # The snapshot of the most recent cycle
+        self.interval_start = time.time()
+
+    def record_fetch(self, latency_ms, num_items, success):
+        with self.__lock:
+            self.fetch_latency.record(latency_ms)
+            if not success:
+                self.items_failed = self.items_failed + num_items
+
+    def record_write(self, latency_ms, num_written, num_failed):
+        with self.__lock:
+            self.write_latency.record(latency_ms)
+            self.items_written = self.items_written + num_written
+            self.items_failed = self.items_failed + num_failed
+
+    def record_final_refresh(self, delay_seconds):
+        """
+        Records the final refresh of an item, written the given number of seconds after its expire time
+        """
+        with self.__lock:
+            self.final_refreshes = self.final_refreshes + 1
+            if delay_seconds > TrackerMetrics.LATE_FINAL_SECONDS:
+                self.late_final_refreshes = self.late_final_refreshes + 1
+            self.max_final_delay = max(self.max_final_delay, delay_seconds)
+
+    def record_cycle(self, duration_ms, num_polled, num_tracked, staleness, poll_lag):
+        """
+        Records a completed update cycle
+        duration_ms: How long the cycle took
+        num_polled: The number of items polled in the cycle
+        num_tracked: The number of items being tracked
+        staleness: The list of the staleness, in seconds, of each item that's still being polled
+        poll_lag: How long, in seconds, the most overdue item had been waiting when the cycle started
+        """
+        staleness = sorted(staleness)
+        with self.__lock:
+            self.cycle_latency.record(duration_ms)
+            self.items_polled = self.items_polled + num_polled
+            self.max_items_per_cycle = max(self.max_items_per_cycle, num_polled)
+            self.max_poll_lag = max(self.max_poll_lag, poll_lag)
+            self.last_cycle = {
+                'duration_ms' : duration_ms,
+                'items_polled' : num_polled,
+                'items_tracked' : num_tracked,
+                'staleness_max' : staleness[-1] if staleness else 0,
+                'staleness_p95' : staleness[min(len(staleness) - 1, int(0.95 * len(staleness)))] if staleness else 0,
+                'poll_lag' : poll_lag
+            }
+
+    def snapshot(self):
+        """
+        Returns a dictionary of the metrics since the last summary, and of the most recent cycle
+        """
+        with self.__lock:
+            return self.__snapshot()
+
+    def __snapshot(self):
+        # The caller holds the lock
+        cycles = self.cycle_latency.count
+        return {
+            'cycles' : cycles,
+            'cycle_latency' : self.cycle_latency.snapshot(),
+            'fetch_latency' : self.fetch_latency.snapshot(),
+            'write_latency' : self.write_latency.snapshot(),
+            'items_polled' : self.items_polled,
+            'items_written' : self.items_written,
+            'items_failed' : self.items_failed,
+            'mean_items_per_cycle' : 0.0 if cycles == 0 else float(self.items_polled) / cycles,
+            'max_items_per_cycle' : self.max_items_per_cycle,
+            'final_refreshes' : self.final_refreshes,
+            'late_final_refreshes' : self.late_final_refreshes,
+            'max_final_delay' : self.max_final_delay,
+            'max_poll_lag' : self.max_poll_lag,
+            'last_cycle' : self.last_cycle
+        }
+
+    def is_summary_due(self):
+        return self.summary_interval > 0 and time.time() >= self.interval_start + self.summary_interval
+
+    def summary_line(self):
+        """
+        Returns a single line summarizing the cycles since the last summary, and starts a new interval
+        """
+        # Taken under one hold of the lock, so nothing recorded between the snapshot and the reset is lost
+        with self.__lock:
+            snapshot = self.__snapshot()
+            duration = time.time() - self.interval_start
+            self.__reset()
+
+        last_cycle = snapshot['last_cycle'] or {'items_tracked' : 0, 'staleness_max' : 0, 'staleness_p95' : 0}
+        return ("Tracker {}s: {} cycles p50 {:.0f}ms p99 {:.0f}ms max {:.0f}ms | {} polled ({:.1f}/cycle, max {}) " + \
+            "{} written {} failed | fetch p50 {:.0f}ms p99 {:.0f}ms | write p50 {:.0f}ms p99 {:.0f}ms | " + \
+            "{} tracked, staleness p95 {}s max {}s, lag max {}s | {} final ({} late, max delay {}s)").format(
+            int(duration), snapshot['cycles'], snapshot['cycle_latency']['p50_ms'], snapshot['cycle_latency']['p99_ms'],
+            snapshot['cycle_latency']['max_ms'], snapshot['items_polled'], snapshot['mean_items_per_cycle'],
+            snapshot['max_items_per_cycle'], snapshot['items_written'], snapshot['items_failed'],
+            snapshot['fetch_latency']['p50_ms'], snapshot['fetch_latency']['p99_ms'],
+            snapshot['write_latency']['p50_ms'], snapshot['write_latency']['p99_ms'],
+            last_cycle['items_tracked'], int(last_cycle['staleness_p95']), int(last_cycle['staleness_max']),
+            int(snapshot['max_poll_lag']), snapshot['final_refreshes'], snapshot['late_final_refreshes'],
+            int(snapshot['max_final_delay']))
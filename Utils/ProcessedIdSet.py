@@ -0,0 +1,96 @@
+"""
+This module contains a bounded set of the IDs of recently processed comments and submissions
+"""
+from collections import OrderedDict
+import os
+import time
+import traceback
+
+class ProcessedIdSet:
+    """
+    An insertion-ordered set of IDs, holding at most a fixed number of the most recently added IDs.
+    Adding, checking and evicting an ID are all O(1).
+
+    If a snapshot path is given, the IDs are loaded from that file when the set is created, and saved to it
+    at most once every snapshot interval after a change, so that a restart doesn't process the same items again.
+    The owner should call save_if_due() from its run loop, so that the last IDs added before a quiet period are
+    saved, and save() when it stops.
+    """
+
+    DEFAULT_SNAPSHOT_INTERVAL = 30 # The default minimum time, in seconds, between snapshots
+
+    def __init__(self, capacity, snapshot_path=None, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL):
+        """
+        capacity: The number of IDs to keep. Once it's exceeded, the oldest IDs are evicted.
+        snapshot_path: (Optional) The local file to save the IDs to
+        snapshot_interval: The minimum time, in seconds, between snapshots
+        """
+        self.capacity = capacity
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.__ids = OrderedDict() # The IDs, oldest first. The values aren't used.
+        self.__is_dirty = False # Whether the IDs have changed since the last snapshot
+        self.__last_snapshot_time = 0
+
+        if snapshot_path is not None:
+            self.__load()
+
+    def __contains__(self, id):
+        return id in self.__ids
+
+    def __len__(self):
+        return len(self.__ids)
+
+    def add(self, id):
+        """
+        Adds the ID as the most recent one, evicting the oldest ID if the set is full.
+        Adding an ID that's already in the set makes it the most recent one.
+        """
+        if id in self.__ids:
+            self.__ids.move_to_end(id)
+        else:
+            self.__ids[id] = None
+            if len(self.__ids) > self.capacity:
+                self.__ids.popitem(last=False)
+        self.__is_dirty = True
+        self.save_if_due()
+
+    def save_if_due(self):
+        """
+        Saves the IDs to the snapshot file if they've changed, and the snapshot interval has passed since the last snapshot
+        """
+        if self.snapshot_path is not None and time.time() >= self.__last_snapshot_time + self.snapshot_interval:
+            self.save()
+
+    def save(self):
+        """
+        Saves the IDs to the snapshot file, if there is one and the IDs have changed.
+        The file is replaced atomically, so a crash while saving leaves the previous snapshot intact.
+        """
+        if self.snapshot_path is None or not self.__is_dirty:
+            return
+        self.__last_snapshot_time = time.time()
+        try:
+            temp_path = self.snapshot_path + ".tmp"
+            with open(temp_path, 'w') as snapshot_file:
+                snapshot_file.write("\n".join(self.__ids.keys()))
+            os.replace(temp_path, self.snapshot_path)
+            self.__is_dirty = False
+        except Exception as e:
+            print("Unable to save processed IDs to: " + self.snapshot_path)
+            print("Error: " + str(e))
+            traceback.print_exc()
+
+    def __load(self):
+        if not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path) as snapshot_file:
+                ids = [line.strip() for line in snapshot_file if line.strip() != ""]
+            for id in ids[-self.capacity:]:
+                self.__ids[id] = None
+            print("Loaded " + str(len(self.__ids)) + " processed IDs from: " + self.snapshot_path)
+        except Exception as e:
+            print("Unable to load processed IDs from: " + self.snapshot_path)
+            print("Error: " + str(e))
+            traceback.print_exc()
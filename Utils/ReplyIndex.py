@@ -0,0 +1,71 @@
+"""
+This module contains an index of the comments and submissions that the bot has replied to
+"""
+import time
+import traceback
+from Utils.ProcessedIdSet import ProcessedIdSet
+
+class ReplyIndex:
+    """
+    An in-memory set of the fullnames of the comments and submissions that the bot has replied to.
+
+    The index is loaded from the bot's comment history the first time it's used, and replies are added
+    as they're posted. The bot's other processes post replies from the same account, so the newest page of
+    the comment history is read again every REFRESH_INTERVAL to pick up their replies.
+    """
+
+    CAPACITY = 5000 # The number of replied-to fullnames to keep
+    HISTORY_LIMIT = 1000 # The number of comments read from the history at startup. Reddit lists at most 1000.
+    REFRESH_LIMIT = 100 # The number of comments read by each refresh, which is a single page
+    REFRESH_INTERVAL = 60 # The time, in seconds, between refreshes
+
+    def __init__(self, reddit):
+        """
+        reddit: The authenticated praw.Reddit instance of the bot
+        """
+        self.reddit = reddit
+        self.parent_ids = ProcessedIdSet(ReplyIndex.CAPACITY) # The fullnames of the items replied to
+        self.is_loaded = False
+        self.last_refresh_time = 0
+
+    def record_reply(self, parent):
+        """
+        Records that the bot has replied to the given comment or submission
+        """
+        self.parent_ids.add(parent.fullname)
+
+    def has_replied(self, item):
+        """
+        Returns whether the bot has replied to the given comment or submission,
+        or None if the comment history couldn't be read
+        """
+        cur_time = time.time()
+        if not self.is_loaded:
+            self.is_loaded = self.__read_history(ReplyIndex.HISTORY_LIMIT)
+            if not self.is_loaded:
+                return None
+            self.last_refresh_time = cur_time
+        elif cur_time >= self.last_refresh_time + ReplyIndex.REFRESH_INTERVAL:
+            # A failed refresh is tried again next interval. Replies made by this process are already indexed.
+            self.__read_history(ReplyIndex.REFRESH_LIMIT)
+            self.last_refresh_time = cur_time
+
+        return item.fullname in self.parent_ids
+
+    def __read_history(self, limit):
+        """
+        Adds the parents of the bot's newest comments to the index. Returns whether the history could be read.
+        """
+        try:
+            comments = list(self.reddit.user.me().comments.new(limit=limit))
+        except Exception as e:
+            print("Unable to read the bot's comment history")
+            print("Error: " + str(e))
+            traceback.print_exc()
+            return False
+
+        # The history is newest first, so it's added in reverse to keep the newest replies the last to be evicted
+        for comment in reversed(comments):
+            if not comment.parent_id in self.parent_ids:
+                self.parent_ids.add(comment.parent_id)
+        return True
@@ -0,0 +1,112 @@
+"""
+This module contains a compact, array-backed series of sampled scores
+"""
+from array import array
+import struct
+import sys
+
+class ScoreSeries:
+    """
+    A series of (timestamp, score) samples for a single post.
+
+    The first timestamp is stored in full, and each later timestamp as an unsigned 16-bit delta from
+    the one before it. Scores are signed 32-bit values. Each sample takes 6 bytes, both in memory and
+    in the encoded form, which is a little-endian header followed by the two arrays.
+    """
+
+    HEADER_FORMAT = "<IH" # The start time, and the number of samples
+    MAX_DELTA = 65535 # The largest gap between samples, in seconds. Longer gaps are recorded as this.
+    MAX_POINTS = 1024 # Once this many samples are held, every other sample is dropped to make room
+
+    def __init__(self):
+        self.start_time = None # The timestamp of the first sample
+        self.last_time = None # The timestamp of the last sample
+        self.deltas = array('H') # The seconds between each sample and the one before it. The first delta is 0.
+        self.scores = array('i')
+
+    def __len__(self):
+        return len(self.scores)
+
+    def append(self, timestamp, score):
+        """
+        Adds a sample. Timestamps earlier than the last sample are recorded at the time of the last sample.
+        """
+        timestamp = int(timestamp)
+        if len(self.scores) >= ScoreSeries.MAX_POINTS:
+            self.__decimate()
+
+        if self.start_time is None:
+            self.start_time = timestamp
+            self.last_time = timestamp
+            self.deltas.append(0)
+        else:
+            delta = min(ScoreSeries.MAX_DELTA, max(0, timestamp - self.last_time))
+            self.last_time = self.last_time + delta
+            self.deltas.append(delta)
+        self.scores.append(max(-2 ** 31, min(2 ** 31 - 1, int(score))))
+
+    def points(self):
+        """
+        Returns the list of (timestamp, score) samples
+        """
+        points = []
+        timestamp = self.start_time
+        for delta, score in zip(self.deltas, self.scores):
+            timestamp = timestamp + delta
+            points.append((timestamp, score))
+        return points
+
+    def clear(self):
+        self.start_time = None
+        self.last_time = None
+        self.deltas = array('H')
+        self.scores = array('i')
+
+    def encode(self):
+        """
+        Returns the samples as bytes, in a form that's the same on every platform
+        """
+        deltas = array('H', self.deltas)
+        scores = array('i', self.scores)
+        if sys.byteorder == 'big':
+            deltas.byteswap()
+            scores.byteswap()
+        header = struct.pack(ScoreSeries.HEADER_FORMAT, self.start_time or 0, len(scores))
+        return header + deltas.tobytes() + scores.tobytes()
+
+    @staticmethod
+    def decode(data):
+        """
+        Returns the ScoreSeries encoded in the given bytes
+        """
+        data = bytes(getattr(data, 'value', data)) # boto3 returns binary attributes wrapped in a Binary
+        start_time, num_points = struct.unpack_from(ScoreSeries.HEADER_FORMAT, data)
+        offset = struct.calcsize(ScoreSeries.HEADER_FORMAT)
+
+        series = ScoreSeries()
+        series.deltas.frombytes(data[offset : offset + 2 * num_points])
+        series.scores.frombytes(data[offset + 2 * num_points : offset + 6 * num_points])
+        if sys.byteorder == 'big':
+            series.deltas.byteswap()
+            series.scores.byteswap()
+        if num_points > 0:
+            series.start_time = start_time
+            series.last_time = start_time + sum(series.deltas)
+        return series
+
+    def __decimate(self):
+        """
+        Drops every other sample after the first, merging the dropped time deltas into the samples that are kept
+        """
+        deltas = array('H')
+        scores = array('i')
+        pending_delta = 0
+        for i in range(0, len(self.scores)):
+            pending_delta = pending_delta + self.deltas[i]
+            if i % 2 == 0 or i == len(self.scores) - 1:
+                deltas.append(min(ScoreSeries.MAX_DELTA, pending_delta))
+                scores.append(self.scores[i])
+                pending_delta = 0
+        self.deltas = deltas
+        self.scores = scores
+        self.last_time = self.start_time + sum(self.deltas)
@@ -0,0 +1,939 @@
+"""
+This module contains the storage backends that DataAccess reads and writes through.
+
+DynamoDBBackend: The AWS DynamoDB service. This is the default.
+MemoryBackend: A stand-in that keeps the tables in memory, for running and benchmarking without AWS.
+SqliteBackend: A stand-in that keeps the tables in an SQLite file, so the data is shared between
+               processes and kept between runs.
+
+The stand-in backends follow the semantics of the DynamoDB calls that DataAccess makes, including
+update and condition expressions, paginated queries and scans, batch writes and transactions.
+They raise the same botocore ClientErrors that DynamoDB does, count the calls made to each table,
+and keep a tally of the capacity units that DynamoDB would have consumed.
+
+The backend is chosen with the IMT_STORAGE_BACKEND environment variable. See create_backend.
+"""
+import boto3
+from botocore.exceptions import ClientError
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+from contextlib import contextmanager
+import base64
+import bisect
+import decimal
+import json
+import math
+import os
+import sqlite3
+import threading
+import zlib
+from Utils import DynamoExpressions
+
+BACKEND_ENV_VAR = "IMT_STORAGE_BACKEND" # One of "dynamodb", "memory" or "sqlite"
+SQLITE_PATH_ENV_VAR = "IMT_STORAGE_PATH" # The SQLite file used by the sqlite backend
+SEED_PATH_ENV_VAR = "IMT_STORAGE_SEED" # (Optional) A JSON file of items to load into empty stand-in tables
+CAPACITY_ENV_VAR = "IMT_STORAGE_CAPACITY" # (Optional) The simulated "read,write" capacity units of each stand-in table
+
+DEFAULT_SQLITE_PATH = "imt_storage.sqlite"
+
+# The memory backend is shared by every DataAccess in the process, so they see the same data
+_shared_memory_backend = None
+_shared_memory_backend_lock = threading.Lock()
+
+
+def create_backend(region):
+    """
+    Creates the storage backend selected by the IMT_STORAGE_BACKEND environment variable
+    region: The AWS region to use for the DynamoDB backend
+    """
+    global _shared_memory_backend
+
+    backend_name = os.environ.get(BACKEND_ENV_VAR, "dynamodb").lower()
+    if backend_name == "dynamodb":
+        return DynamoDBBackend(region)
+
+    read_capacity, write_capacity = 0, 0
+    if CAPACITY_ENV_VAR in os.environ:
+        read_capacity, write_capacity = [int(units) for units in os.environ[CAPACITY_ENV_VAR].split(",")]
+    seed_path = os.environ.get(SEED_PATH_ENV_VAR)
+
+    if backend_name == "memory":
+        with _shared_memory_backend_lock:
+            if _shared_memory_backend is None:
+                _shared_memory_backend = MemoryBackend(read_capacity, write_capacity, seed_path)
+            return _shared_memory_backend
+    if backend_name == "sqlite":
+        path = os.environ.get(SQLITE_PATH_ENV_VAR, DEFAULT_SQLITE_PATH)
+        return SqliteBackend(path, read_capacity, write_capacity, seed_path)
+
+    raise RuntimeError("Unknown storage backend: " + backend_name)
+
+
+class DynamoDBBackend:
+    """
+    The storage backend for the AWS DynamoDB service.
+    For this to work, the AWS credentials must be present on the system.
+    """
+
+    def __init__(self, region):
+        self.region = region
+        self.dynamodb = boto3.resource('dynamodb', region_name=region)
+
+        # The low-level client is used for the requests that span items, since unlike resources,
+        # it's safe to share between threads
+        self.client = boto3.client('dynamodb', region_name=region)
+        self.serializer = TypeSerializer()
+        self.deserializer = TypeDeserializer()
+
+    def table(self, table_name, schema):
+        """
+        Returns the boto3 Table with the given name. The schema is defined by the table itself.
+        """
+        return self.dynamodb.Table(table_name)
+
+    def worker_table(self, table_name):
+        """
+        Returns a Table for use by a worker thread. boto3 resources are not thread safe, so each worker uses its own.
+        """
+        return boto3.session.Session().resource('dynamodb', region_name=self.region).Table(table_name)
+
+    def describe_table(self, table_name):
+        return self.client.describe_table(TableName=table_name)
+
+    def batch_write_item(self, request_items, return_consumed_capacity='NONE'):
+        """
+        Sends a BatchWriteItem request. The items and keys in the request, and the unprocessed
+        items in the response, are plain Python values like the ones used by boto3 resources.
+        """
+        response = self.client.batch_write_item(RequestItems=self.__convert_requests(request_items, self.__serialize),
+            ReturnConsumedCapacity=return_consumed_capacity)
+        response['UnprocessedItems'] = self.__convert_requests(response.get('UnprocessedItems', {}), self.__deserialize)
+        return response
+
+    def transact_write_items(self, transact_items, return_consumed_capacity='NONE'):
+        """
+        Sends a TransactWriteItems request. The keys, items and expression attribute values
+        are plain Python values like the ones used by boto3 resources.
+        """
+        serialized_items = []
+        for transact_item in transact_items:
+            serialized_item = {}
+            for action, request in transact_item.items():
+                request = dict(request)
+                for field in ['Key', 'Item', 'ExpressionAttributeValues']:
+                    if field in request:
+                        request[field] = self.__serialize(request[field])
+                serialized_item[action] = request
+            serialized_items.append(serialized_item)
+        return self.client.transact_write_items(TransactItems=serialized_items,
+            ReturnConsumedCapacity=return_consumed_capacity)
+
+    def stats(self):
+        """
+        Call counting is only done by the stand-in backends
+        """
+        return None
+
+    def __serialize(self, values):
+        return {name : self.serializer.serialize(value) for name, value in values.items()}
+
+    def __deserialize(self, values):
+        return {name : self.deserializer.deserialize(value) for name, value in values.items()}
+
+    def __convert_requests(self, request_items, convert):
+        """
+        Helper function that converts the items and keys of BatchWriteItem requests with the given function
+        """
+        converted = {}
+        for table_name, requests in request_items.items():
+            converted[table_name] = []
+            for request in requests:
+                if 'PutRequest' in request:
+                    converted[table_name].append({'PutRequest' : {'Item' : convert(request['PutRequest']['Item'])}})
+                else:
+                    converted[table_name].append({'DeleteRequest' : {'Key' : convert(request['DeleteRequest']['Key'])}})
+        return converted
+
+
+class StandInTable:
+    """
+    A table of a stand-in backend. Provides the same methods as a boto3 Table, for the arguments that DataAccess uses.
+    """
+
+    def __init__(self, backend, name, schema):
+        """
+        backend: The MemoryBackend or SqliteBackend that holds the data
+        name: The name of the table
+        schema: A dictionary describing the keys of the table, with the following keys:
+            'hash_key': The name of the partition key
+            'range_key': (Optional) The name of the sort key
+            'indexes': (Optional) A dictionary of global secondary index names, to dictionaries with
+                       'hash_key', an optional 'range_key', and an optional 'projection' list of the
+                       non-key attributes in the index. All attributes are projected if there's no list.
+        """
+        self.backend = backend
+        self.name = name
+        self.table_name = name
+        self.hash_key = schema['hash_key']
+        self.range_key = schema.get('range_key')
+        self.indexes = schema.get('indexes', {})
+
+    def key_names(self):
+        return [self.hash_key] if self.range_key is None else [self.hash_key, self.range_key]
+
+    def put_item(self, **kwargs):
+        return self.backend.put_item(self.name, **kwargs)
+
+    def get_item(self, **kwargs):
+        return self.backend.get_item(self.name, **kwargs)
+
+    def update_item(self, **kwargs):
+        return self.backend.update_item(self.name, **kwargs)
+
+    def delete_item(self, **kwargs):
+        return self.backend.delete_item(self.name, **kwargs)
+
+    def query(self, **kwargs):
+        return self.backend.query(self.name, **kwargs)
+
+    def scan(self, **kwargs):
+        return self.backend.scan(self.name, **kwargs)
+
+
+class MemoryBackend:
+    """
+    A stand-in storage backend that keeps the tables in memory.
+    The data is safe to share between threads, but is lost when the process exits.
+    """
+
+    MAX_PAGE_BYTES = 1024 * 1024 # DynamoDB stops reading a query or scan page after 1 MB
+    READ_UNIT_BYTES = 4096 # Each read capacity unit covers up to 4 KB
+    WRITE_UNIT_BYTES = 1024 # Each write capacity unit covers up to 1 KB
+    MAX_BATCH_WRITE_ITEMS = 25 # The maximum number of requests in a BatchWriteItem request
+    MAX_TRANSACT_ITEMS = 25 # The maximum number of actions in a TransactWriteItems request
+
+    def __init__(self, read_capacity=0, write_capacity=0, seed_path=None):
+        """
+        read_capacity, write_capacity: The provisioned capacity units that describe_table reports for
+                                       each table. 0 means on-demand capacity.
+        seed_path: (Optional) A JSON file mapping table names to lists of items. The items are loaded
+                   into each table when it's opened, if the table is empty.
+        """
+        self.read_capacity = read_capacity
+        self.write_capacity = write_capacity
+
+        self.__tables = {} # Maps each table name to its StandInTable
+        self.__lock = threading.RLock()
+        self.__items = {} # Maps each table name to a dictionary of items, keyed by key ID
+        self.__key_ids = {} # Maps each table name to the sorted list of its key IDs
+
+        # Call counts and consumed capacity, keyed by table name
+        self.__stats_lock = threading.Lock()
+        self.__calls = {}
+        self.__read_units = {}
+        self.__write_units = {}
+
+        self.__seed_items = {}
+        if seed_path is not None:
+            with open(seed_path) as seed_file:
+                self.__seed_items = json.load(seed_file, parse_float=decimal.Decimal, parse_int=decimal.Decimal)
+
+    ###########################################################################
+    ###                        Backend Interface                            ###
+    ###########################################################################
+
+    def table(self, table_name, schema):
+        """
+        Returns the table with the given name, creating it with the given schema if it doesn't exist
+        """
+        with self.__lock:
+            if not table_name in self.__tables:
+                self.__tables[table_name] = StandInTable(self, table_name, schema)
+                if table_name in self.__seed_items and self._count(table_name) == 0:
+                    self.batch_load(table_name, self.__seed_items[table_name])
+            return self.__tables[table_name]
+
+    def worker_table(self, table_name):
+        """
+        Returns a table for use by a worker thread. The stand-in tables are thread safe, so this is the shared table.
+        """
+        return self.__get_table(table_name)
+
+    def batch_load(self, table_name, items):
+        """
+        Writes the items into the table without counting any calls or capacity. Used to set up test data.
+        """
+        table = self.__get_table(table_name)
+        with self._transaction():
+            for item in items:
+                item = DynamoExpressions.normalize(item)
+                self._write(table_name, self.__key_id(table, item), self.__hash_id(table, item), item)
+
+    def describe_table(self, table_name):
+        table = self.__get_table(table_name)
+        self.__record(table_name, 'DescribeTable')
+
+        description = {
+            'TableName' : table_name,
+            'TableStatus' : 'ACTIVE',
+            'ItemCount' : self._count(table_name),
+            'KeySchema' : self.__key_schema(table.hash_key, table.range_key),
+            'ProvisionedThroughput' : {
+                'ReadCapacityUnits' : self.read_capacity,
+                'WriteCapacityUnits' : self.write_capacity
+            },
+            'BillingModeSummary' : {
+                'BillingMode' : 'PROVISIONED' if self.read_capacity > 0 or self.write_capacity > 0 else 'PAY_PER_REQUEST'
+            }
+        }
+        if len(table.indexes) > 0:
+            description['GlobalSecondaryIndexes'] = [
+                {
+                    'IndexName' : index_name,
+                    'IndexStatus' : 'ACTIVE',
+                    'KeySchema' : self.__key_schema(index['hash_key'], index.get('range_key'))
+                } for index_name, index in table.indexes.items()]
+        return {'Table' : description}
+
+    def get_item(self, table_name, Key, ConsistentRead=False, ProjectionExpression=None,
+        ExpressionAttributeNames=None, ReturnConsumedCapacity=None):
+
+        table = self.__get_table(table_name)
+        key_id = self.__key_id(table, Key, is_key=True)
+        with self._transaction(write=False):
+            item = self._read(table_name, key_id)
+
+        units = self.__read_units_for(0 if item is None else DynamoExpressions.item_size(item), ConsistentRead)
+        self.__record(table_name, 'GetItem', read_units=units)
+
+        response = {}
+        if item is not None:
+            if ProjectionExpression is not None:
+                item = DynamoExpressions.project(item,
+                    DynamoExpressions.parse_projection(ProjectionExpression, ExpressionAttributeNames or {}))
+            response['Item'] = item
+        return self.__with_capacity(response, table_name, units, ReturnConsumedCapacity)
+
+    def put_item(self, table_name, Item, ConditionExpression=None, ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None, ReturnValues='NONE', ReturnConsumedCapacity=None):
+
+        table = self.__get_table(table_name)
+        action = {'Put' : {'Item' : Item, 'ConditionExpression' : ConditionExpression,
+            'ExpressionAttributeNames' : ExpressionAttributeNames, 'ExpressionAttributeValues' : ExpressionAttributeValues}}
+        return self.__write_single(table, 'PutItem', action, ReturnValues, ReturnConsumedCapacity)
+
+    def update_item(self, table_name, Key, UpdateExpression, ConditionExpression=None, ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None, ReturnValues='NONE', ReturnConsumedCapacity=None):
+
+        table = self.__get_table(table_name)
+        action = {'Update' : {'Key' : Key, 'UpdateExpression' : UpdateExpression,
+            'ConditionExpression' : ConditionExpression, 'ExpressionAttributeNames' : ExpressionAttributeNames,
+            'ExpressionAttributeValues' : ExpressionAttributeValues}}
+        return self.__write_single(table, 'UpdateItem', action, ReturnValues, ReturnConsumedCapacity)
+
+    def delete_item(self, table_name, Key, ConditionExpression=None, ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None, ReturnValues='NONE', ReturnConsumedCapacity=None):
+
+        table = self.__get_table(table_name)
+        action = {'Delete' : {'Key' : Key, 'ConditionExpression' : ConditionExpression,
+            'ExpressionAttributeNames' : ExpressionAttributeNames, 'ExpressionAttributeValues' : ExpressionAttributeValues}}
+        return self.__write_single(table, 'DeleteItem', action, ReturnValues, ReturnConsumedCapacity)
+
+    def query(self, table_name, KeyConditionExpression, IndexName=None, FilterExpression=None,
+        ProjectionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None, Limit=None,
+        ExclusiveStartKey=None, ScanIndexForward=True, ConsistentRead=False, Select=None, ReturnConsumedCapacity=None):
+
+        table = self.__get_table(table_name)
+        hash_key, range_key, projection = self.__index_schema(table, IndexName)
+        if IndexName is not None and ConsistentRead:
+            raise DynamoExpressions.validation_error("Consistent reads are not supported on global secondary indexes", 'Query')
+
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        key_values = DynamoExpressions.key_condition_values(KeyConditionExpression, names, values)
+        if not hash_key in key_values:
+            raise DynamoExpressions.validation_error("Query condition missed key schema element: " + hash_key, 'Query')
+
+        with self._transaction(write=False):
+            if IndexName is None:
+                candidates = self._iterate_partition(table_name, self.__hash_id(table, {hash_key : key_values[hash_key]}))
+            else:
+                # Indexes are sparse, so items without the index keys aren't in the index
+                candidates = [item for key_id, item in self._iterate(table_name) if
+                    DynamoExpressions.compare(item.get(hash_key, DynamoExpressions.MISSING), '=', key_values[hash_key])
+                    and (range_key is None or range_key in item)]
+
+        # Items are returned in the order of the sort key, and then the order of the table key
+        def sort_key(item):
+            key_id = self.__key_id(table, item)
+            return (key_id,) if range_key is None else (item.get(range_key), key_id)
+
+        entries = [(sort_key(item), item) for item in candidates if
+            DynamoExpressions.evaluate_condition(KeyConditionExpression, item, names, values)]
+        entries.sort(key=lambda entry: entry[0], reverse=not ScanIndexForward)
+
+        if ExclusiveStartKey is not None:
+            start = sort_key(ExclusiveStartKey)
+            if ScanIndexForward:
+                entries = [entry for entry in entries if entry[0] > start]
+            else:
+                entries = [entry for entry in entries if entry[0] < start]
+
+        def to_result(item):
+            if projection is not None:
+                item = DynamoExpressions.project(item, [[name] for name in projection])
+            return item
+
+        def last_key(item):
+            key_names = table.key_names() + [name for name in [hash_key, range_key] if name is not None]
+            return {name : item[name] for name in key_names if name in item}
+
+        response, units = self.__read_page(iter(item for sort_value, item in entries), FilterExpression,
+            ProjectionExpression, names, values, Limit, Select, ConsistentRead, to_result, last_key)
+        self.__record(table_name, 'Query', read_units=units)
+        return self.__with_capacity(response, table_name, units, ReturnConsumedCapacity)
+
+    def scan(self, table_name, FilterExpression=None, ProjectionExpression=None, ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None, Limit=None, ExclusiveStartKey=None, Segment=None, TotalSegments=None,
+        ConsistentRead=False, Select=None, ReturnConsumedCapacity=None):
+
+        table = self.__get_table(table_name)
+        if (Segment is None) != (TotalSegments is None) or (Segment is not None and not 0 <= Segment < TotalSegments):
+            raise DynamoExpressions.validation_error("Segment and TotalSegments must be given together, " + \
+                "with 0 <= Segment < TotalSegments", 'Scan')
+
+        start_after = None if ExclusiveStartKey is None else self.__key_id(table, ExclusiveStartKey, is_key=True)
+
+        def segment_items():
+            for key_id, item in self._iterate(table_name, start_after):
+                if TotalSegments is None or zlib.crc32(key_id.encode('utf-8')) % TotalSegments == Segment:
+                    yield item
+
+        def last_key(item):
+            return {name : item[name] for name in table.key_names()}
+
+        with self._transaction(write=False):
+            response, units = self.__read_page(segment_items(), FilterExpression, ProjectionExpression,
+                ExpressionAttributeNames or {}, ExpressionAttributeValues or {}, Limit, Select, ConsistentRead,
+                lambda item: item, last_key)
+        self.__record(table_name, 'Scan', read_units=units)
+        return self.__with_capacity(response, table_name, units, ReturnConsumedCapacity)
+
+    def batch_write_item(self, request_items, return_consumed_capacity='NONE'):
+        """
+        Writes the put and delete requests. The stand-in is never throttled, so there are no unprocessed items.
+        """
+        actions = []
+        for table_name, requests in request_items.items():
+            table = self.__get_table(table_name)
+            for request in requests:
+                if 'PutRequest' in request:
+                    actions.append((table, {'Put' : {'Item' : request['PutRequest']['Item']}}))
+                else:
+                    actions.append((table, {'Delete' : {'Key' : request['DeleteRequest']['Key']}}))
+
+        if len(actions) > MemoryBackend.MAX_BATCH_WRITE_ITEMS:
+            raise DynamoExpressions.validation_error("Too many items requested for the BatchWriteItem call", 'BatchWriteItem')
+
+        # Unlike a transaction, each write in a batch stands alone
+        units_by_table = {}
+        for table, action in actions:
+            with self._transaction():
+                old_item, new_item, updated_names = self.__prepare_write(table, action)
+                self.__commit_write(table, old_item, new_item)
+            units = self.__write_units_for(table, old_item, new_item)
+            units_by_table[table.name] = units_by_table.get(table.name, 0) + units
+
+        # The request is counted as a single call on each table that it wrote to
+        for table_name, units in units_by_table.items():
+            self.__record(table_name, 'BatchWriteItem', write_units=units)
+        return self.__with_capacity_list({'UnprocessedItems' : {}}, units_by_table, return_consumed_capacity)
+
+    def transact_write_items(self, transact_items, return_consumed_capacity='NONE'):
+        """
+        Writes every action in the transaction, or none of them if any condition doesn't hold.
+        Each action is a dictionary with a single 'Put', 'Update', 'Delete' or 'ConditionCheck' request.
+        """
+        if len(transact_items) > MemoryBackend.MAX_TRANSACT_ITEMS:
+            raise DynamoExpressions.validation_error("Too many items in the TransactWriteItems call", 'TransactWriteItems')
+
+        with self._transaction():
+            prepared = []
+            reasons = []
+            key_ids = set()
+            for transact_item in transact_items:
+                action_name = list(transact_item.keys())[0]
+                table = self.__get_table(transact_item[action_name]['TableName'])
+                request = transact_item[action_name]
+
+                key_id = self.__key_id(table, request['Item'] if action_name == 'Put' else request['Key'],
+                    is_key=action_name != 'Put')
+                if (table.name, key_id) in key_ids:
+                    raise DynamoExpressions.validation_error(
+                        "Transaction request cannot include multiple operations on one item", 'TransactWriteItems')
+                key_ids.add((table.name, key_id))
+
+                try:
+                    prepared.append((table,) + self.__prepare_write(table, transact_item))
+                    reasons.append({'Code' : 'None'})
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                        raise
+                    reasons.append({'Code' : 'ConditionalCheckFailed', 'Message' : 'The conditional request failed'})
+
+            if len(prepared) < len(transact_items):
+                error = ClientError({
+                    'Error' : {
+                        'Code' : 'TransactionCanceledException',
+                        'Message' : 'Transaction cancelled, please refer cancellation reasons for specific reasons [' + \
+                            ", ".join(reason['Code'] for reason in reasons) + ']'
+                    },
+                    'CancellationReasons' : reasons
+                }, 'TransactWriteItems')
+                # A cancelled transaction still consumes capacity for the actions that were checked
+                cancelled_units = {}
+                for table, old_item, new_item, updated_names in prepared:
+                    cancelled_units[table.name] = cancelled_units.get(table.name, 0) + 2
+                for table_name, units in cancelled_units.items():
+                    self.__record(table_name, 'TransactWriteItems', write_units=units)
+                raise error
+
+            for table, old_item, new_item, updated_names in prepared:
+                self.__commit_write(table, old_item, new_item)
+
+        # Transactional writes consume twice the capacity of standard writes
+        units_by_table = {}
+        for table, old_item, new_item, updated_names in prepared:
+            units = 2 * self.__write_units_for(table, old_item, new_item)
+            units_by_table[table.name] = units_by_table.get(table.name, 0) + units
+        for table_name, units in units_by_table.items():
+            self.__record(table_name, 'TransactWriteItems', write_units=units)
+        return self.__with_capacity_list({}, units_by_table, return_consumed_capacity)
+
+    def stats(self):
+        """
+        Returns a dictionary with the number of calls of each operation on each table,
+        and the read and write capacity units consumed on each table
+        """
+        with self.__stats_lock:
+            return {
+                'calls' : {table_name : dict(calls) for table_name, calls in self.__calls.items()},
+                'read_units' : dict(self.__read_units),
+                'write_units' : dict(self.__write_units)
+            }
+
+    def reset_stats(self):
+        with self.__stats_lock:
+            self.__calls.clear()
+            self.__read_units.clear()
+            self.__write_units.clear()
+
+    ###########################################################################
+    ###            Storage Primitives, overridden by SqliteBackend          ###
+    ###########################################################################
+
+    @contextmanager
+    def _transaction(self, write=True):
+        """
+        Holds the storage for the duration of a read-modify-write, so that it's atomic
+        """
+        with self.__lock:
+            yield
+
+    def _read(self, table_name, key_id):
+        item = self.__items.get(table_name, {}).get(key_id)
+        return None if item is None else DynamoExpressions.copy_value(item)
+
+    def _write(self, table_name, key_id, hash_id, item):
+        items = self.__items.setdefault(table_name, {})
+        if not key_id in items:
+            bisect.insort(self.__key_ids.setdefault(table_name, []), key_id)
+        items[key_id] = DynamoExpressions.copy_value(item)
+
+    def _remove(self, table_name, key_id):
+        items = self.__items.get(table_name, {})
+        if key_id in items:
+            del items[key_id]
+            key_ids = self.__key_ids[table_name]
+            del key_ids[bisect.bisect_left(key_ids, key_id)]
+
+    def _iterate(self, table_name, start_after=None):
+        """
+        Yields (key_id, item) pairs for the items in the table, in the order of their key IDs,
+        starting after the given key ID. Must be called within a transaction.
+        """
+        key_ids = self.__key_ids.get(table_name, [])
+        items = self.__items.get(table_name, {})
+        position = 0 if start_after is None else bisect.bisect_right(key_ids, start_after)
+        while position < len(key_ids):
+            key_id = key_ids[position]
+            yield (key_id, DynamoExpressions.copy_value(items[key_id]))
+            position = position + 1
+
+    def _iterate_partition(self, table_name, hash_id):
+        """
+        Returns a list of the items in the table with the given partition key
+        """
+        key_ids = self.__key_ids.get(table_name, [])
+        items = self.__items.get(table_name, {})
+        # Key IDs begin with the hash ID, so the partition is a contiguous range of them
+        prefix = hash_id[:-1] + ","
+        position = bisect.bisect_left(key_ids, hash_id[:-1])
+        partition = []
+        while position < len(key_ids) and (key_ids[position] == hash_id or key_ids[position].startswith(prefix)):
+            partition.append(DynamoExpressions.copy_value(items[key_ids[position]]))
+            position = position + 1
+        return partition
+
+    def _count(self, table_name):
+        return len(self.__items.get(table_name, {}))
+
+    ###########################################################################
+    ###                    Private Helper Functions                         ###
+    ###########################################################################
+
+    def __get_table(self, table_name):
+        table = self.__tables.get(table_name)
+        if table is None:
+            raise ClientError({'Error' : {'Code' : 'ResourceNotFoundException',
+                'Message' : 'Requested resource not found: Table: ' + table_name + ' not found'}}, 'DescribeTable')
+        return table
+
+    def __index_schema(self, table, index_name):
+        """
+        Returns the (hash_key, range_key, projected_attributes) of the table, or of one of its indexes.
+        projected_attributes is None if every attribute is available.
+        """
+        if index_name is None:
+            return (table.hash_key, table.range_key, None)
+        if not index_name in table.indexes:
+            raise DynamoExpressions.validation_error("The table does not have the specified index: " + index_name, 'Query')
+
+        index = table.indexes[index_name]
+        projection = index.get('projection')
+        if projection is not None:
+            projection = table.key_names() + [index['hash_key']] + \
+                ([] if index.get('range_key') is None else [index['range_key']]) + projection
+        return (index['hash_key'], index.get('range_key'), projection)
+
+    def __key_id(self, table, item, is_key=False):
+        """
+        Returns the string that identifies the item within the table
+        is_key: If True, the item must contain only the key attributes
+        """
+        key_names = table.key_names()
+        if any(not name in item for name in key_names) or (is_key and len(item) != len(key_names)):
+            raise DynamoExpressions.validation_error("The provided key element does not match the schema")
+        return json.dumps([encode_value(DynamoExpressions.normalize(item[name])) for name in key_names], sort_keys=True)
+
+    def __hash_id(self, table, item):
+        """
+        Returns the string that identifies the partition of the item. The key ID of the item begins with it.
+        """
+        return json.dumps([encode_value(DynamoExpressions.normalize(item[table.hash_key]))], sort_keys=True)
+
+    @staticmethod
+    def __key_schema(hash_key, range_key):
+        key_schema = [{'AttributeName' : hash_key, 'KeyType' : 'HASH'}]
+        if range_key is not None:
+            key_schema.append({'AttributeName' : range_key, 'KeyType' : 'RANGE'})
+        return key_schema
+
+    def __write_single(self, table, operation, action, return_values, return_consumed_capacity):
+        """
+        Helper function for put_item, update_item and delete_item
+        """
+        with self._transaction():
+            old_item, new_item, updated_names = self.__prepare_write(table, action)
+            self.__commit_write(table, old_item, new_item)
+
+        units = self.__write_units_for(table, old_item, new_item)
+        self.__record(table.name, operation, write_units=units)
+
+        response = {}
+        attributes = None
+        if return_values == 'ALL_OLD':
+            attributes = old_item
+        elif return_values == 'ALL_NEW':
+            attributes = new_item
+        elif return_values == 'UPDATED_OLD' and old_item is not None:
+            attributes = {name : old_item[name] for name in updated_names if name in old_item}
+        elif return_values == 'UPDATED_NEW' and new_item is not None:
+            attributes = {name : new_item[name] for name in updated_names if name in new_item}
+        if attributes is not None and len(attributes) > 0:
+            response['Attributes'] = attributes
+        return self.__with_capacity(response, table.name, units, return_consumed_capacity)
+
+    def __prepare_write(self, table, action):
+        """
+        Works out the result of a single write action, without storing it. Must be called within a transaction.
+        action: A dictionary with a single 'Put', 'Update', 'Delete' or 'ConditionCheck' request
+
+        Returns (old_item, new_item, updated_names). new_item is None if the item is deleted.
+        Raises a ClientError with the code ConditionalCheckFailedException if the condition doesn't hold.
+        """
+        action_name = list(action.keys())[0]
+        request = action[action_name]
+        names = request.get('ExpressionAttributeNames') or {}
+        values = request.get('ExpressionAttributeValues') or {}
+
+        if action_name == 'Put':
+            key_item = request['Item']
+        else:
+            key_item = request['Key']
+        key_id = self.__key_id(table, key_item, is_key=action_name != 'Put')
+        old_item = self._read(table.name, key_id)
+
+        condition = request.get('ConditionExpression')
+        if not DynamoExpressions.evaluate_condition(condition, {} if old_item is None else old_item, names, values):
+            raise ClientError({'Error' : {'Code' : 'ConditionalCheckFailedException',
+                'Message' : 'The conditional request failed'}}, action_name)
+
+        if action_name == 'Put':
+            new_item = DynamoExpressions.normalize(request['Item'])
+            updated_names = list(new_item.keys())
+        elif action_name == 'Update':
+            if old_item is None:
+                new_item = DynamoExpressions.normalize(request['Key'])
+            else:
+                new_item = DynamoExpressions.copy_value(old_item)
+            updated_names = DynamoExpressions.apply_update(request['UpdateExpression'], new_item, names, values)
+            for name in table.key_names():
+                if name in updated_names:
+                    raise DynamoExpressions.validation_error("Cannot update attribute " + name + \
+                        ". This attribute is part of the key", 'UpdateItem')
+        elif action_name == 'Delete':
+            new_item = None
+            updated_names = []
+        else:
+            new_item = old_item # ConditionCheck
+            updated_names = []
+        return (old_item, new_item, updated_names)
+
+    def __commit_write(self, table, old_item, new_item):
+        """
+        Stores the result of __prepare_write. Must be called within the same transaction.
+        """
+        if new_item is not None:
+            self._write(table.name, self.__key_id(table, new_item), self.__hash_id(table, new_item), new_item)
+        elif old_item is not None:
+            self._remove(table.name, self.__key_id(table, old_item))
+
+    def __read_page(self, items, filter_expr, projection_expr, names, values, limit, select, consistent_read,
+        to_result, last_key):
+        """
+        Helper function for query and scan. Reads a single page of items, stopping after Limit items
+        have been evaluated or 1 MB has been read.
+
+        items: An iterator of the candidate items, in order
+        to_result: Converts an item into the form stored in the table or index being read
+        last_key: Returns the LastEvaluatedKey for an item
+
+        Returns the response and the number of read units consumed
+        """
+        projection_paths = None
+        if projection_expr is not None:
+            projection_paths = DynamoExpressions.parse_projection(projection_expr, names)
+
+        results = []
+        evaluated = 0
+        bytes_read = 0
+        last_item = None
+        for item in items:
+            if (limit is not None and evaluated >= limit) or bytes_read >= MemoryBackend.MAX_PAGE_BYTES:
+                break
+            item = to_result(item)
+            evaluated = evaluated + 1
+            bytes_read = bytes_read + DynamoExpressions.item_size(item)
+            last_item = item
+
+            if filter_expr is None or DynamoExpressions.evaluate_condition(filter_expr, item, names, values):
+                if projection_paths is not None:
+                    item = DynamoExpressions.project(item, projection_paths)
+                results.append(item)
+        else:
+            last_item = None # Every candidate was read, so there are no more pages
+
+        response = {'Count' : len(results), 'ScannedCount' : evaluated}
+        if select != 'COUNT':
+            response['Items'] = results
+        if last_item is not None:
+            response['LastEvaluatedKey'] = last_key(last_item)
+        return (response, self.__read_units_for(bytes_read, consistent_read))
+
+    def __read_units_for(self, num_bytes, consistent_read):
+        """
+        Returns the read capacity units consumed by reading the given number of bytes.
+        Eventually consistent reads consume half as much.
+        """
+        units = max(1, int(math.ceil(num_bytes / float(MemoryBackend.READ_UNIT_BYTES))))
+        return units if consistent_read else units / 2.0
+
+    def __write_units_for(self, table, old_item, new_item):
+        """
+        Returns the write capacity units consumed by replacing old_item with new_item.
+        The size of the larger of the two is used, and every index holding either item is written as well.
+        """
+        num_bytes = max(DynamoExpressions.item_size(item) for item in [old_item or {}, new_item or {}])
+        units = max(1, int(math.ceil(num_bytes / float(MemoryBackend.WRITE_UNIT_BYTES))))
+        total_units = units
+        for index in table.indexes.values():
+            if any(item is not None and index['hash_key'] in item for item in [old_item, new_item]):
+                total_units = total_units + units
+        return total_units
+
+    def __record(self, table_name, operation, read_units=0, write_units=0):
+        """
+        Counts a call, and the capacity units it consumed
+        """
+        with self.__stats_lock:
+            calls = self.__calls.setdefault(table_name, {})
+            calls[operation] = calls.get(operation, 0) + 1
+            if read_units > 0:
+                self.__read_units[table_name] = self.__read_units.get(table_name, 0) + read_units
+            if write_units > 0:
+                self.__write_units[table_name] = self.__write_units.get(table_name, 0) + write_units
+
+    @staticmethod
+    def __with_capacity(response, table_name, units, return_consumed_capacity):
+        if return_consumed_capacity in ['TOTAL', 'INDEXES']:
+            response['ConsumedCapacity'] = {'TableName' : table_name, 'CapacityUnits' : units}
+        return response
+
+
+    @staticmethod
+    def __with_capacity_list(response, units_by_table, return_consumed_capacity):
+        """
+        Adds the ConsumedCapacity of a request that spans tables, which is a list with an entry per table
+        """
+        if return_consumed_capacity in ['TOTAL', 'INDEXES']:
+            response['ConsumedCapacity'] = [{'TableName' : table_name, 'CapacityUnits' : units}
+                for table_name, units in units_by_table.items()]
+        return response
+
+
+class SqliteBackend(MemoryBackend):
+    """
+    A stand-in storage backend that keeps the tables in an SQLite file.
+    Several processes can share the file, like the bot and its listener processes share the DynamoDB tables.
+    Call counts and consumed capacity are tracked per process.
+    """
+
+    BUSY_TIMEOUT = 30 # How long, in seconds, to wait for another process to release the file
+
+    def __init__(self, path, read_capacity=0, write_capacity=0, seed_path=None):
+        """
+        path: The SQLite file to store the tables in. It's created if it doesn't exist.
+        """
+        self.path = path
+        self.__local = threading.local() # Each thread uses its own connection
+        connection = self.__connection()
+        connection.execute("CREATE TABLE IF NOT EXISTS items (table_name TEXT NOT NULL, item_key TEXT NOT NULL, " + \
+            "hash_key TEXT NOT NULL, body TEXT NOT NULL, PRIMARY KEY (table_name, item_key))")
+        connection.execute("CREATE INDEX IF NOT EXISTS items_by_hash_key ON items (table_name, hash_key)")
+        super().__init__(read_capacity, write_capacity, seed_path)
+
+    def __connection(self):
+        if not hasattr(self.__local, 'connection'):
+            # Transactions are started explicitly, so autocommit mode is used
+            self.__local.connection = sqlite3.connect(self.path, timeout=SqliteBackend.BUSY_TIMEOUT, isolation_level=None)
+            self.__local.depth = 0
+        return self.__local.connection
+
+    @contextmanager
+    def _transaction(self, write=True):
+        connection = self.__connection()
+        if self.__local.depth == 0:
+            # Writes take the lock immediately, so that a read-modify-write can't be interleaved with another process
+            connection.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        self.__local.depth = self.__local.depth + 1
+        try:
+            yield
+        except:
+            self.__local.depth = self.__local.depth - 1
+            if self.__local.depth == 0:
+                connection.execute("ROLLBACK")
+            raise
+        self.__local.depth = self.__local.depth - 1
+        if self.__local.depth == 0:
+            connection.execute("COMMIT")
+
+    def _read(self, table_name, key_id):
+        row = self.__connection().execute("SELECT body FROM items WHERE table_name = ? AND item_key = ?",
+            (table_name, key_id)).fetchone()
+        return None if row is None else decode_item(row[0])
+
+    def _write(self, table_name, key_id, hash_id, item):
+        self.__connection().execute("INSERT OR REPLACE INTO items (table_name, item_key, hash_key, body) VALUES (?, ?, ?, ?)",
+            (table_name, key_id, hash_id, encode_item(item)))
+
+    def _remove(self, table_name, key_id):
+        self.__connection().execute("DELETE FROM items WHERE table_name = ? AND item_key = ?", (table_name, key_id))
+
+    def _iterate(self, table_name, start_after=None):
+        # Rows are read in small chunks, so that a page doesn't load the whole table
+        last_key_id = "" if start_after is None else start_after
+        while True:
+            rows = self.__connection().execute("SELECT item_key, body FROM items WHERE table_name = ? AND item_key > ? " + \
+                "ORDER BY item_key LIMIT 256", (table_name, last_key_id)).fetchall()
+            for key_id, body in rows:
+                yield (key_id, decode_item(body))
+            if len(rows) < 256:
+                return
+            last_key_id = rows[-1][0]
+
+    def _iterate_partition(self, table_name, hash_id):
+        rows = self.__connection().execute("SELECT body FROM items WHERE table_name = ? AND hash_key = ? ORDER BY item_key",
+            (table_name, hash_id)).fetchall()
+        return [decode_item(row[0]) for row in rows]
+
+    def _count(self, table_name):
+        return self.__connection().execute("SELECT COUNT(*) FROM items WHERE table_name = ?", (table_name,)).fetchone()[0]
+
+
+###########################################################################
+###                          Serialization                              ###
+###########################################################################
+
+def encode_value(value):
+    """
+    Converts a value into DynamoDB JSON, with binary values encoded as base64
+    """
+    value_type = DynamoExpressions.value_type(value)
+    if value_type == 'NULL':
+        return {'NULL' : True}
+    if value_type in ['BOOL', 'S']:
+        return {value_type : value}
+    if value_type == 'N':
+        return {'N' : str(value)}
+    if value_type == 'B':
+        return {'B' : base64.b64encode(value).decode('ascii')}
+    if value_type == 'M':
+        return {'M' : {name : encode_value(member) for name, member in value.items()}}
+    if value_type == 'L':
+        return {'L' : [encode_value(member) for member in value]}
+    return {value_type : sorted(encode_value(member)[value_type[0]] for member in value)} # Sets
+
+def decode_value(encoded):
+    """
+    Converts a value from the DynamoDB JSON produced by encode_value
+    """
+    value_type, value = list(encoded.items())[0]
+    if value_type == 'NULL':
+        return None
+    if value_type in ['BOOL', 'S']:
+        return value
+    if value_type == 'N':
+        return decimal.Decimal(value)
+    if value_type == 'B':
+        return base64.b64decode(value)
+    if value_type == 'M':
+        return {name : decode_value(member) for name, member in value.items()}
+    if value_type == 'L':
+        return [decode_value(member) for member in value]
+    return set(decode_value({value_type[0] : member}) for member in value) # Sets
+
+def encode_item(item):
+    return json.dumps({name : encode_value(value) for name, value in item.items()}, sort_keys=True)
+
+def decode_item(text):
+    return {name : decode_value(value) for name, value in json.loads(text).items()}
@@ -0,0 +1,141 @@
+"""
+This module contains the retry and rate limiting logic shared by every database call
+"""
+from botocore.exceptions import ClientError, BotoCoreError
+import random
+import threading
+import time
+
+# The error codes of failures that are expected to succeed if the call is made again later
+RETRYABLE_ERROR_CODES = [
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'LimitExceededException',
+    'TransactionConflictException',
+    'TransactionInProgressException',
+    'InternalServerError',
+    'ServiceUnavailable'
+]
+
+# The error codes of throttling failures, which also slow down the token bucket of the table
+THROTTLING_ERROR_CODES = [
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded'
+]
+
+# The cancellation reasons of a cancelled transaction that are worth retrying.
+# Any other reason, such as a failed condition, is permanent.
+RETRYABLE_CANCELLATION_REASONS = ['ThrottlingError', 'ProvisionedThroughputExceeded', 'TransactionConflict']
+
+
+def error_code(error):
+    """
+    Returns the DynamoDB error code of an exception, or None if it isn't a ClientError
+    """
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code')
+    return None
+
+def is_retryable(error):
+    """
+    Returns whether the call that raised the error should be retried
+    """
+    code = error_code(error)
+    if code in RETRYABLE_ERROR_CODES:
+        return True
+    if code == 'TransactionCanceledException':
+        reasons = [reason.get('Code') for reason in error.response.get('CancellationReasons', [])]
+        return any(reason in RETRYABLE_CANCELLATION_REASONS for reason in reasons) and \
+            all(reason in RETRYABLE_CANCELLATION_REASONS + ['None', None] for reason in reasons)
+
+    # Connection failures and timeouts raised by botocore itself
+    return code is None and isinstance(error, BotoCoreError)
+
+def is_throttling(error):
+    """
+    Returns whether the error means that the table's capacity was exceeded
+    """
+    code = error_code(error)
+    if code == 'TransactionCanceledException':
+        reasons = [reason.get('Code') for reason in error.response.get('CancellationReasons', [])]
+        return 'ThrottlingError' in reasons or 'ProvisionedThroughputExceeded' in reasons
+    return code in THROTTLING_ERROR_CODES
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """
+    Returns how long to wait before the given retry attempt (1 for the first retry), using
+    exponential backoff with full jitter, so that clients that failed together don't retry together
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+
+
+class TokenBucket:
+    """
+    A client-side rate limiter for the capacity units consumed on a table.
+
+    Tokens refill at the provisioned rate, up to a limit of a few seconds of burst. A call waits until
+    the bucket isn't in debt, takes its estimated units up front, and settles the difference once the
+    actual consumed capacity is known. The rate backs off when the table throttles us, and recovers
+    gradually as calls succeed.
+    """
+
+    BURST_SECONDS = 5 # The number of seconds of capacity that can be used in a burst
+    THROTTLE_BACKOFF = 0.5 # The factor the rate is multiplied by when a call is throttled
+    MIN_RATE_FRACTION = 0.1 # The lowest fraction of the provisioned rate that backoff goes down to
+    RECOVERY_FRACTION = 0.02 # The fraction of the provisioned rate recovered after each successful call
+
+    def __init__(self, provisioned_rate):
+        """
+        provisioned_rate: The provisioned capacity units per second. 0 means the table is on-demand,
+                          and calls are never delayed.
+        """
+        self.__lock = threading.Lock()
+        self.set_provisioned_rate(provisioned_rate)
+
+    def set_provisioned_rate(self, provisioned_rate):
+        with self.__lock:
+            self.provisioned_rate = float(provisioned_rate)
+            self.rate = self.provisioned_rate
+            self.tokens = self.rate * TokenBucket.BURST_SECONDS
+            self.last_refill = time.time()
+
+    def acquire(self, units, wait=True):
+        """
+        Waits until the bucket has capacity, and takes the given number of units from it.
+        If wait is False, the units are taken right away, even if that puts the bucket further into debt.
+        """
+        while True:
+            with self.__lock:
+                if self.rate <= 0:
+                    return
+                self.__refill()
+                if self.tokens >= 0 or not wait:
+                    # The bucket may go into debt, since the size of a call isn't known until it's made
+                    self.tokens = self.tokens - units
+                    return
+                wait_time = -self.tokens / self.rate
+            time.sleep(wait_time)
+
+    def settle(self, estimated_units, actual_units):
+        """
+        Corrects the units taken by acquire() once the actual consumed capacity is known
+        """
+        with self.__lock:
+            self.tokens = self.tokens + estimated_units - actual_units
+
+    def on_success(self):
+        with self.__lock:
+            if self.rate < self.provisioned_rate:
+                self.rate = min(self.provisioned_rate, self.rate + self.provisioned_rate * TokenBucket.RECOVERY_FRACTION)
+
+    def on_throttled(self):
+        with self.__lock:
+            self.rate = max(self.provisioned_rate * TokenBucket.MIN_RATE_FRACTION, self.rate * TokenBucket.THROTTLE_BACKOFF)
+            self.tokens = min(self.tokens, 0) # Stop any burst that's in progress
+
+    def __refill(self):
+        cur_time = time.time()
+        self.tokens = min(self.rate * TokenBucket.BURST_SECONDS, self.tokens + (cur_time - self.last_refill) * self.rate)
+        self.last_refill = cur_time
@@ -3,6 +3,7 @@ from getpass import getpass
 from InsiderMemeBot import InsiderMemeBot
 import json
 import os
+import signal
 import sys
 
 ###########################
@@ -18,6 +19,9 @@ reddit = praw.Reddit(client_id = os.environ['IMT_CLIENT_ID'],
 
 TEST_MODE = os.environ['IMT_TEST_MODE'] != "false"
 
+# Exit normally when stopped, so that the bot's shutdown handlers run
+signal.signal(signal.SIGTERM, lambda signal_number, frame: sys.exit(0))
+
 # Create a new instance of InsiderMemeBot.
 bot = InsiderMemeBot(reddit, TEST_MODE)
 bot.run() # Run the bot
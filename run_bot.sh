@@ -1,4 +1,5 @@
 # Run the separate processes in the background
+# Set IMT_TRACKER_SHARDS to split the tracking across several Tracker processes
 python3 Processes/Tracker/run_tracker.py &
 python3 Features/TemplateRequestFeature/Processes/InboxListener/run_inbox_listener.py &
 python3 Features/TemplateRequestFeature/Processes/TemplateRequestListener/run_request_listener.py &